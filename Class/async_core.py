@@ -0,0 +1,360 @@
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from colorama import Fore
+from pubsub import pub
+
+from Class.multi_radio import owns_interface
+from Class.traceroute import node_key
+
+PACKET_QUEUE = 256  # Packets a slow packets() reader may fall behind by before its oldest are dropped
+BLOCKING_WORKERS = 4  # Threads for the calls that still block: file transfers, daemon commands, the outbox
+NODE_POLL = 1.0  # Seconds between NodeDB checks for apps without node events (a mesh daemon client)
+
+
+class AckSignal:
+    """What MeshtasticChatApp.send_acked sets when the ACK comes, in place of a threading.Event.
+
+    set() runs on the radio's reader thread; it resolves future on the event
+    loop's thread, so a pending send costs one future instead of one thread.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def set(self):
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AsyncMeshCore:
+    """An asyncio front end to a MeshtasticChatApp (or a RemoteChatApp attached to a mesh daemon).
+
+    meshtastic's pubsub callbacks are bridged into the event loop: sends
+    await their ACK as a future, traces await the TraceRouteTracker's
+    Future, wait_for_node awaits the NodeDB update, and packets() iterates
+    over what the radio receives. Every coroutine can be cancelled or
+    wrapped in asyncio.wait_for. Chunked file transfers and daemon commands
+    still block, so they run in a small thread pool (run_blocking) and are
+    awaited from there.
+
+    Use it on a running loop with `async with AsyncMeshCore(app) as core`,
+    or from threaded code (Tk) with start(), which runs a loop of its own in
+    a background thread, and submit(coroutine).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.native = False  # True when app drives a radio here (sends go out from the loop's thread)
+        self.loop = None
+        self.pending = 0  # ACKs being awaited
+        self.dropped = 0  # Packets dropped because a packets() reader fell PACKET_QUEUE behind
+        self._thread = None
+        self._executor = ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix="mesh-core")
+        self._streams = []  # (queue, port name, sender id) of the open packets() iterators
+        self._node_waiters = {}  # node key -> futures of wait_for_node calls
+        self._console = None
+        if app is not None:
+            self.attach(app)
+
+    def attach(self, app):
+        """Serve app from now on, e.g. once the GUI has connected to the radio."""
+        self.app = app
+        self.native = hasattr(app.interface, "sendData")
+        if self.native:
+            pub.subscribe(self._on_receive, "meshtastic.receive")
+            pub.subscribe(self._on_node_updated, "meshtastic.node.updated")
+        return self
+
+    def start(self):
+        """Run an event loop of our own in a background thread; for callers that aren't async (Tk)."""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mesh-core-loop", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, coroutine):
+        """Schedule coroutine on the core's loop from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.native:
+            pub.unsubscribe(self._on_receive, "meshtastic.receive")
+            pub.unsubscribe(self._on_node_updated, "meshtastic.node.updated")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Await function(*args, **kwargs) run in the core's thread pool."""
+        return await self.loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def send_text(self, text, destination_id=None, channel_index=0, timeout=None) -> bool:
+        """Send a chat message and wait for its ACK (or timeout, default the app's); False if none came."""
+        app = self.app
+        if not self.native:
+            return await self.run_blocking(app.send_text_message, text, channel_index, destination_id)
+        destination_id = destination_id if destination_id else app.destination_id
+        payload, port = app.text_payload(text, destination_id)
+        return await self._send_acked(payload, port, channel_index, destination_id, timeout, "text")
+
+    async def send_data(self, data, destination_id=None, channel_index=0, timeout=None) -> bool:
+        """Send one PRIVATE_APP packet and wait for its ACK; False if none came."""
+        from meshtastic import portnums_pb2  # Not at the top: the GUI imports the core before connecting
+        app = self.app
+        if not self.native:
+            return await self.run_blocking(app.send_data, data, channel_index, destination_id)
+        destination_id = destination_id if destination_id else app.destination_id
+        return await self._send_acked(data, portnums_pb2.PortNum.PRIVATE_APP, channel_index, destination_id,
+                                      timeout, "data")
+
+    async def send_file(self, source, file_name=None, destination_id=None, channel_index=0, progress=None) -> bool:
+        """Send a file (a path, or bytes with file_name) in chunks; True once the receiver has it.
+
+        progress(sent, total) is called on the loop's thread. Cancelling stops
+        the transfer before its next chunk, as a CANCEL from the receiver would.
+        """
+        app = self.app
+        destination_id = destination_id if destination_id else app.destination_id
+        if isinstance(source, (str, os.PathLike)):
+            file_name = file_name or os.path.basename(source)
+        if progress is not None:
+            loop, on_progress = self.loop, progress
+            progress = lambda sent, total: loop.call_soon_threadsafe(on_progress, sent, total)
+        if not isinstance(source, (str, os.PathLike)):
+            call = functools.partial(app.send_data_in_chunks, source, file_name, progress, channel_index,
+                                     destination_id)
+        elif hasattr(app, "send_file"):
+            call = functools.partial(app.send_file, source, progress, channel_index, destination_id, file_name)
+        else:
+            with open(source, 'rb') as file:  # A daemon client sends the bytes over the socket anyway
+                call = functools.partial(app.send_data_in_chunks, file.read(), file_name, progress, channel_index,
+                                         destination_id)
+        transfer = self.loop.run_in_executor(self._executor, call)
+        try:
+            return await asyncio.shield(transfer)
+        except asyncio.CancelledError:
+            if hasattr(app, "cancelled_sends"):
+                app.cancelled_sends.add((str(destination_id).lower(), file_name))
+            raise
+
+    async def traceroute(self, dest, hop_limit=3, channel_index=0, max_age=None, timeout=None) -> dict:
+        """The route to dest (see Class/traceroute.py); raises TimeoutError if no reply came."""
+        app = self.app
+        if not self.native:
+            route = await asyncio.wait_for(
+                self.run_blocking(app.sendTraceRoute, dest, hop_limit, channel_index, max_age), timeout)
+            if route is None:
+                raise TimeoutError(f"No trace route response from {dest}")
+            return route
+        # Shielded: traces to the same node share one Future, which one caller's cancel mustn't cancel
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(
+            app.trace_route(dest, hop_limit, channel_index, max_age))), timeout)
+
+    async def wait_for_node(self, node_id, timeout=None) -> dict:
+        """The NodeDB entry of node_id ("!xxxxxxxx", a user id or a node number) once the radio knows it."""
+        key = node_key(node_id)
+        node = self._known_node(key)
+        if node is not None:
+            return node
+        future = self.loop.create_future()
+        self._node_waiters.setdefault(key, []).append(future)
+        try:
+            return await asyncio.wait_for(future if self.native else self._poll_node(key), timeout)
+        finally:
+            waiters = self._node_waiters.get(key, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._node_waiters.pop(key, None)
+
+    async def cancel_transfer(self, file_name, sender_id=None):
+        """Tell the sender of an inbound transfer to stop."""
+        await self.run_blocking(self.app.cancel_transfer, file_name, sender_id)
+
+    async def packets(self, port=None, sender=None):
+        """Iterate over the packets received from now on, only those on port (e.g. "TEXT_MESSAGE_APP")
+        and from sender if given. A reader that falls PACKET_QUEUE packets behind loses the oldest."""
+        stream = (asyncio.Queue(PACKET_QUEUE), port, node_key(sender) if sender else None)
+        self._streams.append(stream)
+        try:
+            while True:
+                yield await stream[0].get()
+        finally:
+            self._streams.remove(stream)
+
+    async def cli(self):
+        """The console chat of main.py: 'm' sends a message, 'f' a file (in the background), 'exit' quits."""
+        transfers = set()
+        try:
+            while True:
+                choice = await self._input(Fore.CYAN + "Enter 'm' to send a message, 'f' to send a file, or 'exit' to quit: ")
+                if choice is None or choice.lower() == 'exit':
+                    break
+                elif choice.lower() == 'm':
+                    text = await self._input(Fore.CYAN + "Enter the message to send: ")
+                    print(Fore.YELLOW + f"Sending message: {text}")  # Send message text in yellow
+                    await self.send_text(text or "")
+                elif choice.lower() == 'f':
+                    file_path = await self._input(Fore.CYAN + "Enter the file path to send: ")
+                    if not file_path or not os.path.isfile(file_path):
+                        print(Fore.RED + f"Failed to read file: {file_path} is not a file")
+                        continue
+                    print(Fore.YELLOW + f"Sending file: {os.path.basename(file_path)}")  # Send file name in yellow
+                    transfer = asyncio.ensure_future(self._send_file_reported(file_path))
+                    transfers.add(transfer)
+                    transfer.add_done_callback(transfers.discard)
+                else:
+                    print(Fore.MAGENTA + "Invalid choice. Please enter 'm', 'f', or 'exit'.")
+        finally:
+            for transfer in transfers:
+                transfer.cancel()
+
+    async def _send_file_reported(self, file_path):
+        name = os.path.basename(file_path)
+        try:
+            sent = await self.send_file(file_path)
+        except Exception as e:
+            print(Fore.RED + f"Failed to send file {name}: {e}")
+            return
+        print((Fore.GREEN + f"File {name} sent") if sent else (Fore.RED + f"File {name} was not delivered"))
+
+    async def _input(self, prompt):
+        """input() without blocking the loop: one daemon thread reads the console; None at end of input."""
+        if self._console is None:
+            self._console = asyncio.Queue()
+            loop, console = self.loop, self._console
+
+            def read_lines():
+                for line in sys.stdin:
+                    loop.call_soon_threadsafe(console.put_nowait, line.rstrip("\r\n"))
+                loop.call_soon_threadsafe(console.put_nowait, None)
+            threading.Thread(target=read_lines, name="console", daemon=True).start()
+        print(prompt, end="", flush=True)
+        return await self._console.get()
+
+    async def _send_acked(self, payload, port, channel_index, destination_id, timeout, kind):
+        app = self.app
+        ack = AckSignal(self.loop)
+        try:
+            packet, hop_limit = app.send_acked(payload, port, channel_index, destination_id, ack)
+        except Exception as e:
+            print(Fore.RED + f"Failed to send {kind}: {str(e)}")
+            return False
+        sent_at = time.perf_counter()
+        self.pending += 1
+        try:
+            await asyncio.wait_for(ack.future, timeout if timeout is not None else app.timeout)
+            acked = True
+        except asyncio.TimeoutError:
+            acked = False
+        except asyncio.CancelledError:
+            self._forget_response(packet.id)
+            raise
+        finally:
+            self.pending -= 1
+        app.record_ack(destination_id, acked, hop_limit, sent_at, kind)
+        if not acked:
+            self._forget_response(packet.id)  # A late ACK has nobody to tell
+        return acked
+
+    def _forget_response(self, packet_id):
+        for radio in getattr(self.app.interface, "interfaces", None) or [self.app.interface]:
+            getattr(radio, "responseHandlers", {}).pop(packet_id, None)
+
+    def _known_node(self, key):
+        nodes = (self.app.interface.nodesByNum or {}) if self.app else {}
+        if key.startswith("!"):
+            try:
+                node = nodes.get(int(key[1:], 16))
+            except ValueError:
+                node = None
+            if node is not None:
+                return node
+        for node in list(nodes.values()):
+            if str(node.get("user", {}).get("id", "")).lower() == key:
+                return node
+        return None
+
+    async def _poll_node(self, key):
+        while True:
+            await asyncio.sleep(NODE_POLL)
+            node = self._known_node(key)
+            if node is not None:
+                return node
+
+    # pubsub callbacks: on the radio's reader thread, handed over to the loop
+    def _on_receive(self, packet, interface):
+        if owns_interface(self.app.interface, interface):
+            self._call_soon(self._dispatch_packet, packet)
+
+    def _on_node_updated(self, node, interface):
+        if owns_interface(self.app.interface, interface):
+            self._call_soon(self._resolve_node, node.get("num"), node)
+
+    def _call_soon(self, callback, *args):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:  # The loop closed meanwhile
+            pass
+
+    def _dispatch_packet(self, packet):
+        sender = packet.get("from")
+        if sender is not None and self._node_waiters:
+            self._resolve_node(sender, self.app.interface.nodesByNum.get(sender) or {"num": sender})
+        port = packet.get("decoded", {}).get("portnum")
+        for queue, want_port, want_sender in self._streams:
+            if want_port and port != want_port:
+                continue
+            if want_sender and want_sender not in (node_key(sender) if sender is not None else None,
+                                                   str(packet.get("fromId", "")).lower()):
+                continue
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+                logging.debug("A packets() reader fell behind, dropped its oldest packet")
+            queue.put_nowait(packet)
+
+    def _resolve_node(self, num, node):
+        keys = [node_key(num)] if num is not None else []
+        user_id = node.get("user", {}).get("id")
+        if user_id:
+            keys.append(node_key(user_id))
+        for key in keys:
+            for future in self._node_waiters.pop(key, []):
+                if not future.done():
+                    future.set_result(node)
+
+
+def run_cli(app):
+    """Run the console chat for app on a fresh event loop until 'exit', end of input or Ctrl+C."""
+    async def session():
+        async with AsyncMeshCore(app) as core:
+            await core.cli()
+
+    try:
+        asyncio.run(session())
+    except KeyboardInterrupt:
+        print(Fore.MAGENTA + "\nExiting the program.")
+    finally:
+        app.close()  # Lets files still being saved finish
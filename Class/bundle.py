@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+BUNDLE_MAGIC = b'MTBN'
+BUNDLE_HEADER = struct.Struct("<4sBI")  # magic, flags, manifest length; the body follows
+FLAG_ZLIB = 0x01  # The body (manifest + contents) is zlib-compressed as a whole
+BUNDLE_SUFFIX = ".bundle"
+
+
+def safe_relative_path(path) -> str:
+    """A manifest path as a relative path that stays inside the bundle directory; raises ValueError otherwise."""
+    parts = [part for part in path.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or path.startswith(("/", "\\")) or ":" in parts[0] or ".." in parts:
+        raise ValueError(f"unsafe path in bundle: {path!r}")
+    return os.path.join(*parts)
+
+
+def collect_files(directory) -> list:
+    """(relative path, absolute path) of every regular file under directory, in a stable order."""
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                files.append((os.path.relpath(path, directory).replace(os.sep, "/"), path))
+    return files
+
+
+def pack_bundle(name, files) -> bytes:
+    """One transfer for many files: a JSON manifest followed by their contents back to back.
+
+    files is an iterable of (relative path, bytes). The body is compressed as a
+    whole, so small similar files share one dictionary, unless that doesn't pay.
+    """
+    manifest = {"name": name, "files": []}
+    contents = []
+    for path, data in files:
+        manifest["files"].append([path, len(data)])
+        contents.append(data)
+    manifest_bytes = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+    body = manifest_bytes + b''.join(contents)
+    compressed = zlib.compress(body, 9)
+    if len(compressed) < len(body):
+        return BUNDLE_HEADER.pack(BUNDLE_MAGIC, FLAG_ZLIB, len(manifest_bytes)) + compressed
+    return BUNDLE_HEADER.pack(BUNDLE_MAGIC, 0, len(manifest_bytes)) + body
+
+
+def pack_directory(directory):
+    """-> (bundle name, bundle bytes, file count) for every file under directory."""
+    name = os.path.basename(os.path.normpath(directory)) or "bundle"
+    files = []
+    for relative, path in collect_files(directory):
+        with open(path, 'rb') as file:
+            files.append((relative, file.read()))
+    return name, pack_bundle(name, files), len(files)
+
+
+def read_bundle(data):
+    """-> (manifest, [(safe relative path, bytes), ...]); raises ValueError on anything malformed."""
+    try:
+        magic, flags, manifest_length = BUNDLE_HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError("truncated bundle")
+    if magic != BUNDLE_MAGIC:
+        raise ValueError("not a bundle")
+    body = data[BUNDLE_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise ValueError(f"corrupt bundle: {e}")
+    manifest = json.loads(body[:manifest_length].decode("utf-8"))
+    files = []
+    offset = manifest_length
+    for path, size in manifest["files"]:
+        if offset + size > len(body):
+            raise ValueError(f"bundle is missing the contents of {path}")
+        files.append((safe_relative_path(path), body[offset:offset + size]))
+        offset += size
+    return manifest, files
+
+
+def unpack_bundle(data, destination_root) -> str:
+    """Unpack into destination_root/<bundle name>/ all at once; returns that directory.
+
+    Files are written to a hidden staging directory next to the target, which
+    then replaces the target, so the receiver never sees half a bundle.
+    """
+    manifest, files = read_bundle(data)
+    name = os.path.basename(str(manifest.get("name", "")))
+    if name in ("", ".", ".."):
+        name = "bundle"
+    os.makedirs(destination_root, exist_ok=True)
+    target = os.path.join(destination_root, name)
+    staging = tempfile.mkdtemp(prefix=f".{name}.", dir=destination_root)
+    previous = None
+    try:
+        os.chmod(staging, 0o755)  # mkdtemp makes it private, but it becomes an ordinary folder
+        for path, content in files:
+            file_path = os.path.join(staging, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as file:
+                file.write(content)
+        if os.path.exists(target):
+            # A directory can't be replaced while it has files in it, so move the old one aside first
+            previous = tempfile.mkdtemp(prefix=f".{name}.old.", dir=destination_root)
+            os.replace(target, os.path.join(previous, name))
+        os.replace(staging, target)
+    except BaseException:
+        if previous and not os.path.exists(target):
+            os.replace(os.path.join(previous, name), target)  # Put the old copy back
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+    return target
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from Class.outbox import normalize_node_id
+
+CAPS = "CAPS:"  # Control text: CAPS:[?]name,name... ("?" asks the peer for its own list back)
+CAPS_TTL = 24 * 3600  # Seconds a peer's list is trusted before it is asked again
+QUERY_INTERVAL = 300  # Seconds between asking the same silent peer again
+
+
+def format_caps(capabilities, query=False) -> str:
+    return CAPS + ("?" if query else "") + ",".join(sorted(capabilities))
+
+
+def parse_caps(argument):
+    """Split the text after CAPS: into (is_query, set of capability names)."""
+    query = argument.startswith("?")
+    names = argument[1:] if query else argument
+    return query, {name.strip() for name in names.split(",") if name.strip()}
+
+
+class PeerCapabilities:
+    """Which optional wire formats each peer understands, learnt by exchanging CAPS texts.
+
+    Nothing optional is sent to a peer until it has said it supports it; a
+    peer we know nothing about is asked once (query_due) and gets plain
+    packets meanwhile, so nodes without these features, or running other
+    clients, are never sent something they can't read.
+    """
+
+    def __init__(self, local=(), ttl=CAPS_TTL, query_interval=QUERY_INTERVAL, clock=time.monotonic):
+        self.local = set(local)  # What this app understands
+        self.ttl = ttl
+        self.query_interval = query_interval
+        self.clock = clock
+        self._peers = {}  # node id -> (capabilities, time learnt)
+        self._asked = {}  # node id -> time last asked
+        self._lock = threading.Lock()
+
+    def supports(self, node, capability) -> bool:
+        with self._lock:
+            known = self._peers.get(normalize_node_id(node))
+        return known is not None and capability in known[0] and self.clock() - known[1] <= self.ttl
+
+    def known(self, node):
+        """The capabilities node advertised, or None if it hasn't (or too long ago)."""
+        with self._lock:
+            known = self._peers.get(normalize_node_id(node))
+        if known is None or self.clock() - known[1] > self.ttl:
+            return None
+        return set(known[0])
+
+    def query_due(self, node) -> bool:
+        """True (once per query_interval) when node's capabilities are unknown and it should be asked."""
+        key = normalize_node_id(node)
+        now = self.clock()
+        with self._lock:
+            known = self._peers.get(key)
+            if known is not None and now - known[1] <= self.ttl:
+                return False
+            if now - self._asked.get(key, -self.query_interval) < self.query_interval:
+                return False
+            self._asked[key] = now
+            return True
+
+    def learn(self, node, capabilities):
+        with self._lock:
+            self._peers[normalize_node_id(node)] = (set(capabilities), self.clock())
@@ -0,0 +1,45 @@
+from Class.integrity import PAYLOAD_LIMIT
+
+MULTI_IDENTIFIER = b'MULTIMSG:'
+COALESCE = "multimsg1"  # Capability: reads MULTIMSG: batches
+COALESCE_WINDOW = 0.5  # Seconds the outbox holds a fresh text back to catch the rest of a burst
+
+
+def pack_messages(texts) -> bytes:
+    """Frame several chat messages as one payload: MULTIMSG: then <length>:<utf-8 text> for each.
+
+    Decimal lengths keep the payload readable to a client that doesn't
+    know the framing, the way FILEDATA headers are.
+    """
+    parts = [MULTI_IDENTIFIER]
+    for text in texts:
+        encoded = text.encode('utf-8')
+        parts.append(b'%d:' % len(encoded) + encoded)
+    return b''.join(parts)
+
+
+def unpack_messages(data) -> list:
+    """Split a MULTIMSG payload back into its messages; raises ValueError if it is malformed."""
+    if not data.startswith(MULTI_IDENTIFIER):
+        raise ValueError("not a MULTIMSG payload")
+    messages, position = [], len(MULTI_IDENTIFIER)
+    while position < len(data):
+        colon = data.index(b':', position)
+        length = int(data[position:colon])
+        start, end = colon + 1, colon + 1 + length
+        if length < 0 or end > len(data):
+            raise ValueError(f"message of {length} bytes runs past the end of the payload")
+        messages.append(data[start:end].decode('utf-8'))
+        position = end
+    return messages
+
+
+def fit_messages(texts, limit=PAYLOAD_LIMIT) -> int:
+    """How many of texts, from the first, fit in one packed payload of at most limit bytes."""
+    size = len(MULTI_IDENTIFIER)
+    for count, text in enumerate(texts):
+        length = len(text.encode('utf-8'))
+        size += len(b'%d:' % length) + length
+        if size > limit:
+            return count
+    return len(texts)
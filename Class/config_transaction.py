@@ -0,0 +1,146 @@
+import base64
+import logging
+
+from meshtastic import channel_pb2
+
+CHANNEL_ROLES = {name: channel_pb2.Channel.Role.Value(name) for name in ("DISABLED", "PRIMARY", "SECONDARY")}
+
+
+def channel_summary(channel) -> dict:
+    """The fields a transaction edits, in the shape get_channels reports them."""
+    return {
+        "Index": channel.index,
+        "Role": channel_pb2.Channel.Role.Name(channel.role),
+        "Name": channel.settings.name,
+        "PSK": base64.b64encode(channel.settings.psk).decode("utf-8"),
+    }
+
+
+def same_channel(a, b) -> bool:
+    return a.role == b.role and a.settings.name == b.settings.name and a.settings.psk == b.settings.psk
+
+
+class ChannelTransaction:
+    """Channel edits staged against a node's cached channels, then written together.
+
+    Edits go to copies of node.channels, so nothing is sent while staging.
+    apply() diffs the copies against the cache, writes only the channels that
+    changed between a begin- and a commit-settings admin message (the radio
+    saves its settings once, at the commit, instead of after every write),
+    then reads the channels back from the radio and reports any that don't
+    match what was written.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.staged = {}  # index -> edited copy of the channel
+
+    def _channel(self, index) -> channel_pb2.Channel:
+        if index not in self.staged:
+            channels = self.node.channels or []
+            if not 0 <= index < len(channels):
+                raise ValueError(f"Invalid channel index: {index}")
+            channel = channel_pb2.Channel()
+            channel.CopyFrom(channels[index])
+            self.staged[index] = channel
+        return self.staged[index]
+
+    def set_psk(self, index, psk):
+        self._channel(index).settings.psk = psk
+        return self
+
+    def set_name(self, index, name):
+        self._channel(index).settings.name = name
+        return self
+
+    def set_role(self, index, role):
+        role = CHANNEL_ROLES[role] if isinstance(role, str) else role
+        channel = self._channel(index)
+        if (channel.role == CHANNEL_ROLES["PRIMARY"]) != (role == CHANNEL_ROLES["PRIMARY"]):
+            raise ValueError("The primary channel can't be moved or disabled")
+        channel.role = role
+        return self
+
+    def add_channel(self, name, psk=None) -> int:
+        """Stage a new secondary channel in the first disabled slot; returns its index.
+
+        Without a psk it shares the primary's, like add_channel on the app.
+        """
+        channels = self.node.channels or []
+        for index in range(len(channels)):
+            if self._current(index).role == CHANNEL_ROLES["DISABLED"]:
+                channel = self._channel(index)
+                channel.role = CHANNEL_ROLES["SECONDARY"]
+                channel.settings.name = name
+                channel.settings.psk = psk if psk is not None else self._current(0).settings.psk
+                return index
+        raise ValueError("No available disabled channel to add a new one.")
+
+    def stage(self, edits):
+        """Stage a list of edits: {"index", "name", "psk", "role"}, each field optional but the index; an edit
+        without an index adds a channel."""
+        for edit in edits:
+            if edit.get("index") is None:
+                self.add_channel(edit["name"], edit.get("psk"))
+                continue
+            index = int(edit["index"])
+            if edit.get("role") is not None:
+                self.set_role(index, edit["role"])
+            if edit.get("name") is not None:
+                self.set_name(index, edit["name"])
+            if edit.get("psk") is not None:
+                self.set_psk(index, edit["psk"])
+        return self
+
+    def changes(self) -> list:
+        """The staged channels that differ from the cache, as {"index", "before", "after"} summaries."""
+        return [{"index": index, "before": channel_summary(self.node.channels[index]),
+                 "after": channel_summary(channel)}
+                for index, channel in sorted(self.staged.items()) if not same_channel(channel, self.node.channels[index])]
+
+    def apply(self, verify=True) -> dict:
+        """Write the changed channels in one settings transaction.
+
+        Returns {"changes", "written", "verified", "mismatches"}: verified is
+        None when verify is off, False when the read-back failed or differs.
+        If a write fails the cache is restored and nothing is committed.
+        """
+        changes = self.changes()
+        written = [change["index"] for change in changes]
+        result = {"changes": changes, "written": written, "verified": None, "mismatches": []}
+        if not written:
+            return result
+        node = self.node
+        # Found once, as deleteChannel does: renaming the admin channel mid-way would move it
+        admin_index = getattr(node.iface.localNode, "_getAdminChannelIndex", lambda: 0)()
+        originals = {index: channel_pb2.Channel() for index in written}
+        for index, original in originals.items():
+            original.CopyFrom(node.channels[index])
+        node.beginSettingsTransaction()
+        try:
+            for index in written:
+                node.channels[index].CopyFrom(self.staged[index])
+                node.writeChannel(index, adminIndex=admin_index)
+        except Exception:
+            for index, original in originals.items():
+                node.channels[index].CopyFrom(original)
+            raise
+        node.commitSettingsTransaction()
+        logging.info(f"Committed channels {written} in one settings transaction")
+        if verify:
+            result["verified"], result["mismatches"] = self._read_back(written)
+        self.staged.clear()
+        return result
+
+    def _read_back(self, written):
+        node = self.node
+        node.requestChannels()
+        if not node.waitForConfig("channels") or not node.channels:
+            logging.warning("Channels weren't read back after the transaction")
+            return False, list(written)
+        mismatches = [index for index in written
+                      if index >= len(node.channels) or not same_channel(node.channels[index], self.staged[index])]
+        return not mismatches, mismatches
+
+    def _current(self, index):
+        return self.staged[index] if index in self.staged else self.node.channels[index]
@@ -0,0 +1,241 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+from Class.outbox import normalize_node_id
+
+CONTACTS_VERSION = 1
+CONTACT_FIELDS = ("id", "long_name", "short_name", "notes", "last_seen", "channel")
+COMPACT_SLACK = 256  # Superseded log lines tolerated beyond the live contacts before the log is rewritten
+LAST_SEEN_STEP = 600  # Seconds last_seen must move before a sighting is written to disk
+MAX_SUGGESTIONS = 20  # NodeDB nodes offered for a query that aren't contacts yet
+
+
+def new_contact(contact_id, **fields) -> dict:
+    contact = {"id": normalize_node_id(contact_id), "long_name": "", "short_name": "", "notes": "",
+               "last_seen": None, "channel": None}
+    contact.update({key: value for key, value in fields.items() if key in CONTACT_FIELDS and key != "id"})
+    return contact
+
+
+def contact_label(contact) -> str:
+    """How the friend picker shows a contact: its long name (if it has one) and id."""
+    name = contact.get("long_name") or contact.get("short_name")
+    return f"{name} ({contact['id']})" if name else contact["id"]
+
+
+def node_names(node) -> dict:
+    user = node.get("user", {})
+    return {"long_name": user.get("longName", ""), "short_name": user.get("shortName", "")}
+
+
+class ContactStore:
+    """The friends list: contacts by node id, kept in an append-only log.
+
+    Each change appends one JSON line ({"put": contact} or {"delete": id})
+    instead of rewriting the file, and loading replays the log; a line torn
+    by a crash mid-write is skipped. Once superseded lines outnumber the live
+    contacts by COMPACT_SLACK the log is rewritten, atomically, with one line
+    per contact. A friends.json of bare ids (the old list) is imported the
+    first time, and left in place.
+
+    search() filters by id, names and notes as the user types: every contact
+    keeps a lower-cased search key, and a query that extends the previous one
+    only rescans the previous matches.
+    """
+
+    def __init__(self, path="contacts.jsonl", legacy_path="friends.json"):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.contacts = {}  # id -> contact, in the order they were added
+        self._keys = {}  # id -> lower-cased "id long name short name notes"
+        self._log_lines = 0
+        self._last_query = None  # (query, ids that matched it)
+        self._lock = threading.Lock()
+
+    def __contains__(self, contact_id) -> bool:
+        return normalize_node_id(contact_id) in self.contacts
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    def get(self, contact_id):
+        return self.contacts.get(normalize_node_id(contact_id))
+
+    def load(self):
+        """Replay the log; without one, import the legacy friends.json."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            self._migrate()
+            return self
+        except OSError as e:
+            logging.warning(f"Ignoring contacts {self.path}: {e}")
+            return self
+        with self._lock:
+            for number, line in enumerate(lines):
+                try:
+                    record = json.loads(line)
+                    if number == 0:
+                        if record.get("version") != CONTACTS_VERSION:
+                            raise ValueError(f"unsupported version {record.get('version')}")
+                    elif "put" in record:
+                        self._index(new_contact(record["put"]["id"], **record["put"]))
+                    elif "delete" in record:
+                        self._unindex(record["delete"])
+                except ValueError as e:
+                    if number == 0:
+                        logging.warning(f"Ignoring contacts {self.path}: {e}")
+                        return self
+                    logging.warning(f"Skipping line {number + 1} of {self.path}: {e}")  # e.g. torn by a crash
+                except (KeyError, TypeError) as e:
+                    logging.warning(f"Skipping line {number + 1} of {self.path}: {e}")
+            self._log_lines = len(lines)
+        return self
+
+    def add(self, contact_id, **fields) -> dict:
+        """Add a contact, or update the given fields of an existing one; returns a copy."""
+        with self._lock:
+            contact = self.contacts.get(normalize_node_id(contact_id))
+            contact = {**contact, **fields} if contact else new_contact(contact_id, **fields)
+            self._index(contact)
+            self._append({"put": contact})
+            return dict(contact)
+
+    def remove(self, contact_id) -> bool:
+        contact_id = normalize_node_id(contact_id)
+        with self._lock:
+            if contact_id not in self.contacts:
+                return False
+            self._unindex(contact_id)
+            self._append({"delete": contact_id})
+            return True
+
+    def observe(self, node):
+        """A NodeDB entry the radio reported: refresh the names and last_seen of the contact, if it is one.
+
+        Names are written when they change, last_seen only every LAST_SEEN_STEP
+        seconds, so chatty nodes don't grow the log with every packet.
+        """
+        contact_id = node.get("user", {}).get("id") or normalize_node_id(node["num"])
+        with self._lock:
+            contact = self.contacts.get(normalize_node_id(contact_id))
+            if contact is None:
+                return None
+            names = {key: value for key, value in node_names(node).items() if value and value != contact[key]}
+            last_heard = node.get("lastHeard")
+            seen = last_heard and last_heard - (contact["last_seen"] or 0) >= LAST_SEEN_STEP
+            if not names and not seen:
+                return None
+            contact = {**contact, **names}
+            if last_heard and last_heard > (contact["last_seen"] or 0):
+                contact["last_seen"] = last_heard
+            self._index(contact)
+            self._append({"put": contact})
+            return dict(contact)
+
+    def search(self, query="", limit=None) -> list:
+        """Contacts matching query (a substring of id, names or notes), best first: those where it starts
+        a word, then the most recently seen. An empty query returns them all."""
+        query = query.strip().lower()
+        with self._lock:
+            previous = self._last_query
+            if previous and query.startswith(previous[0]):
+                candidates = previous[1]  # Typing on narrows the last result
+            else:
+                candidates = self.contacts.keys()
+            ids = [contact_id for contact_id in candidates
+                   if contact_id in self._keys and query in self._keys[contact_id]]
+            self._last_query = (query, ids)
+            ranked = [(self._rank(self._keys[contact_id], query, self.contacts[contact_id]["last_seen"]), contact_id)
+                      for contact_id in ids]
+            ranked = sorted(ranked) if limit is None else heapq.nsmallest(limit, ranked)
+            return [dict(self.contacts[contact_id]) for _, contact_id in ranked]
+
+    def suggest(self, query, nodes_by_num, limit=MAX_SUGGESTIONS) -> list:
+        """NodeDB entries matching query that aren't contacts yet, as new_contact dicts (for auto-complete)."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        suggestions = []
+        for node in list((nodes_by_num or {}).values()):
+            contact_id = node.get("user", {}).get("id") or normalize_node_id(node["num"])
+            if contact_id in self:
+                continue
+            contact = new_contact(contact_id, last_seen=node.get("lastHeard"), **node_names(node))
+            if query in self._search_key(contact):
+                suggestions.append(contact)
+        suggestions.sort(key=lambda c: self._rank(self._search_key(c), query, c["last_seen"]))
+        return suggestions[:limit]
+
+    def compact(self):
+        """Rewrite the log with one line per contact, atomically, so a crash mid-write keeps the old log."""
+        with self._lock:
+            self._compact()
+
+    def _index(self, contact):
+        self.contacts[contact["id"]] = contact
+        self._keys[contact["id"]] = self._search_key(contact)
+        self._last_query = None
+
+    def _unindex(self, contact_id):
+        self.contacts.pop(contact_id, None)
+        self._keys.pop(contact_id, None)
+        self._last_query = None
+
+    @staticmethod
+    def _search_key(contact) -> str:
+        return " ".join(str(contact.get(key) or "") for key in ("id", "long_name", "short_name", "notes")).lower()
+
+    @staticmethod
+    def _rank(key, query, last_seen):
+        """Sort key: query starting a word (or the hex of the id) first, then the most recently seen."""
+        key = " " + key
+        return f" {query}" not in key and f" !{query}" not in key, -(last_seen or 0)
+
+    def _append(self, record):
+        if self._log_lines == 0 or self._log_lines - len(self.contacts) > COMPACT_SLACK:
+            self._compact()
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self._log_lines += 1
+        except OSError as e:
+            logging.warning(f"Failed to save contacts {self.path}: {e}")
+
+    def _compact(self):
+        lines = [json.dumps({"version": CONTACTS_VERSION, "saved_at": time.time()})]
+        lines += [json.dumps({"put": contact}, separators=(",", ":")) for contact in self.contacts.values()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(lines)
+        except OSError as e:
+            logging.warning(f"Failed to save contacts {self.path}: {e}")
+
+    def _migrate(self):
+        try:
+            with open(self.legacy_path, "r") as file:
+                friends = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring {self.legacy_path}: {e}")
+            return
+        with self._lock:
+            for friend in friends if isinstance(friends, list) else []:
+                if isinstance(friend, (str, int)) and str(friend).strip():
+                    self._index(new_contact(friend))
+            self._compact()
+        logging.info(f"Imported {len(self.contacts)} friends from {self.legacy_path} into {self.path}")
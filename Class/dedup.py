@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+DEDUP_CAPACITY = 4096  # Packets remembered
+DEDUP_WINDOW = 600  # Seconds an exact copy (same sender, id and payload) counts as a duplicate
+PAYLOAD_WINDOW = 30  # Seconds a payload-only match counts, for retries that get a new packet id
+
+
+class PacketDeduplicator:
+    """Bounded, time-windowed memory of recently received packets.
+
+    A packet is a duplicate if the same sender sent the same packet id with
+    the same payload (a rebroadcast or firmware retry), or, when by_payload
+    is set, the same payload under any id within PAYLOAD_WINDOW (an app-level
+    retransmission). Oldest entries are evicted first once capacity is reached.
+    """
+
+    def __init__(self, capacity=DEDUP_CAPACITY, window=DEDUP_WINDOW, payload_window=PAYLOAD_WINDOW,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.window = window
+        self.payload_window = payload_window
+        self.clock = clock
+        self.duplicates = Counter()  # sender -> duplicates dropped, a rough link-quality signal
+        self.packets = Counter()  # sender -> packets checked
+        self._seen = OrderedDict()  # key -> time first seen
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, sender, packet_id, payload, by_payload=False) -> bool:
+        """Record the packet and return True if it was seen before."""
+        now = self.clock()
+        payload_hash = hash(payload)
+        keys = []
+        if packet_id:
+            keys.append(((sender, packet_id, payload_hash), self.window))
+        if by_payload:
+            keys.append(((sender, None, payload_hash), self.payload_window))
+        with self._lock:
+            self.packets[sender] += 1
+            self._expire(now)
+            duplicate = False
+            for key, window in keys:
+                first_seen = self._seen.get(key)
+                if first_seen is not None and now - first_seen <= window:
+                    duplicate = True
+                    self._seen.move_to_end(key)
+                else:
+                    self._seen[key] = now
+            while len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            if duplicate:
+                self.duplicates[sender] += 1
+            return duplicate
+
+    def forget_payloads(self, sender):
+        """Drop the payload-only keys of sender, e.g. when it starts a new transfer that may resend the same chunks."""
+        with self._lock:
+            for key in [key for key in self._seen if key[0] == sender and key[1] is None]:
+                del self._seen[key]
+
+    def _expire(self, now):
+        # Entries are in first-seen order apart from refreshed duplicates, so stop at the first live one
+        while self._seen:
+            key, first_seen = next(iter(self._seen.items()))
+            if now - first_seen <= self.window:
+                break
+            self._seen.popitem(last=False)
+
+    def duplicate_ratio(self, sender) -> float:
+        with self._lock:
+            total = self.packets[sender]
+            return self.duplicates[sender] / total if total else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked": len(self._seen),
+                "packets": sum(self.packets.values()),
+                "duplicates": sum(self.duplicates.values()),
+                "duplicates_by_sender": dict(self.duplicates),
+            }
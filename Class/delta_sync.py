@@ -0,0 +1,283 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import zlib
+
+from colorama import Fore
+
+from Class.file_source import payload_digest
+
+SIGNATURE_MAGIC = b'MTSG'
+SIGNATURE_HEADER = struct.Struct("<4sII")  # magic, block size, size of the base file
+SIGNATURE_BLOCK = struct.Struct("<II")  # rolling checksum, first 4 bytes of the block's SHA-256
+DELTA_MAGIC = b'MTDL'
+DELTA_HEADER = struct.Struct("<4sI")  # magic, block size; a zlib-compressed op stream follows
+OP_COPY = b'C'  # start block, block count
+OP_LITERAL = b'L'  # length, then the bytes
+MIN_BLOCK_SIZE = 32
+MAX_BLOCK_SIZE = 2048
+DELTA_MIN_SIZE = 1024  # Below this the signature round trip costs more airtime than it saves
+DELTA_NAK = "DELTANAK:"  # Text the receiver sends when a delta doesn't rebuild the file
+ROLLING_MOD = 1 << 16
+SENT_HISTORY = 16  # Recent delta sends kept in case the receiver asks for the whole file
+
+
+def choose_block_size(size):
+    """About sqrt(size) bytes per block, like rsync, so the signature grows slowly with the file."""
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, int(math.sqrt(size * 2))))
+
+
+def rolling_checksum(block):
+    """rsync's weak checksum: (a, b) sums that can be rolled one byte at a time."""
+    a = sum(block) % ROLLING_MOD
+    b = sum((len(block) - i) * x for i, x in enumerate(block)) % ROLLING_MOD
+    return a, b
+
+
+def strong_checksum(block):
+    return int.from_bytes(hashlib.sha256(block).digest()[:4], "little")
+
+
+def make_signature(base, block_size=None):
+    """Checksums of every block of base; an empty base gives a signature without blocks."""
+    block_size = block_size or choose_block_size(len(base))
+    parts = [SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, block_size, len(base))]
+    for start in range(0, len(base), block_size):
+        block = base[start:start + block_size]
+        a, b = rolling_checksum(block)
+        parts.append(SIGNATURE_BLOCK.pack(a | (b << 16), strong_checksum(block)))
+    return b''.join(parts)
+
+
+def parse_signature(signature):
+    """-> (block size, base size, [(weak, strong), ...])"""
+    magic, block_size, base_size = SIGNATURE_HEADER.unpack_from(signature)
+    if magic != SIGNATURE_MAGIC:
+        raise ValueError("not a delta signature")
+    blocks = [SIGNATURE_BLOCK.unpack_from(signature, offset)
+              for offset in range(SIGNATURE_HEADER.size, len(signature), SIGNATURE_BLOCK.size)]
+    return block_size, base_size, blocks
+
+
+def make_delta(signature, data):
+    """Describe data as copies of base blocks plus literal bytes."""
+    block_size, base_size, blocks = parse_signature(signature)
+    last_block = len(blocks) - 1
+    last_size = base_size - last_block * block_size if blocks else 0
+    by_weak = {}
+    for index, (weak, strong) in enumerate(blocks):
+        if index < last_block or last_size == block_size:
+            by_weak.setdefault(weak, []).append((index, strong))
+
+    ops = []
+    literal_start = 0
+
+    def emit_copy(index):
+        if literal_start < position:
+            ops.append((OP_LITERAL, data[literal_start:position]))
+        if ops and ops[-1][0] == OP_COPY and ops[-1][1] + ops[-1][2] == index:
+            ops[-1] = (OP_COPY, ops[-1][1], ops[-1][2] + 1)
+        else:
+            ops.append((OP_COPY, index, 1))
+
+    position = 0
+    a = b = None
+    while position + block_size <= len(data):
+        if a is None:
+            a, b = rolling_checksum(data[position:position + block_size])
+        match = None
+        candidates = by_weak.get(a | (b << 16))
+        if candidates:
+            strong = strong_checksum(data[position:position + block_size])
+            match = next((index for index, block_strong in candidates if block_strong == strong), None)
+        if match is not None:
+            emit_copy(match)
+            position += block_size
+            literal_start = position
+            a = None
+            continue
+        # Roll the window one byte forward
+        if position + block_size < len(data):
+            out_byte, in_byte = data[position], data[position + block_size]
+            a = (a - out_byte + in_byte) % ROLLING_MOD
+            b = (b - block_size * out_byte + a) % ROLLING_MOD
+        position += 1
+
+    # The base's short last block can only match the end of the new data
+    if blocks and last_size < block_size and len(data) - literal_start >= last_size > 0:
+        tail = data[len(data) - last_size:]
+        weak, strong = blocks[last_block]
+        a, b = rolling_checksum(tail)
+        if a | (b << 16) == weak and strong_checksum(tail) == strong:
+            position = len(data) - last_size
+            emit_copy(last_block)
+            literal_start = len(data)
+    if literal_start < len(data):
+        ops.append((OP_LITERAL, data[literal_start:]))
+
+    stream = []
+    for op in ops:
+        if op[0] == OP_COPY:
+            stream.append(OP_COPY + struct.pack("<II", op[1], op[2]))
+        else:
+            stream.append(OP_LITERAL + struct.pack("<I", len(op[1])) + op[1])
+    return DELTA_HEADER.pack(DELTA_MAGIC, block_size) + zlib.compress(b''.join(stream), 9)
+
+
+def apply_delta(base, delta):
+    """Rebuild the new file from the base and a delta made against the base's signature."""
+    magic, block_size = DELTA_HEADER.unpack_from(delta)
+    if magic != DELTA_MAGIC:
+        raise ValueError("not a delta")
+    stream = zlib.decompress(delta[DELTA_HEADER.size:])
+    output = []
+    offset = 0
+    while offset < len(stream):
+        op = stream[offset:offset + 1]
+        if op == OP_COPY:
+            start, count = struct.unpack_from("<II", stream, offset + 1)
+            output.append(base[start * block_size:(start + count) * block_size])
+            offset += 9
+        elif op == OP_LITERAL:
+            (length,) = struct.unpack_from("<I", stream, offset + 1)
+            output.append(stream[offset + 5:offset + 5 + length])
+            offset += 5 + length
+        else:
+            raise ValueError(f"bad delta op {op!r}")
+    return b''.join(output)
+
+
+class DeltaSync:
+    """rsync-style file updates on top of MeshtasticChatApp's chunked transfers.
+
+    The sender announces a "deltareq" (FILEINFO with no chunks) naming the
+    base file; the receiver answers with a "signature" transfer of its copy
+    of the base; the sender then sends a "delta" transfer of copy and literal
+    ops, and the receiver rebuilds the file and checks its SHA-256. Anything
+    that doesn't work out falls back to sending the whole file.
+    """
+
+    def __init__(self, app, chunk_size):
+        self.app = app
+        self.chunk_size = chunk_size  # The app's transfer chunk size, to size the signature wait
+        self._signatures = {}  # (peer, file name) -> {"event": Event, "signature": bytes}
+        self._sent = {}  # (peer, file name) -> (data, channel index), kept to answer a DELTANAK
+        self._lock = threading.Lock()
+
+    # Function to send a file as a delta against the receiver's copy of base_name
+    def send_file(self, data, file_name, base_name=None, progress_callback=None, channel_index=0,
+                  destination_id=None):
+        app = self.app
+        destination_id = destination_id if destination_id else app.destination_id
+        if len(data) < DELTA_MIN_SIZE:
+            return app.send_data_in_chunks(data, file_name, progress_callback, channel_index, destination_id)
+
+        base_name = base_name or file_name
+        sha256 = payload_digest(data)
+        key = (str(destination_id).lower(), file_name)
+        waiter = {"event": threading.Event(), "signature": None}
+        with self._lock:
+            self._signatures[key] = waiter
+            self._sent[key] = (data, channel_index)
+            while len(self._sent) > SENT_HISTORY:
+                self._sent.pop(next(iter(self._sent)))
+        try:
+            print(Fore.LIGHTBLACK_EX + f"Requesting the signature of {base_name} from {destination_id}...")
+            # A FILEINFO without chunks: the receiver answers with a signature transfer
+            request = {"kind": "deltareq"}
+            if base_name != file_name:
+                request["base"] = base_name
+            if not app.announce_file(file_name, len(data), 0, destination_id, extra=request):
+                return False
+            signature_size = SIGNATURE_HEADER.size + SIGNATURE_BLOCK.size * (len(data) // MIN_BLOCK_SIZE + 1)
+            waiter["event"].wait(timeout=app.timeout * (2 + min(signature_size // self.chunk_size, 20)))
+        finally:
+            with self._lock:
+                self._signatures.pop(key, None)
+
+        signature = waiter["signature"]
+        if signature and not parse_signature(signature)[2]:
+            # No blocks: the receiver has no copy of the base, and a literal-only delta would only be NAKed
+            print(Fore.LIGHTBLACK_EX + f"{destination_id} has no {base_name}, sending {file_name} whole")
+            return app.send_data_in_chunks(data, file_name, progress_callback, channel_index, destination_id)
+        # Pure-Python rolling checksums: in a worker process, so the GIL stays free for the radio and UI
+        delta = app.workers.run_cpu(make_delta, signature, bytes(data)) if signature else None
+        if delta is None or len(delta) >= len(data):
+            print(Fore.LIGHTBLACK_EX + f"No useful delta for {file_name}, sending it whole")
+            return app.send_data_in_chunks(data, file_name, progress_callback, channel_index, destination_id)
+        print(Fore.LIGHTBLACK_EX + f"Sending {file_name} as a {len(delta)} byte delta against {base_name} "
+                                   f"instead of {len(data)} bytes")
+        # The target is the transfer's name without ".delta"
+        extra = {"kind": "delta", "target_size": len(data), "sha256": sha256}
+        if base_name != file_name:
+            extra["base"] = base_name
+        return app.send_data_in_chunks(delta, f"{file_name}.delta", progress_callback, channel_index,
+                                       destination_id, announce_extra=extra)
+
+    def _base_path(self, name):
+        return os.path.join(self.app.received_dir, os.path.basename(name))
+
+    # Receiver: answer a deltareq with the signature of our copy of the base
+    def on_delta_request(self, file_info, sender_id):
+        def reply():
+            path = self._base_path(file_info.get("base") or file_info["name"])
+            try:
+                with open(path, 'rb') as file:
+                    base = file.read()
+            except OSError:
+                base = b''  # No base: a signature without blocks makes the sender send the whole file
+            signature = self.app.workers.run_cpu(make_signature, base)
+            self.app.send_data_in_chunks(signature, f"{file_info['name']}.sig", None, 0, sender_id,
+                                         announce_extra={"kind": "signature"})
+
+        threading.Thread(target=reply, daemon=True).start()
+
+    # Sender: a signature transfer completed
+    def on_signature(self, file_info, data, sender_id):
+        with self._lock:
+            waiter = self._signatures.get((str(sender_id).lower(), file_info["name"][:-len(".sig")]))
+        if waiter is None:
+            logging.info(f"Ignoring an unexpected signature {file_info['name']} from {sender_id}")
+            return
+        try:
+            parse_signature(data)
+            waiter["signature"] = data
+        except (ValueError, struct.error) as e:
+            logging.warning(f"Bad signature from {sender_id}: {e}")
+        waiter["event"].set()
+
+    # Receiver: a delta transfer completed, rebuild and verify the file
+    def on_delta(self, file_info, delta, sender_id):
+        target = file_info["name"][:-len(".delta")]
+        try:
+            with open(self._base_path(file_info.get("base") or target), 'rb') as file:
+                base = file.read()
+            data = apply_delta(base, delta)
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            data = None
+            logging.warning(f"Delta for {target} could not be applied: {e}")
+        if data is None or payload_digest(data) != file_info.get("sha256"):
+            message = f"Delta for {target} didn't verify, asking {sender_id} for the whole file"
+            print(Fore.MAGENTA + message)
+            if self.app.on_receive_callback:
+                self.app.on_receive_callback(message, message_type="WARNING")
+            self.app.send_control(f"{DELTA_NAK}{target}", sender_id)
+            return
+        self.app.save_file(os.path.basename(target), data)
+        message = f"File {target} rebuilt from a {len(delta)} byte delta ({len(data)} bytes, SHA-256 verified)"
+        print(Fore.GREEN + message)
+        if self.app.on_receive_callback:
+            self.app.on_receive_callback(message, message_type="SUCCESS")
+
+    # Sender: the receiver couldn't rebuild the file, resend it whole
+    def on_delta_nak(self, file_name, sender_id):
+        with self._lock:
+            sent = self._sent.pop((str(sender_id).lower(), file_name), None)
+        if sent is None:
+            return
+        data, channel_index = sent
+        threading.Thread(target=self.app.send_data_in_chunks, args=(data, file_name, None, channel_index, sender_id),
+                         daemon=True).start()
@@ -0,0 +1,77 @@
+import hashlib
+import mmap
+import os
+
+from Class.integrity import CRC_BYTES, crc_bytes
+
+HASH_BLOCK = 64 * 1024  # Bytes hashed per step, so hashing a mapped file doesn't fault it all in at once
+DIGEST_CHARS = 32  # Hex digits of SHA-256 carried in a FILEINFO, which has to fit one packet
+
+
+def payload_digest(data) -> str:
+    """Truncated SHA-256 of any buffer (bytes, mmap, memoryview), hashed a block at a time."""
+    view = memoryview(data)
+    sha256 = hashlib.sha256()
+    for start in range(0, len(view), HASH_BLOCK):
+        sha256.update(view[start:start + HASH_BLOCK])
+    return sha256.hexdigest()[:DIGEST_CHARS]
+
+
+class MappedFile:
+    """A file to send, memory-mapped read-only so chunks are sliced out of the page cache.
+
+    Nothing is read up front and memory use doesn't grow with the file size;
+    view is a memoryview over the whole file (empty for an empty file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self.size = os.fstat(self._file.fileno()).st_size
+            # mmap refuses empty files
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        self.view = memoryview(self._map) if self._map is not None else memoryview(b'')
+
+    def close(self):
+        self.view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChunkFramer:
+    """Builds the FILEDATA frames of one transfer in a single reusable buffer.
+
+    The payload is copied once, from the source view into the buffer, and the
+    frame handed to the radio is the one bytes object its protobuf needs.
+    With crc, each frame ends in a CRC-32 of the rest (see Class/integrity.py).
+    """
+
+    def __init__(self, identifier, file_name, chunk_size, crc=False):
+        self.prefix = identifier + file_name.encode('utf-8') + b':'
+        self.crc = crc
+        # Room for "<index>:<total>:" and the CRC
+        self.buffer = bytearray(len(self.prefix) + 24 + chunk_size + CRC_BYTES)
+        self.buffer[:len(self.prefix)] = self.prefix
+
+    def frame(self, index, total_chunks, payload) -> bytes:
+        counters = b'%d:%d:' % (index, total_chunks)
+        start = len(self.prefix) + len(counters)
+        end = start + len(payload)
+        self.buffer[len(self.prefix):start] = counters
+        self.buffer[start:end] = payload
+        with memoryview(self.buffer) as view:
+            if self.crc:
+                self.buffer[end:end + CRC_BYTES] = crc_bytes(view[:end])
+                end += CRC_BYTES
+            return bytes(view[:end])
@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+CHUNK_CRC = "crc32"  # Capability: CRC'd chunk frames, REQ: re-requests and a VERIFY: report at the end
+CRC_BYTES = 4  # Big-endian CRC-32 of the rest of the frame, appended to each chunk frame
+CHUNK_REQUEST = "REQ:"  # Control text: REQ:<file name>:<index>,<index>... chunks to send again
+VERDICT = "VERIFY:"  # Control text: VERIFY:<file name>:ok|failed, the receiver's SHA-256 check of the whole file
+VERDICT_QUERY = "?"  # VERIFY:<file name>:? asks the receiver for its verdict, or for the chunks it still lacks
+VERDICT_HISTORY = 64  # Outcomes of finished outbound transfers kept for the outbox to look up
+# Bytes of payload one packet can carry, mesh_pb2.Constants.DATA_PAYLOAD_LEN; spelled out so the outbox
+# and reassembly (which the GUI imports at startup) don't load the meshtastic package
+PAYLOAD_LIMIT = 237
+
+
+def crc_bytes(frame) -> bytes:
+    return zlib.crc32(frame).to_bytes(CRC_BYTES, 'big')
+
+
+def check_crc(frame):
+    """frame without its trailing CRC, or None if the CRC doesn't match (or the frame is too short to have one)."""
+    if len(frame) < CRC_BYTES:
+        return None
+    body = frame[:-CRC_BYTES]
+    return body if crc_bytes(body) == bytes(frame[-CRC_BYTES:]) else None
+
+
+def format_request(file_name, indexes) -> str:
+    return f"{CHUNK_REQUEST}{file_name}:{','.join(map(str, sorted(indexes)))}"
+
+
+def parse_request(argument):
+    """Split the text after REQ: into (file name, list of chunk indexes); raises ValueError."""
+    file_name, _, indexes = argument.rpartition(':')  # File names may contain ':' themselves
+    return file_name, [int(index) for index in indexes.split(',') if index]
+
+
+def format_verdict(file_name, verified) -> str:
+    """The receiver's verdict on file_name; verified None makes it the sender's query for one."""
+    return f"{VERDICT}{file_name}:{VERDICT_QUERY if verified is None else 'ok' if verified else 'failed'}"
+
+
+def parse_verdict(argument):
+    """Split the text after VERIFY: into (file name, True/False, or None for a query)."""
+    file_name, _, result = argument.rpartition(':')
+    return file_name, None if result == VERDICT_QUERY else result == 'ok'
+
+
+class IncrementalDigest:
+    """SHA-256 of an inbound transfer, fed as its chunks arrive.
+
+    Chunks are hashed as soon as every chunk before them is in, so by the
+    time the last one lands the digest is ready and checking the file doesn't
+    take a second pass over it. Chunks that arrive early wait in the session.
+    """
+
+    def __init__(self):
+        self.next_index = 0
+        self._sha256 = hashlib.sha256()
+
+    def advance(self, chunk_at, total_chunks):
+        """Hash the chunks from next_index on while chunk_at(index) has them."""
+        while self.next_index < total_chunks:
+            chunk = chunk_at(self.next_index)
+            if chunk is None:
+                return
+            self._sha256.update(chunk)
+            self.next_index += 1
+
+    def matches(self, digest) -> bool:
+        return self._sha256.hexdigest()[:len(digest)] == digest
+
+
+class TransferChecks:
+    """Sender side of CRC'd transfers: chunks the receiver asked for again, and its verdict on the whole file.
+
+    Keyed by (destination, file name), like cancelled_sends. Control texts
+    from the receiver land here from the receive thread; the sending thread
+    picks them up with take_requests and wait.
+    """
+
+    def __init__(self):
+        self._requests = {}  # key -> set of chunk indexes to resend
+        self._verdicts = {}  # key -> True/False once the receiver reported
+        self.results = OrderedDict()  # key -> verdict (None if none came) of recently finished transfers
+        self._changed = threading.Condition()
+
+    def open(self, key):
+        with self._changed:
+            self._requests[key] = set()
+            self._verdicts.pop(key, None)
+            self.results.pop(key, None)
+
+    def close(self, key):
+        with self._changed:
+            self._requests.pop(key, None)
+            self.results[key] = self._verdicts.pop(key, None)
+            while len(self.results) > VERDICT_HISTORY:
+                self.results.popitem(last=False)
+
+    def request(self, key, indexes) -> bool:
+        """Queue chunks to resend; False if no such transfer is in progress."""
+        with self._changed:
+            if key not in self._requests:
+                return False
+            self._requests[key].update(indexes)
+            self._changed.notify_all()
+            return True
+
+    def report(self, key, verified) -> bool:
+        with self._changed:
+            if key not in self._requests:
+                return False
+            self._verdicts[key] = verified
+            self._changed.notify_all()
+            return True
+
+    def take_requests(self, key) -> list:
+        with self._changed:
+            requested = self._requests.get(key)
+            if not requested:
+                return []
+            self._requests[key] = set()
+            return sorted(requested)
+
+    def wait(self, key, timeout):
+        """Wait until chunks are re-requested or the verdict is in: (requested indexes, verdict or None)."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._requests.get(key) or key in self._verdicts, timeout=timeout)
+        return self.take_requests(key), self._verdicts.get(key)
@@ -0,0 +1,721 @@
+import argparse
+import base64
+import hmac
+import ipaddress
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from colorama import Fore
+
+from Class.bundle import pack_directory
+from Class import progressive
+from Class.multi_radio import owns_interface
+from Class.node_cache import compact_node
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 4404  # The radio's own TCP API uses 4403
+DAEMON_SCHEME = "daemon://"
+CLIENT_QUEUE_LIMIT = 1000  # Events buffered per client before the oldest are dropped
+EVENT_TYPES = ("output", "packet", "node", "outbox", "preview")
+# Shared secret clients present on connect; in the home directory, so the GUI finds it wherever it runs from
+DAEMON_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".meshtastic_chat_daemon.token")
+AUTH_TIMEOUT = 10  # Seconds a new connection has to present the token
+CAPTURE_DIR = "captures"  # Capture files clients start go here, whatever path they ask for
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    return str(value)
+
+
+def _json_object_hook(value):
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def encode_message(message) -> bytes:
+    """One JSON object per line; bytes travel as {"__bytes__": base64}."""
+    return json.dumps(message, default=_json_default, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode_message(line):
+    return json.loads(line, object_hook=_json_object_hook)
+
+
+def parse_daemon_address(address):
+    """'daemon://host:port' -> (host, port), or None if address isn't a daemon address."""
+    if not address.startswith(DAEMON_SCHEME):
+        return None
+    host, _, port = address[len(DAEMON_SCHEME):].rpartition(":")
+    if not host:
+        host, port = port or DEFAULT_HOST, ""
+    return host, int(port) if port else DEFAULT_PORT
+
+
+def is_loopback(host) -> bool:
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def load_token(path=DAEMON_TOKEN_FILE, create=False):
+    """The daemon token stored at path, or None; with create, a new one is written there if there is none."""
+    try:
+        with open(path, "r") as file:
+            token = file.read().strip()
+        if token or not create:
+            return token or None
+    except FileNotFoundError:
+        if not create:
+            return None
+    token = secrets.token_urlsafe(32)
+    # Readable by its owner only (on Windows the profile directory's ACL does this)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as file:
+        file.write(token + "\n")
+    os.chmod(path, 0o600)  # In case the file was already there with wider permissions
+    return token
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _ClientConnection:
+    """One attached client: a subscription filter and a writer thread with its own queue.
+
+    Fan-out only ever puts to the queue, so a slow client loses its oldest
+    events instead of holding up the radio thread or the other clients.
+    """
+
+    def __init__(self, daemon, sock, address):
+        self.daemon = daemon
+        self.sock = sock
+        self.address = address
+        self.events = set()
+        self.ports = None  # None means every port
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_LIMIT)
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def send(self, message, droppable=False):
+        while not self.closed.is_set():
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                if not droppable:
+                    time.sleep(0.01)  # Replies aren't dropped, wait for the writer
+                    continue
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    self.daemon.m_dropped.inc()
+                except queue.Empty:
+                    pass
+
+    def wants(self, event, port=None):
+        if event not in self.events:
+            return False
+        return port is None or self.ports is None or port in self.ports
+
+    def _write_loop(self):
+        while not self.closed.is_set():
+            try:
+                message = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.sock.sendall(encode_message(message))
+            except OSError:
+                self.close()
+
+    def close(self):
+        self.closed.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class MeshDaemon:
+    """Serve one MeshtasticChatApp to many local clients over JSON lines on TCP.
+
+    A request is {"id": n, "cmd": name, ...params}; the reply is
+    {"id": n, "ok": true, "result": ...} or {"id": n, "ok": false, "error": ...}.
+    After "subscribe", the daemon also pushes {"event": "output" | "packet" | "node", ...}.
+    Commands run on a worker pool, so a slow send doesn't block other requests.
+    With a token, a connection's first request must be {"cmd": "auth", "token": ...};
+    without one the daemon only serves loopback addresses.
+    """
+
+    def __init__(self, app, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=8, token=None, capture_dir=CAPTURE_DIR):
+        if not token and not is_loopback(host):
+            raise ValueError(f"Serving on {host} needs a token: anyone who can connect could read and change "
+                             f"the channel keys")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.token = token
+        self.capture_dir = capture_dir
+        self.clients = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mesh-daemon")
+        self._server = None
+        self.m_requests = app.metrics.counter("daemon_requests_total", "Requests handled by the daemon, by command")
+        self.m_dropped = app.metrics.counter("daemon_events_dropped_total", "Events dropped for clients that fell behind")
+        self.m_refused = app.metrics.counter("daemon_clients_refused_total", "Connections refused for a missing or wrong token")
+        self.m_clients = app.metrics.gauge("daemon_clients", "Clients attached to the daemon").set_function(
+            self._client_count)
+        self.commands = {
+            "ping": lambda client, p: "pong",
+            "auth": lambda client, p: True,  # Checked before the first command; a no-op after that
+            "subscribe": self._cmd_subscribe,
+            "info": self._cmd_info,
+            "send_text": self._cmd_send_text,
+            "send_group": self._cmd_send_group,
+            "send_data": self._cmd_send_data,
+            "send_file": self._cmd_send_file,
+            "nodes": lambda client, p: self.app.show_nodes(p.get("include_self", True)),
+            "node_db": lambda client, p: [compact_node(node) for node in list(self.app.interface.nodesByNum.values())],
+            "channels": lambda client, p: self.app.get_channels(),
+            "set_psk": lambda client, p: self.app.set_psk(p["index"], p["psk"]),
+            "add_channel": lambda client, p: self.app.add_channel(p["name"]),
+            "channel_diff": lambda client, p: self.app.preview_channel_edits(p["edits"]),
+            "apply_channels": lambda client, p: self.app.apply_channel_edits(p["edits"], p.get("verify", True)),
+            "traceroute": self._cmd_traceroute,
+            "metrics": lambda client, p: self.app.metrics.to_dict(),
+            "capture": self._cmd_capture,
+            "tunnel": self._cmd_tunnel,
+            "queue_text": lambda client, p: self.app.queue_text_message(
+                p["text"], p.get("channel_index", 0), p.get("destination_id")),
+            "queue_file": lambda client, p: self.app.queue_file(
+                p["data"], p["name"], p.get("channel_index", 0), p.get("destination_id"), p.get("delta", False),
+                p.get("progressive", False)),
+            "cancel_transfer": lambda client, p: self.app.cancel_transfer(p["name"], p.get("sender_id")),
+            "queue_bundle": lambda client, p: self.app.queue_bundle(
+                p["data"], p["name"], p["files"], p.get("channel_index", 0), p.get("destination_id")),
+            "outbox": self._cmd_outbox,
+        }
+
+    # Function to start serving clients
+    def start(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon._serve_client(self.request, self.client_address, self.rfile)
+
+        self._server = _Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]  # Port 0 picks a free one
+        # The daemon is the app's only consumer, so it takes over the app's callbacks
+        self.app.on_receive_callback = self._on_output
+        self.app.on_node_updated_callback = self._on_node_updated
+        self.app.outbox.on_change = self._on_outbox
+        self.app.on_preview_callback = self._on_preview
+        from pubsub import pub
+        pub.subscribe(self._on_packet, "meshtastic.receive")
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(Fore.GREEN + f"Mesh daemon listening on {self.host}:{self.port}")
+        return self
+
+    def _client_count(self):
+        return len(self.clients)
+
+    def close(self):
+        from pubsub import pub
+        pub.unsubscribe(self._on_packet, "meshtastic.receive")
+        self.m_clients.clear_function(self._client_count)
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+        self._executor.shutdown(wait=False)
+
+    def _authenticate(self, sock, address, rfile):
+        if not self.token:
+            return True
+        sock.settimeout(AUTH_TIMEOUT)
+        try:
+            request = decode_message(rfile.readline())
+        except (OSError, ValueError):
+            request = None
+        request = request if isinstance(request, dict) else {}
+        token = request.get("token") if request.get("cmd") == "auth" else None
+        if isinstance(token, str) and hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8")):
+            sock.settimeout(None)
+            sock.sendall(encode_message({"id": request.get("id"), "ok": True, "result": True}))
+            return True
+        self.m_refused.inc()
+        logging.warning(f"Refused a daemon client from {address}: missing or wrong token")
+        try:
+            sock.sendall(encode_message({"id": request.get("id"), "ok": False,
+                                         "error": "Not authorized: present the daemon's token with the auth command"}))
+        except OSError:
+            pass
+        return False
+
+    def _serve_client(self, sock, address, rfile):
+        if not self._authenticate(sock, address, rfile):
+            return
+        client = _ClientConnection(self, sock, address)
+        with self._lock:
+            self.clients.add(client)
+        logging.info(f"Daemon client attached from {address}")
+        try:
+            for line in rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = decode_message(line)
+                except ValueError as e:
+                    client.send({"id": None, "ok": False, "error": f"Malformed request: {e}"})
+                    continue
+                self._executor.submit(self._handle_request, client, request)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.clients.discard(client)
+            client.close()
+            logging.info(f"Daemon client {address} detached")
+
+    def _handle_request(self, client, request):
+        request_id = request.get("id")
+        command = self.commands.get(request.get("cmd"))
+        if command is None:
+            client.send({"id": request_id, "ok": False, "error": f"Unknown command: {request.get('cmd')}"})
+            return
+        self.m_requests.inc(cmd=request["cmd"])
+        try:
+            request["_id"] = request_id
+            result = command(client, request)
+            client.send({"id": request_id, "ok": True, "result": result})
+        except Exception as e:
+            logging.exception(f"Daemon command {request.get('cmd')} failed")
+            client.send({"id": request_id, "ok": False, "error": str(e)})
+
+    def _broadcast(self, event, message, port=None):
+        with self._lock:
+            clients = [client for client in self.clients if client.wants(event, port)]
+        for client in clients:
+            client.send(message, droppable=True)
+
+    # Function to fan received events out to subscribed clients
+    def _on_output(self, message, message_type="INFO"):
+        self._broadcast("output", {"event": "output", "message": message, "type": message_type})
+
+    def _on_node_updated(self, node):
+        self._broadcast("node", {"event": "node", "node": compact_node(node)})
+
+    def _on_outbox(self, entry):
+        self._broadcast("outbox", {"event": "outbox", "entry": entry})
+
+    def _on_preview(self, preview):
+        preview = dict(preview)
+        if not preview["done"]:
+            # Clients may be on other machines, so the preview travels with the event
+            try:
+                with open(preview["path"], "rb") as file:
+                    preview["data"] = file.read()
+            except OSError:
+                return
+        self._broadcast("preview", {"event": "preview", "preview": preview})
+
+    def _on_packet(self, packet, interface):
+        if not owns_interface(self.app.interface, interface):
+            return
+        port = packet.get("decoded", {}).get("portnum")
+        packet = {k: v for k, v in packet.items() if k != "raw"}  # The protobuf object doesn't serialize
+        self._broadcast("packet", {"event": "packet", "packet": packet}, port)
+
+    def _cmd_subscribe(self, client, params):
+        events = params.get("events", EVENT_TYPES)
+        unknown = set(events) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown events: {', '.join(sorted(unknown))}")
+        client.events = set(events)
+        client.ports = set(params["ports"]) if params.get("ports") else None
+        return sorted(client.events)
+
+    def _cmd_info(self, client, params):
+        interface = self.app.interface
+        return {
+            "dev_path": self.app.dev_path,
+            "node_num": interface.myInfo.my_node_num if interface.myInfo else None,
+            "user": (interface.nodesByNum or {}).get(interface.myInfo.my_node_num, {}).get("user")
+            if interface.myInfo else None,
+            "destination_id": self.app.destination_id,
+            "device_ip": self.app.get_device_ip(),
+            "timeout": self.app.timeout,
+            "clients": len(self.clients),
+        }
+
+    def _cmd_send_text(self, client, params):
+        return self.app.send_text_message(params["text"], params.get("channel_index", 0), params.get("destination_id"))
+
+    def _cmd_send_group(self, client, params):
+        self.app.send_group_message(params["text"], params.get("channel_index", 0))
+        return True
+
+    def _cmd_send_data(self, client, params):
+        return self.app.send_data(params["data"], params.get("channel_index", 0), params.get("destination_id"))
+
+    def _cmd_send_file(self, client, params):
+        def progress_callback(current_chunk, total_chunks):
+            client.send({"event": "progress", "id": params["_id"], "current": current_chunk, "total": total_chunks})
+
+        # Its result, not the progress: a file can be fully ACKed yet fail its SHA-256, or stop early on a CANCEL
+        return self.app.send_data_in_chunks(params["data"], params["name"], progress_callback,
+                                            params.get("channel_index", 0), params.get("destination_id"))
+
+    def _cmd_traceroute(self, client, params):
+        future = self.app.trace_route(params["dest"], params.get("hop_limit", 3), params.get("channel_index", 0),
+                                      params.get("max_age"))
+        try:
+            return future.result()
+        except TimeoutError:
+            return None
+
+    def _cmd_outbox(self, client, params):
+        action = params.get("action", "pending")
+        if action == "flush":
+            self.app.outbox.flush(params.get("destination_id"))
+        elif action == "cancel":
+            return self.app.outbox.cancel(params["entry_id"])
+        elif action == "stats":
+            return self.app.outbox.stats()
+        return self.app.outbox.pending(params.get("destination_id"))
+
+    def _cmd_capture(self, client, params):
+        if params.get("action") == "start":
+            # Only the file name is used: a client mustn't make the daemon write wherever it can
+            name = os.path.basename(params["path"])
+            if name in ("", ".", ".."):
+                raise ValueError(f"Not a capture file name: {params['path']}")
+            os.makedirs(self.capture_dir, exist_ok=True)
+            self.app.start_capture(os.path.join(self.capture_dir, name))
+        elif params.get("action") == "stop":
+            self.app.stop_capture()
+        return self.app.capture.path if self.app.capture else None
+
+    def _cmd_tunnel(self, client, params):
+        action = params.get("action")
+        if action == "stats":
+            return self.app.tunnel_queue_stats()
+        if action == "send":
+            self.app.send_tunnel_packet(params["dest_ip"], params["message"])
+            return True
+        method = {"start_client": "start_tunnel_client", "start_gateway": "start_tunnel_gateway",
+                  "close": "close_tunnel"}.get(action)
+        if method is None or not hasattr(self.app, method):
+            raise ValueError(f"Tunnel action {action} isn't available on this daemon")
+        getattr(self.app, method)()
+        return True
+
+
+class RemoteInterface:
+    """The part of a MeshInterface the GUI reads, mirrored from the daemon."""
+
+    def __init__(self):
+        self.nodesByNum = {}
+        self.myInfo = None
+
+
+class RemoteChatApp:
+    """Drop-in for MeshtasticChatApp that talks to a MeshDaemon instead of a radio.
+
+    Callbacks fire on the reader thread, just as a local app fires them on the radio's thread.
+    Without a token, the one in DAEMON_TOKEN_FILE is presented, if there is one.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, destination_id=None, on_receive_callback=None,
+                 timeout=10, on_node_updated_callback=None, events=EVENT_TYPES, on_packet_callback=None,
+                 on_outbox_callback=None, on_preview_callback=None, token=None):
+        self.dev_path = f"{DAEMON_SCHEME}{host}:{port}"
+        self.destination_id = destination_id
+        self.timeout = timeout
+        self.on_receive_callback = on_receive_callback
+        self.on_node_updated_callback = on_node_updated_callback
+        self.on_packet_callback = on_packet_callback
+        self.on_outbox_callback = on_outbox_callback
+        self.on_preview_callback = on_preview_callback
+        self.received_dir = 'received_files'  # Where previews from the daemon are written locally
+        self.interface = RemoteInterface()
+        self.capture = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.settimeout(None)
+        self._rfile = self._sock.makefile("rb")
+        self._closed = False
+        self._closing = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+        token = token or load_token()
+        if token:
+            self.call("auth", token=token, timeout=timeout)
+        self.info = self.call("info")
+        if self.destination_id is None:
+            self.destination_id = self.info["destination_id"]
+        self.interface.nodesByNum = {node["num"]: node for node in self.call("node_db")}
+        if events:
+            self.call("subscribe", events=list(events))
+        print(Fore.LIGHTBLACK_EX + f"Attached to the mesh daemon at {host}:{port}")
+
+    def _read_loop(self):
+        try:
+            for line in self._rfile:
+                message = decode_message(line)
+                if "event" in message:
+                    self._dispatch_event(message)
+                    continue
+                with self._lock:
+                    waiter = self._pending.pop(message.get("id"), None)
+                if waiter:
+                    waiter["reply"] = message
+                    waiter["event"].set()
+        except (OSError, ValueError) as e:
+            logging.debug(f"Daemon connection closed: {e}")
+        finally:
+            self._closed = True
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for waiter in pending.values():
+                waiter["reply"] = {"ok": False, "error": "Connection to the daemon was lost"}
+                waiter["event"].set()
+            if self.on_receive_callback and not self._closing:
+                self.on_receive_callback("Disconnected from the mesh daemon.", message_type="ERROR")
+
+    def _dispatch_event(self, message):
+        event = message["event"]
+        if event == "output" and self.on_receive_callback:
+            self.on_receive_callback(message["message"], message_type=message.get("type", "INFO"))
+        elif event == "node":
+            node = message["node"]
+            self.interface.nodesByNum[node["num"]] = node
+            if self.on_node_updated_callback:
+                self.on_node_updated_callback(node)
+        elif event == "packet" and self.on_packet_callback:
+            self.on_packet_callback(message["packet"])
+        elif event == "outbox" and self.on_outbox_callback:
+            self.on_outbox_callback(message["entry"])
+        elif event == "preview" and self.on_preview_callback:
+            preview = message["preview"]
+            data = preview.pop("data", None)
+            if data is not None:
+                preview["path"] = progressive.preview_path(self.received_dir, preview["name"])
+                try:
+                    progressive.write_preview(preview["path"], data)
+                except OSError as e:
+                    logging.warning(f"Failed to write the preview of {preview['name']}: {e}")
+                    return
+            self.on_preview_callback(preview)
+        elif event == "progress":
+            callback = self._progress.get(message["id"])
+            if callback:
+                callback(message["current"], message["total"])
+
+    def call(self, cmd, timeout=None, progress_callback=None, **params):
+        """Run a daemon command and return its result; raises RuntimeError with the daemon's error."""
+        if self._closed:
+            raise RuntimeError("Not connected to the mesh daemon")
+        request_id = next(self._ids)
+        waiter = {"event": threading.Event(), "reply": None}
+        with self._lock:
+            self._pending[request_id] = waiter
+        if progress_callback:
+            self._progress[request_id] = progress_callback
+        try:
+            with self._write_lock:
+                self._sock.sendall(encode_message({"id": request_id, "cmd": cmd, **params}))
+            if not waiter["event"].wait(timeout):
+                raise TimeoutError(f"The daemon didn't answer {cmd} within {timeout} s")
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            self._progress.pop(request_id, None)
+        reply = waiter["reply"]
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply.get("result")
+
+    def close(self):
+        self._closing = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def set_destination_id(self, destination_id):
+        self.destination_id = destination_id
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout  # The daemon's radio keeps its own ACK timeout
+
+    def send_text_message(self, text, channel_index, destination_id=None):
+        return self.call("send_text", text=text, channel_index=channel_index,
+                         destination_id=destination_id or self.destination_id)
+
+    def send_group_message(self, text, channel_index):
+        return self.call("send_group", text=text, channel_index=channel_index)
+
+    def send_data(self, data, channel_index, destination_id=None):
+        return self.call("send_data", data=data, channel_index=channel_index,
+                         destination_id=destination_id or self.destination_id)
+
+    def send_data_in_chunks(self, data, file_name, progress_callback=None, channel_index=0, destination_id=None):
+        return self.call("send_file", progress_callback=progress_callback, data=data, name=file_name,
+                         channel_index=channel_index, destination_id=destination_id or self.destination_id)
+
+    def queue_text_message(self, text, channel_index, destination_id=None):
+        return self.call("queue_text", text=text, channel_index=channel_index,
+                         destination_id=destination_id or self.destination_id)
+
+    def queue_file(self, data, file_name, channel_index=0, destination_id=None, delta=False, progressive=False):
+        return self.call("queue_file", data=data, name=file_name, channel_index=channel_index,
+                         destination_id=destination_id or self.destination_id, delta=delta,
+                         progressive=progressive)
+
+    def queue_path(self, file_path, channel_index=0, destination_id=None, delta=False, progressive=False):
+        # The file is on this machine, so its bytes go to the daemon now
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        return self.queue_file(data, os.path.basename(file_path), channel_index, destination_id, delta, progressive)
+
+    def cancel_transfer(self, file_name, sender_id=None):
+        return self.call("cancel_transfer", name=file_name, sender_id=sender_id)
+
+    def queue_folder(self, directory, channel_index=0, destination_id=None):
+        # Packed here: the folder is on this machine, not necessarily the daemon's
+        name, bundle, file_count = pack_directory(directory)
+        return self.call("queue_bundle", data=bundle, name=name, files=file_count, channel_index=channel_index,
+                         destination_id=destination_id or self.destination_id)
+
+    def outbox_pending(self, destination_id=None):
+        return self.call("outbox", action="pending", destination_id=destination_id)
+
+    def show_nodes(self, include_self=True):
+        return self.call("nodes", include_self=include_self)
+
+    def get_channels(self):
+        return self.call("channels")
+
+    def set_psk(self, index, psk):
+        return self.call("set_psk", index=index, psk=psk)
+
+    def add_channel(self, name):
+        return self.call("add_channel", name=name)
+
+    def preview_channel_edits(self, edits):
+        return self.call("channel_diff", edits=edits)
+
+    def apply_channel_edits(self, edits, verify=True):
+        return self.call("apply_channels", edits=edits, verify=verify)
+
+    def sendTraceRoute(self, dest, hopLimit, channelIndex=0, max_age=None):
+        return self.call("traceroute", dest=dest, hop_limit=hopLimit, channel_index=channelIndex, max_age=max_age)
+
+    def get_device_ip(self):
+        return self.info.get("device_ip")
+
+    def metrics_snapshot(self):
+        return self.call("metrics")
+
+    def start_capture(self, path):
+        self.capture = self.call("capture", action="start", path=path)
+
+    def stop_capture(self):
+        self.capture = self.call("capture", action="stop")
+
+    def start_tunnel_client(self):
+        self.call("tunnel", action="start_client")
+
+    def start_tunnel_gateway(self):
+        self.call("tunnel", action="start_gateway")
+
+    def close_tunnel(self):
+        self.call("tunnel", action="close")
+
+    def send_tunnel_packet(self, dest_ip, message):
+        self.call("tunnel", action="send", dest_ip=dest_ip, message=message)
+
+    def tunnel_queue_stats(self):
+        if self._closed:
+            return None
+        return self.call("tunnel", action="stats", timeout=self.timeout)
+
+
+def main():
+    from Class.meshtastic_chat_app import MeshtasticChatApp
+
+    parser = argparse.ArgumentParser(description="Own the radio and share it with local clients")
+    parser.add_argument("--device", default="/dev/ttyUSB0", help="serial port of the radio")
+    parser.add_argument("--destination", default="^all", help="default destination for clients that don't set one")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to serve on; clients elsewhere need the token")
+    parser.add_argument("--token-file", default=DAEMON_TOKEN_FILE,
+                        help="where the token clients must present is kept (created if missing)")
+    parser.add_argument("--capture-dir", default=CAPTURE_DIR, help="where captures started by clients are written")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--retransmission-limit", type=int, default=3)
+    parser.add_argument("--capture", help="record every packet to this capture file")
+    parser.add_argument("--outbox", default="outbox.json", help="where undelivered messages are kept")
+    parser.add_argument("--tunnel", choices=("client", "gateway"), help="start the IP tunnel (Linux)")
+    parser.add_argument("--metrics-port", type=int, default=9464, help="0 disables the metrics endpoint")
+    args = parser.parse_args()
+
+    app = MeshtasticChatApp(args.device, args.destination, timeout=args.timeout,
+                            retransmission_limit=args.retransmission_limit, capture_path=args.capture,
+                            outbox_path=args.outbox)
+    if args.tunnel == "client":
+        app.start_tunnel_client()
+    elif args.tunnel == "gateway":
+        app.start_tunnel_gateway()
+    if args.metrics_port:
+        try:
+            app.metrics.serve(port=args.metrics_port)
+        except OSError as e:
+            print(Fore.MAGENTA + f"Metrics endpoint not started on port {args.metrics_port}: {e}")
+    token = load_token(args.token_file, create=True)
+    print(Fore.LIGHTBLACK_EX + f"Clients must present the token in {args.token_file}")
+    daemon = MeshDaemon(app, args.host, args.port, token=token, capture_dir=args.capture_dir).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(Fore.LIGHTBLACK_EX + "Shutting down the mesh daemon")
+    finally:
+        daemon.close()
+        app.close()
+        app.stop_capture()
+        app.interface.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,481 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Union, Optional, Callable, Any
+
+from pubsub import pub
+from meshtastic import channel_pb2, mesh_pb2, portnums_pb2
+
+from Class.packet_capture import mesh_packet_to_dict
+
+BROADCAST_NUM = 0xFFFFFFFF
+BROADCAST_ADDR = "^all"
+HEADER_BYTES = 16  # LoRa packet header added to every payload on air
+ACK_BYTES = 8  # Size of an empty routing packet
+FIRMWARE_TRIES = 3  # Tries the firmware makes for a wantAck packet before it NAKs
+
+
+def node_num_to_id(node_num):
+    return f"!{node_num:08x}"
+
+
+class SimLink:
+    """Radio link between two simulated nodes."""
+
+    def __init__(self, loss=0.0, latency=0.05, bandwidth=1000.0, snr=10.0, rssi=-70, hops=1, corrupt=0.0):
+        self.loss = loss  # Probability that one transmission over the link is lost
+        self.corrupt = corrupt  # Probability that a delivered payload has a byte flipped that no radio CRC caught
+        self.latency = latency  # Seconds of processing/propagation per hop
+        self.bandwidth = bandwidth  # Bytes per second while on air
+        self.snr = snr
+        self.rssi = rssi
+        self.hops = hops  # Relays hidden inside this link (1 = direct neighbours)
+
+
+class SimulatedNode:
+    """The subset of meshtastic.node.Node the app uses (the local node's channels)."""
+
+    def __init__(self, iface, node_num):
+        self.iface = iface
+        self.nodeNum = node_num
+        self.channels = []
+        for index in range(8):
+            channel = channel_pb2.Channel(index=index)
+            if index == 0:
+                channel.role = channel_pb2.Channel.Role.PRIMARY
+                channel.settings.psk = b'\x01'
+            self.channels.append(channel)
+        self.device_channels = [channel_pb2.Channel() for _ in range(8)]
+        for channel, stored in zip(self.channels, self.device_channels):
+            stored.CopyFrom(channel)
+        # Only the LoRa hop limit, which the app reads as the default it can trim per destination
+        self.localConfig = SimpleNamespace(lora=SimpleNamespace(hop_limit=iface.mesh.default_hop_limit))
+        self.admin_writes = 0
+        self.settings_commits = 0
+        self._in_transaction = False
+
+    def writeChannel(self, channelIndex, adminIndex=0):
+        self.admin_writes += 1
+        self.device_channels[channelIndex].CopyFrom(self.channels[channelIndex])
+        if not self._in_transaction:
+            self.settings_commits += 1
+
+    def getDisabledChannel(self):
+        for channel in self.channels:
+            if channel.role == channel_pb2.Channel.Role.DISABLED:
+                return channel
+        return None
+
+    def getChannelByChannelIndex(self, channelIndex):
+        if 0 <= channelIndex < len(self.channels):
+            return self.channels[channelIndex]
+        return None
+
+    def beginSettingsTransaction(self):
+        self.admin_writes += 1
+        self._in_transaction = True
+
+    def commitSettingsTransaction(self):
+        self.admin_writes += 1
+        self._in_transaction = False
+        self.settings_commits += 1
+
+    def requestChannels(self):
+        self.admin_writes += 1
+        self.channels = None
+        self.channels = [channel_pb2.Channel() for _ in range(8)]
+        for channel, stored in zip(self.channels, self.device_channels):
+            channel.CopyFrom(stored)
+
+    def waitForConfig(self, attribute="channels"):
+        return self.channels is not None
+
+
+class SimulatedInterface:
+    """Stands in for meshtastic.serial_interface.SerialInterface on a SimulatedMesh.
+
+    Implements the part of the MeshInterface API that MeshtasticChatApp and Tunnel use:
+    sendText, sendData (with onResponse), nodes, nodesByNum, localNode, myInfo and the
+    meshtastic.receive / meshtastic.node.updated pubsub topics.
+    """
+
+    def __init__(self, mesh, node_num, long_name, short_name, hw_model="PORTDUINO", duty_cycle=1.0, noProto=False):
+        self.mesh = mesh
+        self.node_num = node_num
+        self.devPath = f"sim:{node_num_to_id(node_num)}"
+        self.noProto = noProto
+        self.duty_cycle = duty_cycle
+        self.myInfo = mesh_pb2.MyNodeInfo(my_node_num=node_num)
+        self.localNode = SimulatedNode(self, node_num)
+        self.nodesByNum = {}
+        self.nodes = {}
+        self.responseHandlers = {}
+        self.isConnected = threading.Event()
+        self.isConnected.set()
+        self.user = {"id": node_num_to_id(node_num), "longName": long_name, "shortName": short_name, "hwModel": hw_model}
+        self._busy_until = 0.0
+        self._lock = threading.Lock()
+        self._add_node_info(node_num, self.user, hops_away=0)
+
+    def _add_node_info(self, node_num, user, hops_away, snr=None):
+        node = self.nodesByNum.get(node_num)
+        if node is None:
+            node = {"num": node_num, "user": dict(user)}
+            self.nodesByNum[node_num] = node
+            self.nodes[user["id"]] = node
+        node["hopsAway"] = hops_away
+        node["lastHeard"] = int(time.time())
+        if snr is not None:
+            node["snr"] = snr
+        return node
+
+    def _generatePacketId(self):
+        return self.mesh._next_packet_id()
+
+    def _resolve_dest(self, destinationId):
+        if isinstance(destinationId, int):
+            return destinationId
+        if destinationId == BROADCAST_ADDR:
+            return BROADCAST_NUM
+        if destinationId.startswith("!"):
+            return int(destinationId[1:], 16)
+        node = self.nodes.get(destinationId)
+        if node is None:
+            raise ValueError(f"NodeId {destinationId} not found in DB")
+        return node["num"]
+
+    def sendText(self, text: str, destinationId: Union[int, str]=BROADCAST_ADDR, wantAck: bool=False,
+                 wantResponse: bool=False, onResponse: Optional[Callable[[dict], Any]]=None, channelIndex: int=0):
+        return self.sendData(text.encode("utf-8"), destinationId, portNum=portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+                             wantAck=wantAck, wantResponse=wantResponse, onResponse=onResponse,
+                             channelIndex=channelIndex)
+
+    def sendData(self, data, destinationId: Union[int, str]=BROADCAST_ADDR,
+                 portNum=portnums_pb2.PortNum.PRIVATE_APP, wantAck: bool=False, wantResponse: bool=False,
+                 onResponse: Optional[Callable[[dict], Any]]=None, onResponseAckPermitted: bool=False,
+                 channelIndex: int=0, hopLimit: Optional[int]=None):
+        if getattr(data, "SerializeToString", None):
+            data = data.SerializeToString()
+        if len(data) > mesh_pb2.Constants.DATA_PAYLOAD_LEN:
+            raise ValueError("Data payload too big")
+        if not self.isConnected.is_set():
+            raise ConnectionError(f"{self.devPath} is not connected")
+
+        packet = mesh_pb2.MeshPacket()
+        setattr(packet, "from", self.node_num)
+        packet.to = self._resolve_dest(destinationId)
+        packet.channel = channelIndex
+        packet.decoded.payload = bytes(data)
+        packet.decoded.portnum = portNum
+        packet.decoded.want_response = wantResponse
+        packet.id = self._generatePacketId()
+        packet.want_ack = wantAck
+        packet.hop_limit = self.mesh.default_hop_limit if hopLimit is None else hopLimit
+        packet.hop_start = packet.hop_limit
+        if onResponse is not None:
+            self.responseHandlers[packet.id] = (onResponse, onResponseAckPermitted)
+        self.mesh._transmit(self, packet)
+        return packet
+
+    def _reserve_airtime(self, airtime):
+        """Return when this node may start transmitting, honouring its duty cycle."""
+        with self._lock:
+            start = max(self.mesh._now(), self._busy_until)
+            self._busy_until = start + airtime / self.duty_cycle
+            return start
+
+    def _deliver(self, packet, rx_snr, rx_rssi, hops_taken):
+        """Hand a packet received over the air to the application, like MeshInterface does."""
+        packet = mesh_pb2.MeshPacket.FromString(packet.SerializeToString())
+        packet.rx_snr = rx_snr
+        packet.rx_rssi = rx_rssi
+        packet.rx_time = int(time.time())
+        packet.hop_limit = max(packet.hop_start - hops_taken, 0)
+        topic, as_dict = mesh_packet_to_dict(packet)
+        decoded = as_dict["decoded"]
+
+        sender = self.nodesByNum.get(getattr(packet, "from"))
+        if sender is not None:
+            sender["lastHeard"] = packet.rx_time
+            sender["hopsAway"] = hops_taken
+            if hops_taken == 0:
+                sender["snr"] = rx_snr
+            pub.sendMessage("meshtastic.node.updated", node=sender, interface=self)
+
+        request_id = decoded.get("requestId")
+        if request_id is not None and request_id in self.responseHandlers:
+            routing = decoded.get("routing")
+            is_ack = routing is not None and routing.get("errorReason", "NONE") == "NONE"
+            callback, ack_permitted = self.responseHandlers[request_id]
+            if not is_ack or ack_permitted or callback.__name__ == "onAckNak":
+                del self.responseHandlers[request_id]
+                callback(as_dict)
+
+        pub.sendMessage(topic, packet=as_dict, interface=self)
+
+    def close(self):
+        if self.isConnected.is_set():
+            self.isConnected.clear()
+            self.mesh._detach(self)
+            pub.sendMessage("meshtastic.connection.lost", interface=self)
+
+
+class SimulatedMesh:
+    """Several simulated radios in one process, joined by lossy, slow links.
+
+    Delays are real (scaled by time_scale) and delivered from a single scheduler
+    thread, the way the meshtastic library publishes from its own thread. All
+    randomness comes from one seeded generator so runs are repeatable.
+    """
+
+    def __init__(self, seed=0, time_scale=1.0, default_hop_limit=3):
+        self.rng = random.Random(seed)
+        self.time_scale = time_scale
+        self.default_hop_limit = default_hop_limit
+        self.interfaces = {}
+        self.links = {}
+        self.stats = Counter()
+        self._packet_ids = itertools.count(self.rng.randint(1, 0x7FFFFFFF))
+        self._events = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._tx_lock = threading.RLock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_node(self, node_num=None, long_name=None, short_name=None, duty_cycle=1.0, noProto=False):
+        """Create a radio and return its interface."""
+        if node_num is None:
+            node_num = self.rng.randint(0x10000000, 0xFFFFFFFE)
+            while node_num in self.interfaces:
+                node_num = self.rng.randint(0x10000000, 0xFFFFFFFE)
+        node_id = node_num_to_id(node_num)
+        iface = SimulatedInterface(self, node_num, long_name or f"Meshtastic {node_id[-4:]}",
+                                   short_name or node_id[-4:], duty_cycle=duty_cycle, noProto=noProto)
+        self.interfaces[node_num] = iface
+        self._refresh_node_dbs()
+        return iface
+
+    def connect(self, a, b, **link_args):
+        """Join two interfaces (or node numbers) with a symmetric link, see SimLink."""
+        a = a.node_num if isinstance(a, SimulatedInterface) else a
+        b = b.node_num if isinstance(b, SimulatedInterface) else b
+        link = SimLink(**link_args)
+        self.links[(a, b)] = link
+        self.links[(b, a)] = link
+        self._refresh_node_dbs()
+        return link
+
+    def disconnect(self, a, b):
+        a = a.node_num if isinstance(a, SimulatedInterface) else a
+        b = b.node_num if isinstance(b, SimulatedInterface) else b
+        self.links.pop((a, b), None)
+        self.links.pop((b, a), None)
+
+    def neighbours(self, node_num):
+        return [b for (a, b) in self.links if a == node_num and b in self.interfaces]
+
+    def path(self, src, dst):
+        """Least-hop path from src to dst as a list of node numbers, or None."""
+        best = {src: (0, [src])}
+        frontier = [(0, src)]
+        while frontier:
+            cost, node = heapq.heappop(frontier)
+            if node == dst:
+                return best[node][1]
+            if cost > best[node][0]:
+                continue
+            for nxt in self.neighbours(node):
+                new_cost = cost + self.links[(node, nxt)].hops
+                if nxt not in best or new_cost < best[nxt][0]:
+                    best[nxt] = (new_cost, best[node][1] + [nxt])
+                    heapq.heappush(frontier, (new_cost, nxt))
+        return None
+
+    def path_hops(self, path):
+        return sum(self.links[(a, b)].hops for a, b in zip(path, path[1:]))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        for iface in list(self.interfaces.values()):
+            iface.isConnected.clear()
+
+    def _refresh_node_dbs(self):
+        for src, iface in self.interfaces.items():
+            for dst, other in self.interfaces.items():
+                if src == dst:
+                    continue
+                path = self.path(src, dst)
+                if path is None:
+                    continue
+                snr = self.links[(path[0], path[1])].snr if len(path) == 2 else None
+                iface._add_node_info(dst, other.user, hops_away=self.path_hops(path) - 1, snr=snr)
+
+    def _detach(self, iface):
+        self.interfaces.pop(iface.node_num, None)
+
+    def _next_packet_id(self):
+        return next(self._packet_ids) & 0xFFFFFFFF
+
+    def _now(self):
+        return time.monotonic()
+
+    def _schedule(self, at, callback, *args):
+        with self._cond:
+            heapq.heappush(self._events, (at, next(self._seq), callback, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._events or self._events[0][0] > self._now()):
+                    timeout = self._events[0][0] - self._now() if self._events else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                _, _, callback, args = heapq.heappop(self._events)
+            try:
+                callback(*args)
+            except Exception:
+                logging.exception("Simulated mesh callback failed")
+
+    def _hop_airtime(self, link, size):
+        return (size + HEADER_BYTES) / link.bandwidth * link.hops
+
+    def _walk(self, path, size, start):
+        """Carry one transmission along path; return (arrival time, hops) or (None, lost hop)."""
+        t = start
+        for a, b in zip(path, path[1:]):
+            link = self.links.get((a, b))
+            if link is None or b not in self.interfaces:
+                return None, a
+            for _ in range(link.hops):
+                self.stats["transmissions"] += 1
+                self.stats["airtime"] += self._hop_airtime(link, size) / link.hops
+                if self.rng.random() < link.loss:
+                    self.stats["lost"] += 1
+                    return None, a
+            t += (self._hop_airtime(link, size) + link.latency * link.hops) * self.time_scale
+        return t, self.path_hops(path) - 1
+
+    def _flood_relays(self, src, dst, hop_limit):
+        """Count the rebroadcasts a managed flood of this packet costs the mesh."""
+        relays = 0
+        for node in self.interfaces:
+            if node in (src, dst):
+                continue
+            path = self.path(src, node)
+            if path is not None and self.path_hops(path) <= hop_limit:
+                relays += 1
+        return relays
+
+    def _transmit(self, sender, packet):
+        with self._tx_lock:
+            self._transmit_locked(sender, packet)
+
+    def _transmit_locked(self, sender, packet):
+        size = len(packet.decoded.payload)
+        airtime = (size + HEADER_BYTES) / max((l.bandwidth for (a, _), l in self.links.items()
+                                               if a == sender.node_num), default=1000.0)
+        start = sender._reserve_airtime(airtime * self.time_scale)
+        self.stats["packets_sent"] += 1
+        self.stats["bytes_sent"] += size
+        self.stats["rebroadcasts"] += self._flood_relays(sender.node_num, packet.to, packet.hop_limit)
+        if packet.to == BROADCAST_NUM:
+            for dst in list(self.interfaces):
+                if dst != sender.node_num:
+                    self._send_once(sender, packet, dst, start, attempt=FIRMWARE_TRIES)
+        else:
+            self._send_once(sender, packet, packet.to, start, attempt=1)
+
+    def _send_once(self, sender, packet, dst, start, attempt):
+        with self._tx_lock:
+            self._send_once_locked(sender, packet, dst, start, attempt)
+
+    def _send_once_locked(self, sender, packet, dst, start, attempt):
+        size = len(packet.decoded.payload)
+        path = self.path(sender.node_num, dst)
+        arrival, hops = (None, None)
+        if path is not None and self.path_hops(path) - 1 <= packet.hop_limit:
+            arrival, hops = self._walk(path, size, start)
+        delivered = arrival is not None
+        if delivered:
+            link = self.links[(path[-2], path[-1])]
+            self.stats["delivered"] += 1
+            arriving = packet
+            if packet.decoded.payload and self.rng.random() < link.corrupt:
+                self.stats["corrupted"] += 1
+                arriving = mesh_pb2.MeshPacket()
+                arriving.CopyFrom(packet)
+                payload = bytearray(packet.decoded.payload)
+                payload[self.rng.randrange(len(payload))] ^= 1 << self.rng.randrange(8)
+                arriving.decoded.payload = bytes(payload)
+            self._schedule(arrival, self._arrive, dst, arriving, link.snr, link.rssi, hops)
+
+        if not packet.want_ack or packet.to == BROADCAST_NUM:
+            return
+        ack_at = None
+        if delivered:
+            ack_at, _ = self._walk(list(reversed(path)), ACK_BYTES, arrival)
+        if ack_at is not None:
+            self._schedule(ack_at, self._routing_reply, sender, packet, dst, "NONE")
+            return
+        first_link = self.links.get((path[0], path[1])) if path and len(path) > 1 else SimLink()
+        retry_at = start + (2 * self._hop_airtime(first_link, size) + 1.0) * self.time_scale
+        if attempt < FIRMWARE_TRIES:
+            self.stats["firmware_retries"] += 1
+            self._schedule(retry_at, self._send_once, sender, packet, dst, retry_at, attempt + 1)
+        else:
+            self._schedule(retry_at, self._routing_reply, sender, packet, dst, "MAX_RETRANSMIT")
+
+    def _arrive(self, dst, packet, snr, rssi, hops):
+        iface = self.interfaces.get(dst)
+        if iface is None:
+            return
+        iface._deliver(packet, snr, rssi, hops)
+        if packet.decoded.portnum == portnums_pb2.PortNum.TRACEROUTE_APP and packet.decoded.want_response:
+            path = self.path(getattr(packet, "from"), dst)  # Relays in the order the request crossed them
+            route = mesh_pb2.RouteDiscovery()
+            route.route.extend(path[1:-1] if path else [])
+            reply = mesh_pb2.MeshPacket()
+            setattr(reply, "from", dst)
+            reply.to = getattr(packet, "from")
+            reply.id = self._next_packet_id()
+            reply.channel = packet.channel
+            reply.decoded.portnum = portnums_pb2.PortNum.TRACEROUTE_APP
+            reply.decoded.payload = route.SerializeToString()
+            reply.decoded.request_id = packet.id
+            reply.hop_limit = self.default_hop_limit
+            reply.hop_start = reply.hop_limit
+            self._transmit(iface, reply)
+
+    def _routing_reply(self, sender, packet, dst, error_reason):
+        """Deliver the firmware's ACK (or NAK) for a wantAck packet back to the sender."""
+        if sender.node_num not in self.interfaces:
+            return
+        routing = mesh_pb2.Routing()
+        routing.error_reason = mesh_pb2.Routing.Error.Value(error_reason)
+        reply = mesh_pb2.MeshPacket()
+        setattr(reply, "from", dst if error_reason == "NONE" else sender.node_num)
+        reply.to = sender.node_num
+        reply.id = self._next_packet_id()
+        reply.decoded.portnum = portnums_pb2.PortNum.ROUTING_APP
+        reply.decoded.payload = routing.SerializeToString()
+        reply.decoded.request_id = packet.id
+        reply.hop_start = self.default_hop_limit
+        reply.hop_limit = self.default_hop_limit
+        self.stats["acks" if error_reason == "NONE" else "naks"] += 1
+        path = self.path(dst, sender.node_num) if error_reason == "NONE" else None
+        if path and len(path) > 1:
+            link = self.links[(path[-2], path[-1])]
+            sender._deliver(reply, link.snr, link.rssi, self.path_hops(path) - 1)
+        else:
+            sender._deliver(reply, 0.0, 0, 0)
@@ -1,26 +1,46 @@
 import meshtastic
-import meshtastic.serial_interface
 import logging
 import threading
 import os
 import json
+import inspect
+import collections
+import functools
 from pubsub import pub
 from colorama import Fore, Style, init
 from typing import Union, Optional, Callable
-from meshtastic import channel_pb2, portnums_pb2, mesh_pb2
+from meshtastic import channel_pb2, portnums_pb2
 import time
 from datetime import datetime
-import timeago
-from tabulate import tabulate
 import base64
-import google.protobuf.json_format
 import platform
+from Class.metrics import REGISTRY
+from Class.packet_capture import PacketCapture
+from Class.node_cache import node_row
+from Class.dedup import PacketDeduplicator
+from Class.outbox import Outbox
+from Class.delta_sync import DELTA_NAK, DeltaSync
+from Class.bundle import BUNDLE_SUFFIX, pack_directory, unpack_bundle
+from Class import progressive
+from Class.reassembly import ReassemblyManager, TransferRejected
+from Class.file_source import ChunkFramer, MappedFile, payload_digest
+from Class.traceroute import TraceRouteTracker
+from Class.topology import DEFAULT_HOP_LIMIT, TopologyGraph
+from Class.coalescer import COALESCE, MULTI_IDENTIFIER, pack_messages, unpack_messages
+from Class import short_codec
+from Class.capabilities import CAPS, PeerCapabilities, format_caps, parse_caps
+from Class.worker_pool import WorkerPool
+from Class.async_core import run_cli
+from Class.config_transaction import ChannelTransaction
+from Class.multi_radio import RadioPool, open_radio, owns_interface, radio_node_id, radio_specs
+from Class.integrity import (CHUNK_CRC, CHUNK_REQUEST, VERDICT, VERDICT_HISTORY, TransferChecks, check_crc,
+                             format_request, format_verdict, parse_request, parse_verdict)
 
 # Initialize colorama
 init(autoreset=True)
 
-if platform.system() == "Linux":
-    from meshtastic.tunnel import Tunnel  # Import the Tunnel class
+# The tunnel (pytap2) and protobuf json_format are imported where they are
+# used, so starting the app doesn't pay for subsystems most sessions never touch
 
 # Enable logging but set to ERROR level to suppress debug/info messages
 logging.basicConfig(level=logging.ERROR)
@@ -31,42 +51,216 @@ CHUNK_SIZE = 100  # Chunk size in bytes
 BROADCAST_ADDR = "^all"
 
 class MeshtasticChatApp:
-    def __init__(self, dev_path, destination_id, on_receive_callback=None, timeout=10, retransmission_limit=3):
+    def __init__(self, dev_path, destination_id, on_receive_callback=None, timeout=10, retransmission_limit=3, interface=None, metrics=None, capture_path=None, on_node_updated_callback=None, outbox_path=None, on_outbox_callback=None, on_preview_callback=None):
         self.dev_path = dev_path
         self.destination_id = destination_id
         self.timeout = timeout
         self.retransmission_limit = retransmission_limit
-        self.interface = None
-        self.received_chunks = {}
-        self.acknowledged_chunks = set()
-        self.expected_chunks = {}
+        self.interface = interface  # An already open interface (e.g. a simulated one) skips the serial connect
+        self.retry_delay = 2  # Seconds to wait before retransmitting an unacknowledged chunk
+        # Inbound transfers by (sender, transfer id), with a memory budget and a spill directory
+        self.transfers = ReassemblyManager(os.path.join('received_files', '.partial')).start_evicting()
+        self.received_dir = 'received_files'  # Where completed inbound files are written
+        self.cancelled_transfers = set()  # (sender, file name) of inbound transfers we told the sender to stop
+        self.cancelled_sends = set()  # (destination, file name) of outbound transfers the receiver stopped
+        self.transfer_checks = TransferChecks()  # Chunks re-requested and integrity verdicts for outbound transfers
+        self.verdicts_sent = collections.OrderedDict()  # (sender, file name) -> our SHA-256 verdict, if it asks again
+        self.on_preview_callback = on_preview_callback  # Called with a dict each time a progressive preview is written
         self.on_receive_callback = on_receive_callback
+        self.on_node_updated_callback = on_node_updated_callback  # Called with the NodeDB entry the radio just updated
         self.tunnel = None  # Initialize the tunnel attribute
-        self._acknowledgment = type('', (), {})()  # Create an empty object to hold acknowledgment flags
-        self._acknowledgment.receivedTraceRoute = False
+        self.topology = TopologyGraph()  # Hop counts to other nodes, for per-destination hop limits
+        # Traces in flight by request id, and a TTL cache of their routes
+        self.traceroutes = TraceRouteTracker(self, on_route=self.topology.observe_route)
+        self.dedup = PacketDeduplicator()  # Drops rebroadcast copies and retransmitted chunks before parsing
+        self.metrics = metrics or REGISTRY
+        self._setup_metrics()
+        self.delta = DeltaSync(self, CHUNK_SIZE)
+        self.workers = WorkerPool()  # Delta and image encoding in processes, completed transfers in I/O threads
+        self.compress_text = True  # Send direct messages with the short-string codec to peers that support it
+        # Optional wire formats each peer has said it understands
+        self.capabilities = PeerCapabilities({short_codec.SHORT_CODEC, CHUNK_CRC, COALESCE})
+        # Text payloads that steer transfers rather than being chat messages
+        self.control_handlers = {
+            DELTA_NAK.encode('utf-8'): self.delta.on_delta_nak,
+            progressive.CANCEL.encode('utf-8'): self.on_cancel,
+            CAPS.encode('utf-8'): self.on_capabilities,
+            CHUNK_REQUEST.encode('utf-8'): self.on_chunk_request,
+            VERDICT.encode('utf-8'): self.on_verdict,
+        }
         
-        # Connect to the Meshtastic device
-        try:
-            self.interface = meshtastic.serial_interface.SerialInterface(devPath=self.dev_path)
-            print(Fore.LIGHTBLACK_EX + "Connected to the Meshtastic device successfully.")
-        except Exception as e:
-            print(Fore.LIGHTBLACK_EX + f"Failed to connect to the Meshtastic device: {str(e)}")
-            exit(1)
+        # Connect to the Meshtastic device, or to several ("COM3,tcp://192.168.1.20") driven as one RadioPool
+        if self.interface is None:
+            try:
+                specs = radio_specs(self.dev_path)
+                if len(specs) > 1:
+                    self.interface = RadioPool.open(specs)
+                else:
+                    self.interface = open_radio(specs[0] if specs else None)  # None lets meshtastic find the port
+                print(Fore.LIGHTBLACK_EX + "Connected to the Meshtastic device successfully.")
+            except Exception as e:
+                print(Fore.LIGHTBLACK_EX + f"Failed to connect to the Meshtastic device: {str(e)}")
+                exit(1)
+
+        # Per-destination hop limits need a sendData that takes hopLimit (not the case in meshtastic 2.3.13)
+        radios = getattr(self.interface, 'interfaces', None) or [self.interface]
+        self.hop_limit_tuning = all("hopLimit" in inspect.signature(radio.sendData).parameters for radio in radios)
+        self.topology.default_hop_limit = self._radio_hop_limit()
+        for node in list((self.interface.nodesByNum or {}).values()):
+            self.topology.observe_node(node)
         
         # Subscribe to received message events
         pub.subscribe(self.on_receive, "meshtastic.receive")
+        pub.subscribe(self.on_node_updated, "meshtastic.node.updated")
+
+        self.capture = None
+        if capture_path:
+            self.start_capture(capture_path)
+
+        # Undelivered messages and files wait here until their destination is heard again
+        self.outbox = Outbox(self._send_outbox_entry, path=outbox_path, on_change=on_outbox_callback,
+                             send_batch=self._send_outbox_batch,
+                             can_batch=lambda destination: self.capabilities.supports(destination, COALESCE)).start()
+        self.outbox.flush()  # Entries left over from the last run get one try now
+
+    def close(self):
+        """Stop the outbox and the idle-transfer sweep, let files still being saved finish, and unbind our gauges."""
+        self.outbox.close()
+        self.transfers.stop()
+        self.workers.shutdown()
+        for metric, function in self._bound_metrics:
+            metric.clear_function(function)  # Another app may have rebound it since
+
+    def start_capture(self, path):
+        """Record every received and sent packet to a capture file (see Class/packet_capture.py)"""
+        self.stop_capture()
+        self.capture = PacketCapture(path, self.interface).start()
+        print(Fore.LIGHTBLACK_EX + f"Capturing packets to {path}")
+
+    def stop_capture(self):
+        if self.capture:
+            self.capture.stop()
+            print(Fore.LIGHTBLACK_EX + f"Capture stopped, {self.capture.packets} packets written to {self.capture.path}")
+            self.capture = None
+
+    @property
+    def received_dir(self):
+        return self._received_dir
+
+    @received_dir.setter
+    def received_dir(self, path):
+        self._received_dir = path
+        self.transfers.spill_dir = os.path.join(path, '.partial')  # Large partial transfers live next to the files
+
+    def _setup_metrics(self):
+        m = self.metrics
+        self._bound_metrics = []  # (metric, function) pairs close() unbinds, so the registry lets go of this app
+        self.m_rx_packets = m.counter("packets_rx_total", "Packets received, by port")
+        self.m_tx_packets = m.counter("packets_tx_total", "Packets handed to the radio, by port")
+        self.m_acks = m.counter("acks_total", "Outcome of packets sent with wantAck (ack, nak, timeout)")
+        self.m_chunk_retries = m.counter("chunk_retries_total", "File chunks retransmitted after a missing ACK")
+        self.m_transfer_aborts = m.counter("transfer_aborts_total", "File transfers aborted after the retransmission limit")
+        self.m_radio_failovers = m.counter("radio_failovers_total", "Chunks a radio gave up on and left to the pool's other radios")
+        self._bind_metric(m.gauge("radios_connected", "Radios this app sends through that are still connected"),
+                          lambda: len(self.interface.connected()) if isinstance(self.interface, RadioPool) else 1)
+        self._bind_metric(m.gauge("worker_jobs_pending", "Jobs queued or running in the worker pool, by pool"),
+                          lambda: {pool: self.workers.stats()[f"{pool}_pending"] for pool in ("cpu", "io")}, label="pool")
+        self.m_files_received = m.counter("files_received_total", "Files reassembled and saved")
+        self.m_files_verified = m.counter("files_verified_total", "Inbound files checked against their SHA-256, by result")
+        self.m_corrupt_chunks = m.counter("corrupt_chunks_total", "Inbound chunks that failed their CRC and were re-requested")
+        self.m_chunks_resent = m.counter("chunks_resent_total", "Outbound chunks sent again because the receiver asked")
+        self.m_ack_rtt = m.histogram("ack_rtt_seconds", "Time from send to ACK for messages and data")
+        self.m_chunk_ack = m.histogram("chunk_ack_seconds", "Time from sending a file chunk to its ACK")
+        self.m_on_receive = m.histogram("on_receive_seconds", "Time spent handling one received packet",
+                                        buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+        self.m_inflight_chunks = m.gauge("inflight_chunks", "File chunks sent and awaiting an ACK")
+        self.m_hops_saved = m.counter("hops_saved_total",
+                                      "Hops trimmed off the default hop limit, summed over packets sent")
+        self._bind_metric(m.gauge("hop_limit_widened_nodes", "Destinations whose hop limit was widened after a failed delivery"),
+                          lambda: self.topology.stats()["widened"])
+        self.m_text_bytes_saved = m.counter("text_bytes_saved_total", "Bytes the short-string codec took off chat messages")
+        self.m_coalesced = m.counter("coalesced_messages_total", "Chat messages delivered packed with others in one packet")
+        self.m_channel_transactions = m.counter("channel_transactions_total",
+                                                "Channel transactions applied, by result (ok, mismatch, unverified, failed)")
+        self.m_traceroutes = m.counter("traceroutes_total", "Trace routes, by result (ok, timeout, cached)")
+        self.m_duplicates = m.counter("duplicate_packets_total", "Received packets dropped as duplicates")
+        self.m_transfers_rejected = m.counter("transfers_rejected_total",
+                                              "Inbound announcements and chunks refused by admission control")
+        self._bind_metric(m.gauge("inbound_transfers", "Partial inbound transfers being reassembled"),
+                          lambda: len(self.transfers.sessions))
+        self._bind_metric(m.gauge("reassembly_memory_bytes", "Chunk bytes of partial transfers held in memory"),
+                          lambda: self.transfers.memory_bytes)
+        self._bind_metric(m.counter("duplicate_packets_by_sender_total", "Duplicates dropped, by sender"),
+                          lambda: {f"!{num:08x}" if isinstance(num, int) else num: count
+                                   for num, count in self.dedup.duplicates.items()}, label="sender")
+        self._bind_metric(m.gauge("tunnel_queue_depth", "Packets waiting in the tunnel uplink queue"),
+                          lambda: (self.tunnel_queue_stats() or {}).get("depth"))
+        self._bind_metric(m.counter("tunnel_dropped_total", "Tunnel packets dropped, by reason"),
+                          self._tunnel_drop_counts, label="reason")
+
+    def _bind_metric(self, metric, function, label=None):
+        metric.set_function(function, label)
+        self._bound_metrics.append((metric, function))
+
+    def _tunnel_drop_counts(self):
+        stats = self.tunnel_queue_stats()
+        if not stats:
+            return None
+        return {"overflow": stats["overflow_drops"], "delay": stats["codel_drops"], "no_route": stats["no_route_drops"]}
 
     def set_destination_id(self, destination_id):
         self.destination_id = destination_id
 
     # Callback function to handle acknowledgment
     def on_ack(self, response, event):
+        routing = response.get('decoded', {}).get('routing') if response else None
+        if routing and routing.get('errorReason', 'NONE') != 'NONE':
+            # The radio gave up on the packet, don't treat the NAK as delivery
+            self.m_acks.inc(result="nak")
+            message = f"Delivery failed: {routing['errorReason']}"
+            print(Fore.MAGENTA + message)
+            if self.on_receive_callback:
+                self.on_receive_callback(message, message_type="WARNING")
+            return
         print(Fore.GREEN + "Acknowledgment received!")
+        self.m_acks.inc(result="ack")
         event.set()  # Signal that acknowledgment has been received
         if self.on_receive_callback:
                     self.on_receive_callback("Acknowledgment received!", message_type="SUCCESS")
                     
+    def on_node_updated(self, node, interface):
+        if not owns_interface(self.interface, interface):
+            return
+        self.outbox.note_activity(node.get("user", {}).get("id", node["num"]))
+        self.topology.observe_node(node)
+        if self.on_node_updated_callback:
+            self.on_node_updated_callback(node)
+
     def on_receive(self, packet, interface):
+        if not owns_interface(self.interface, interface):
+            return  # Published by another interface in this process
+        self.m_rx_packets.inc(port=packet.get('decoded', {}).get('portnum', 'ENCRYPTED'))
+        if 'from' in packet:
+            self.outbox.note_activity(packet['from'])  # Any copy means the node is in reach
+        if self.is_duplicate(packet):
+            self.m_duplicates.inc()
+            return
+        self.topology.observe_packet(packet)  # The first copy tells how many hops away the sender is
+        with self.m_on_receive.time():
+            self._process_packet(packet)
+
+    def is_duplicate(self, packet):
+        """True for another copy of a packet already handled (see Class/dedup.py)"""
+        payload = packet.get('decoded', {}).get('payload')
+        if not isinstance(payload, bytes):
+            payload = packet.get('encrypted', b'')
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        # A retransmitted chunk carries the same name and index under a new packet id
+        return self.dedup.is_duplicate(packet.get('from'), packet.get('id'), payload,
+                                       by_payload=payload.startswith(FILE_IDENTIFIER))
+
+    def _process_packet(self, packet):
         try:
             if 'decoded' in packet:
                 decoded = packet['decoded']
@@ -77,16 +271,34 @@ class MeshtasticChatApp:
                         if data.startswith(ANNOUNCE_IDENTIFIER):
                             # Handle file announcement
                             file_info = json.loads(data[len(ANNOUNCE_IDENTIFIER):].decode('utf-8'))
-                            file_name = file_info['name']
-                            file_size = file_info['size']
-                            total_chunks = file_info['total_chunks']
-                            self.expected_chunks[file_name] = total_chunks
-                            self.received_chunks[file_name] = [None] * total_chunks
-                            message = f"File announcement received: {file_name}, Size: {file_size} bytes, Total Chunks: {total_chunks}"
+                            if file_info.get('kind') == 'deltareq':
+                                # Not a transfer: the sender wants our checksums before sending a delta
+                                self.delta.on_delta_request(file_info, sender_id)
+                                return
+                            file_info['from'] = sender_id
+                            try:
+                                session = self.transfers.open(sender_id, file_info)
+                            except TransferRejected as e:
+                                self.m_transfers_rejected.inc()
+                                message = f"Refused file announcement from {sender_id}: {e}"
+                                print(Fore.MAGENTA + message)
+                                if self.on_receive_callback:
+                                    self.on_receive_callback(message, message_type="WARNING")
+                                return
+                            file_name = session.name
+                            self.dedup.forget_payloads(packet.get('from'))  # A resend of the same file is a new transfer
+                            self.cancelled_transfers.discard((sender_id, file_name))
+                            message = f"File announcement received: {file_name}, Size: {session.size} bytes, Total Chunks: {session.total_chunks}"
                             print(Fore.BLUE + message)
                             if self.on_receive_callback:
                                 self.on_receive_callback(message, message_type="INFO")
+                            if session.is_complete():  # An empty file has no chunks to wait for
+                                self.transfers.close(session, completed=True)
+                                self.complete_transfer(file_name, b'', sender_id, session.info)
                         elif data.startswith(FILE_IDENTIFIER):
+                            data = self.strip_chunk_crc(data, sender_id)
+                            if data is None:
+                                return  # Damaged on the way; not ACKed or stored
                             # Extract file name and file data
                             parts = data[len(FILE_IDENTIFIER):].split(b':', 3)
                             if len(parts) == 4:
@@ -95,22 +307,39 @@ class MeshtasticChatApp:
                                 total_chunks = int(parts[2])
                                 chunk_data = parts[3]
 
-                                if file_name not in self.received_chunks:
-                                    self.received_chunks[file_name] = [None] * total_chunks
+                                if (sender_id, file_name) in self.cancelled_transfers:
+                                    self.send_cancel(file_name, sender_id)  # Our CANCEL must have been lost
+                                    return
 
-                                if self.received_chunks[file_name][chunk_index] is None:
-                                    self.received_chunks[file_name][chunk_index] = chunk_data
+                                try:
+                                    session, is_new = self.transfers.add_chunk(sender_id, file_name, chunk_index,
+                                                                               total_chunks, chunk_data)
+                                except TransferRejected as e:
+                                    self.m_transfers_rejected.inc()
+                                    print(Fore.MAGENTA + f"Dropped a chunk from {sender_id}: {e}")
+                                    return
+                                if is_new:
                                     self.acknowledge_chunk(file_name, chunk_index, sender_id)  # Pass sender ID
 
-                                    if all(self.received_chunks[file_name]):
-                                        complete_data = b''.join(self.received_chunks[file_name])
-                                        self.save_file(file_name, complete_data)
+                                    if session.info.get('progressive'):
+                                        self.update_preview(session)
+                                    # session.sender is the announcing radio when this chunk came via another
+                                    if session.is_complete() and (session.sender, file_name) not in self.cancelled_transfers:
+                                        # Assembling, checking and saving run in the I/O pool, off this
+                                        # reader thread; submit blocks here if completions pile up
+                                        self.transfers.detach(session)
+                                        self.workers.submit_io(self.finish_transfer, session)
+                        elif data.startswith(short_codec.SHORT_IDENTIFIER):
+                            self.show_text_message(short_codec.decompress(data[len(short_codec.SHORT_IDENTIFIER):]),
+                                                   sender_id)
+                        elif data.startswith(MULTI_IDENTIFIER):
+                            # Messages the sender coalesced into one packet, each its own history entry
+                            for message in unpack_messages(data):
+                                self.show_text_message(message, sender_id)
+                        elif any(data.startswith(prefix) for prefix in self.control_handlers):
+                            self.dispatch_control(data, sender_id)
                         else:
-                            message = data.decode('utf-8').strip()
-                            if len(message) > 1:
-                                print(Fore.GREEN + f"Received message: {message}")
-                                if self.on_receive_callback:
-                                    self.on_receive_callback(f"{sender_id}: {message}", message_type="RECEIVED")
+                            self.show_text_message(data.decode('utf-8'), sender_id)
                     except UnicodeDecodeError:
                         print(Fore.LIGHTBLACK_EX + f"Received non-text payload: {decoded['payload']}")
                         if self.on_receive_callback:
@@ -177,54 +406,351 @@ class MeshtasticChatApp:
             if self.on_receive_callback:
                 self.on_receive_callback(error_message, message_type="ERROR")
                 
+    def show_text_message(self, text, sender_id):
+        message = text.strip()
+        if len(message) > 1:
+            print(Fore.GREEN + f"Received message: {message}")
+            if self.on_receive_callback:
+                self.on_receive_callback(f"{sender_id}: {message}", message_type="RECEIVED")
+
     def acknowledge_chunk(self, file_name, chunk_index, sender_id):
        """Send an acknowledgment for a received chunk to the sender."""
        ack_message = f"ACK:{file_name}:{chunk_index}"
-       self.interface.sendText(ack_message, sender_id)
+       # An ACK per chunk is most of a transfer's return traffic, so it gets the trimmed hop limit too
+       self.interface.sendData(ack_message.encode('utf-8'), sender_id, portNum=portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+                               **self._hop_args(self._hop_limit_for(sender_id)))
+       self.m_tx_packets.inc(port="TEXT_MESSAGE_APP")
        print(Fore.GREEN + f"Acknowledgment sent for chunk {chunk_index} of {file_name} to {sender_id}")
 
-    def request_missing_chunks(self, file_name):
+    def request_missing_chunks(self, file_name, sender_id=None):
         """Request missing chunks from the sender"""
-        missing_chunks = [i for i, chunk in enumerate(self.received_chunks[file_name]) if chunk is None]
+        sender_id = sender_id or self.destination_id
+        session = self.transfers.find(sender_id, file_name)
+        if session is None:
+            return
+        missing_chunks = [i for i in range(session.total_chunks) if not session.has(i)]
         if missing_chunks:
-            request_message = f"REQ:{file_name}:{','.join(map(str, missing_chunks))}"
-            self.interface.sendText(request_message, self.destination_id)
+            self.request_chunks(file_name, missing_chunks, sender_id)
             print(Fore.MAGENTA + f"Requesting missing chunks for {file_name}: {missing_chunks}")
 
+    def strip_chunk_crc(self, data, sender_id):
+        """A chunk frame without its CRC (as is for a transfer without CRCs), or None if the CRC doesn't match"""
+        file_name = data[len(FILE_IDENTIFIER):].split(b':', 1)[0].decode('utf-8', 'replace')
+        session = self.transfers.find(sender_id, file_name)
+        # A damaged name finds no session, but the sender's other transfers tell whether it sends CRCs
+        sessions = [session] if session else self.transfers.find_by_sender(sender_id)
+        if not any(candidate.info.get('crc') == CHUNK_CRC for candidate in sessions):
+            return data
+        checked = check_crc(data)
+        if checked is not None:
+            return checked
+        self.m_corrupt_chunks.inc()
+        try:
+            chunk_index = int(data[len(FILE_IDENTIFIER):].split(b':', 2)[1])
+        except (IndexError, ValueError):
+            chunk_index = None
+        if session is not None and chunk_index is not None and 0 <= chunk_index < session.total_chunks \
+                and not session.has(chunk_index):
+            # Only this chunk is sent again
+            print(Fore.MAGENTA + f"Chunk {chunk_index} of {file_name} from {sender_id} failed its CRC, requesting it again")
+            self.request_chunks(file_name, [chunk_index], session.sender)
+        else:
+            # Too damaged to tell which chunk it was; the sender's VERIFY query at the end finds the gap
+            print(Fore.MAGENTA + f"Dropped a damaged chunk from {sender_id}")
+        return None
+
+    def request_chunks(self, file_name, indexes, sender_id):
+        """Ask sender_id to send these chunks of file_name again (see Class/integrity.py)"""
+        try:
+            self.interface.sendData(format_request(file_name, indexes).encode('utf-8'), sender_id,
+                                    portNum=portnums_pb2.PortNum.PRIVATE_APP)
+            self.m_tx_packets.inc(port="PRIVATE_APP")
+        except Exception as e:
+            print(Fore.RED + f"Failed to request chunks of {file_name}: {str(e)}")
+
+    def send_verdict(self, file_name, verified, sender_id):
+        """Tell the sender of a CRC'd transfer whether the whole file matched its SHA-256 (None: ask the receiver)"""
+        if verified is not None:
+            self.verdicts_sent[(sender_id, file_name)] = verified
+            while len(self.verdicts_sent) > VERDICT_HISTORY:
+                self.verdicts_sent.popitem(last=False)
+        try:
+            self.interface.sendData(format_verdict(file_name, verified).encode('utf-8'), sender_id,
+                                    portNum=portnums_pb2.PortNum.PRIVATE_APP)
+            self.m_tx_packets.inc(port="PRIVATE_APP")
+        except Exception as e:
+            print(Fore.RED + f"Failed to report the check of {file_name}: {str(e)}")
+
+    # Sender: the receiver wants some chunks again, e.g. ones that failed their CRC
+    def on_chunk_request(self, argument, sender_id):
+        file_name, indexes = parse_request(argument)
+        if not self.transfer_checks.request((str(sender_id).lower(), file_name), indexes):
+            logging.info(f"{sender_id} asked for chunks of {file_name}, which isn't being sent")
+
+    # Sender: the receiver's SHA-256 check of a whole CRC'd transfer. Receiver: the sender asking for it
+    def on_verdict(self, argument, sender_id):
+        file_name, verified = parse_verdict(argument)
+        if verified is not None:
+            self.transfer_checks.report((str(sender_id).lower(), file_name), verified)
+            return
+        session = self.transfers.find(sender_id, file_name)
+        if session is not None:
+            # Chunks that were lost or too damaged to re-request at the time
+            missing = [i for i in range(session.total_chunks) if not session.has(i)]
+            if missing:
+                self.request_chunks(file_name, missing, sender_id)
+        elif (sender_id, file_name) in self.verdicts_sent:
+            self.send_verdict(file_name, self.verdicts_sent[(sender_id, file_name)], sender_id)  # Ours was lost
+
+    def dispatch_control(self, data, sender_id):
+        """Pass a control text (e.g. CANCEL:name) to its handler as (argument, sender)"""
+        for prefix, handler in self.control_handlers.items():
+            if data.startswith(prefix):
+                handler(data[len(prefix):].decode('utf-8'), sender_id)
+                return
+
+    # Function to write the renderable part of a progressive transfer for the UI
+    def update_preview(self, session):
+        file_info, file_name = session.info, session.name
+        received = session.received
+        step = max(1, session.total_chunks // progressive.PREVIEW_STEPS)
+        if received - file_info.get('preview_at', 0) < step or received == session.total_chunks:
+            return  # The finished file replaces the preview
+        data = progressive.preview_bytes(session.chunk_list(), CHUNK_SIZE)
+        if data is None:
+            return
+        path = progressive.preview_path(self.received_dir, file_name)
+        try:
+            progressive.write_preview(path, data)
+        except OSError as e:
+            logging.warning(f"Failed to write the preview of {file_name}: {e}")
+            return
+        file_info['preview_at'] = received
+        if self.on_preview_callback:
+            self.on_preview_callback({"name": file_name, "from": file_info.get('from'), "path": path,
+                                      "received": received, "total": session.total_chunks, "done": False})
+
+    # Function to stop an inbound transfer, e.g. once its preview is good enough
+    def cancel_transfer(self, file_name, sender_id=None):
+        sessions = [self.transfers.find(sender_id, file_name)] if sender_id else self.transfers.find_by_name(file_name)
+        session = next((session for session in sessions if session), None)
+        file_info = session.info if session else {}
+        sender_id = sender_id or file_info.get('from') or self.destination_id
+        self.cancelled_transfers.add((sender_id, file_name))
+        if session:
+            self.transfers.close(session)
+        self.send_cancel(file_name, sender_id)
+        message = f"Cancelled {file_name} from {sender_id}"
+        if file_info.get('preview_at'):
+            message += f", the preview is in {progressive.preview_path(self.received_dir, file_name)}"
+        print(Fore.MAGENTA + message)
+        if self.on_receive_callback:
+            self.on_receive_callback(message, message_type="INFO")
+
+    def send_control(self, text, destination_id):
+        """Send a control text (CANCEL:, DELTANAK:...) on the private port, so other clients don't show it as chat"""
+        self.interface.sendData(text.encode('utf-8'), destination_id, portNum=portnums_pb2.PortNum.PRIVATE_APP)
+        self.m_tx_packets.inc(port="PRIVATE_APP")
+
+    def send_cancel(self, file_name, sender_id):
+        self.send_control(f"{progressive.CANCEL}{file_name}", sender_id)
+
+    # Sender: the receiver doesn't want the rest of file_name
+    def on_cancel(self, file_name, sender_id):
+        self.cancelled_sends.add((str(sender_id).lower(), file_name))
+
+    def finish_transfer(self, session):
+        """Assemble a detached, complete session and hand it on; runs in the worker pool's I/O threads"""
+        try:
+            try:
+                complete_data = session.assemble()
+            finally:
+                session.discard()
+            self.complete_transfer(session.name, complete_data, session.sender, session.info,
+                                   verified=session.digest_matches())
+        except Exception as e:
+            logging.exception(f"Failed to finish {session.name} from {session.sender}")
+            if self.on_receive_callback:
+                self.on_receive_callback(f"Failed to save {session.name}: {e}", message_type="ERROR")
+
+    def complete_transfer(self, file_name, file_data, sender_id, file_info=None, verified=None):
+        """Hand a fully received transfer to whatever its FILEINFO kind says it is"""
+        file_info = file_info or {}
+        if file_info.get('digest'):
+            if verified is None:  # Not hashed on the way in
+                verified = payload_digest(file_data) == file_info['digest']
+            self.m_files_verified.inc(result="ok" if verified else "failed")
+            if file_info.get('crc') == CHUNK_CRC:
+                self.send_verdict(file_name, verified, sender_id)
+            if not verified:
+                message = f"Discarded {file_name} from {sender_id}: its SHA-256 doesn't match the announcement"
+                print(Fore.RED + message)
+                if self.on_receive_callback:
+                    self.on_receive_callback(message, message_type="ERROR")
+                return
+            message = f"Verified {file_name} from {sender_id}: SHA-256 matches"
+            print(Fore.GREEN + message)
+            if self.on_receive_callback:
+                self.on_receive_callback(message, message_type="SUCCESS")
+        if file_info.get('progressive'):
+            path = progressive.preview_path(self.received_dir, file_name)
+            if os.path.exists(path):
+                os.remove(path)
+            if self.on_preview_callback:
+                total = file_info['total_chunks']
+                self.on_preview_callback({"name": file_name, "from": sender_id,
+                                          "path": os.path.join(self.received_dir, file_name),
+                                          "received": total, "total": total, "done": True})
+        kind = file_info.get('kind')
+        if kind == 'signature':
+            self.delta.on_signature(file_info, file_data, sender_id)
+        elif kind == 'delta':
+            self.delta.on_delta(file_info, file_data, sender_id)
+        elif kind == 'bundle':
+            self.save_bundle(file_data)
+        else:
+            self.save_file(file_name, file_data)
+
     # Function to save a received file
     def save_file(self, file_name, file_data):
         try:
-            file_path = os.path.join('received_files', file_name)
+            file_path = os.path.join(self.received_dir, file_name)
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             with open(file_path, 'wb') as file:
                 file.write(file_data)
+            self.m_files_received.inc()
             print(Fore.GREEN + f"File saved: {file_path}")
         except Exception as e:
             print(Fore.RED + f"Failed to save file: {str(e)}")
 
+    # Function to unpack a received bundle into its own directory
+    def save_bundle(self, bundle_data):
+        try:
+            directory = unpack_bundle(bundle_data, self.received_dir)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            message = f"Failed to unpack bundle: {str(e)}"
+            print(Fore.RED + message)
+            if self.on_receive_callback:
+                self.on_receive_callback(message, message_type="ERROR")
+            return
+        self.m_files_received.inc()
+        message = f"Folder saved: {directory}"
+        print(Fore.GREEN + message)
+        if self.on_receive_callback:
+            self.on_receive_callback(message, message_type="SUCCESS")
+
+    def _radio_hop_limit(self):
+        """The hop limit the radio sends with by default (its LoRa config, 0 meaning the firmware default)"""
+        lora = getattr(getattr(self.interface.localNode, 'localConfig', None), 'lora', None)
+        return getattr(lora, 'hop_limit', 0) or DEFAULT_HOP_LIMIT
+
+    def _hop_limit_for(self, destination_id):
+        """Hop limit for a packet to destination_id, or None for the radio's default (see Class/topology.py)"""
+        if not self.hop_limit_tuning:
+            return None
+        hop_limit = self.topology.hop_limit(destination_id)
+        if hop_limit is not None:
+            self.m_hops_saved.inc(self.topology.default_hop_limit - hop_limit)
+        return hop_limit
+
+    @staticmethod
+    def _hop_args(hop_limit):
+        return {"hopLimit": hop_limit} if hop_limit is not None else {}
+
     # Function to send a text message
     def send_text_message(self, text, channel_index, destination_id=None):
         ack_event = threading.Event()  # Create an event object to wait for acknowledgment
-
-        def callback(response):
-            self.on_ack(response, ack_event)
-        
+        destination_id = destination_id if destination_id else self.destination_id
+        payload, port = self.text_payload(text, destination_id)
         try:
             print(Fore.LIGHTBLACK_EX + "Attempting to send message...")
-            sent_packet = self.interface.sendText(
-                text=text,
-                destinationId=destination_id if destination_id else self.destination_id,
-                wantAck=True,
-                wantResponse=True,
-                onResponse=callback,
-                channelIndex=channel_index
-            )
+            sent_packet, hop_limit = self.send_acked(payload, port, channel_index, destination_id, ack_event)
+            sent_at = time.perf_counter()
             print(Fore.LIGHTBLACK_EX + f"Message sent with ID: {sent_packet.id}")
             ack_event.wait(timeout=self.timeout)  # Wait for acknowledgment or timeout after the set period
-            if not ack_event.is_set():
-                print(Fore.MAGENTA + "Acknowledgment not received within timeout period.")
+            self.record_ack(destination_id, ack_event.is_set(), hop_limit, sent_at, "text")
+            return ack_event.is_set()
         except Exception as e:
             print(Fore.RED + f"Failed to send message: {str(e)}")
+            return False
+
+    def text_payload(self, text, destination_id):
+        """(payload, port) a chat message to destination_id goes out as"""
+        if self.compress_text:
+            compressed = self.compress_for(text, destination_id)
+            if compressed is not None:
+                # Other clients ignore the private port, so the binary payload never shows up as garbled text
+                return compressed, portnums_pb2.PortNum.PRIVATE_APP
+        return text.encode('utf-8'), portnums_pb2.PortNum.TEXT_MESSAGE_APP
+
+    def send_acked(self, payload, port, channel_index, destination_id, ack_event):
+        """Send payload asking for an ACK, without waiting for it: ack_event.set() is called when it comes.
+
+        ack_event is anything with set(), e.g. a threading.Event or an asyncio bridge (Class/async_core.py).
+        Returns (sent packet, hop limit used); raises if the radio can't send.
+        """
+        hop_limit = self._hop_limit_for(destination_id)
+        # sendText can't ask for plain ACKs to reach onResponse, so send the text port directly
+        sent_packet = self.interface.sendData(
+            payload,
+            destinationId=destination_id,
+            portNum=port,
+            wantAck=True,
+            wantResponse=True,
+            onResponse=lambda response: self.on_ack(response, ack_event),
+            onResponseAckPermitted=True,
+            channelIndex=channel_index,
+            **self._hop_args(hop_limit)
+        )
+        self.m_tx_packets.inc(port=portnums_pb2.PortNum.Name(port))
+        return sent_packet, hop_limit
+
+    def record_ack(self, destination_id, acked, hop_limit, sent_at, kind):
+        """Account for the ACK (or its timeout) of a packet sent at sent_at (perf_counter)"""
+        if not acked:
+            self.m_acks.inc(result="timeout")
+            print(Fore.MAGENTA + "Acknowledgment not received within timeout period.")
+        else:
+            self.m_ack_rtt.observe(time.perf_counter() - sent_at, kind=kind)
+        self.topology.record_delivery(destination_id, acked, hop_limit)
+
+    def compress_for(self, text, destination_id):
+        """text with the short-string codec if destination_id supports it and it gets smaller, else None"""
+        if not self.capabilities.supports(destination_id, short_codec.SHORT_CODEC):
+            if self.capabilities.query_due(destination_id):
+                self.send_capabilities(destination_id, query=True)  # This message goes plain; later ones may not
+            return None
+        compressed = short_codec.encode_message(text)
+        if compressed is not None:
+            self.m_text_bytes_saved.inc(len(text.encode('utf-8')) - len(compressed))
+        return compressed
+
+    def send_capabilities(self, destination_id, query=False):
+        """Tell destination_id which optional formats we understand (and, with query, ask for its list)"""
+        try:
+            # On the private port, so clients that don't know CAPS don't show it as a chat message
+            self.interface.sendData(format_caps(self.capabilities.local, query).encode('utf-8'), destination_id,
+                                    portNum=portnums_pb2.PortNum.PRIVATE_APP)
+            self.m_tx_packets.inc(port="PRIVATE_APP")
+        except Exception as e:
+            print(Fore.RED + f"Failed to send capabilities: {str(e)}")
+
+    def on_capabilities(self, argument, sender_id):
+        query, capabilities = parse_caps(argument)
+        self.capabilities.learn(sender_id, capabilities)
+        if query:
+            self.send_capabilities(sender_id)
+
+    # Function to send several messages to one node as a single packet (see Class/coalescer.py)
+    def send_text_batch(self, texts, channel_index, destination_id=None):
+        destination_id = destination_id if destination_id else self.destination_id
+        if not self.capabilities.supports(destination_id, COALESCE):
+            # Other clients would take MULTIMSG: for data (yet ACK it), so they get one message per packet
+            return all([self.send_text_message(text, channel_index, destination_id) for text in texts])
+        delivered = self.send_data(pack_messages(texts), channel_index, destination_id)
+        if delivered:
+            self.m_coalesced.inc(len(texts))
+        return delivered
 
     # Function to send a group message to the entire mesh
     def send_group_message(self, text, channel_index):
@@ -237,172 +763,360 @@ class MeshtasticChatApp:
                 wantResponse=False,  # No response needed for group messages
                 channelIndex=channel_index
             )
+            self.m_tx_packets.inc(port="TEXT_MESSAGE_APP")
             print(Fore.LIGHTBLACK_EX + f"Group message sent with ID: {sent_packet.id}")
         except Exception as e:
             print(Fore.RED + f"Failed to send group message: {str(e)}")
 
-    def announce_file(self, file_name, file_size, total_chunks):
+    def announce_file(self, file_name, file_size, total_chunks, destination_id=None, extra=None):
         """Announce the file details before sending chunks"""
         file_info = {
             "name": file_name,
             "size": file_size,
-            "total_chunks": total_chunks
+            "total_chunks": total_chunks,
+            "tid": os.urandom(4).hex()  # Lets the receiver tell this transfer from another of the same name
         }
-        message = ANNOUNCE_IDENTIFIER + json.dumps(file_info).encode('utf-8')
-        self.send_data(message, 0)
+        if extra:
+            file_info.update(extra)  # e.g. the kind of a delta-sync transfer
+        message = ANNOUNCE_IDENTIFIER + json.dumps(file_info, separators=(',', ':')).encode('utf-8')
+        return self.send_data(message, 0, destination_id)
 
     # Function to send data in chunks with retransmission
-    def send_data_in_chunks(self, data, file_name, progress_callback: Optional[Callable[[int, int], None]] = None, channel_index=0):
-        def callback(response, event):
-            self.on_ack(response, event)
+    def send_data_in_chunks(self, data, file_name, progress_callback: Optional[Callable[[int, int], None]] = None, channel_index=0, destination_id=None, announce_extra=None, order=None):
+        # data may be bytes or a MappedFile's view; chunks are sliced from it without copying.
+        # The view is released on the way out so a mapped file can be closed even after an error
+        with memoryview(data) as view:
+            return self._send_chunks(view, file_name, progress_callback, channel_index, destination_id,
+                                     announce_extra, order)
+
+    def _send_chunks(self, view, file_name, progress_callback, channel_index, destination_id, announce_extra, order):
+        destination_id = destination_id if destination_id else self.destination_id
+        total_chunks = (len(view) + CHUNK_SIZE - 1) // CHUNK_SIZE
+        cancel_key = (str(destination_id).lower(), file_name)
+        self.cancelled_sends.discard(cancel_key)
+        radios = self._transfer_radios(destination_id)
+        crc = self.chunk_crc_for(destination_id)
+        # The receiver checks the reassembled file against this digest
+        announce_extra = {"digest": payload_digest(view), **(announce_extra or {})}
+        if crc:
+            announce_extra["crc"] = CHUNK_CRC  # Chunks end in a CRC-32; bad ones are re-requested
+        if len(radios) > 1:
+            announce_extra["via"] = [radio_node_id(radio) for radio in radios]  # Chunks may come from any of these
+        self.transfer_checks.open(cancel_key)
+        try:
+            if not self.announce_file(file_name, len(view), total_chunks, destination_id, announce_extra):
+                print(Fore.RED + f"File announcement for {file_name} was not acknowledged. Aborting.")
+                return False  # Don't spend airtime on chunks nobody is listening for
 
-        total_chunks = (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE
-        self.announce_file(file_name, len(data), total_chunks)
+            # order lets a progressive transfer send the chunks a preview needs first
+            chunks = list(order) if order is not None else range(total_chunks)
+            if len(radios) > 1:
+                return self._send_chunks_parallel(view, file_name, chunks, total_chunks, radios, progress_callback,
+                                                  channel_index, destination_id, cancel_key, crc)
+            framer = ChunkFramer(FILE_IDENTIFIER, file_name, CHUNK_SIZE, crc=crc)
+            for sent, i in enumerate(chunks):
+                if cancel_key in self.cancelled_sends:
+                    return self._send_stopped(cancel_key, sent, total_chunks)
+                if not self._send_chunk(framer, view, i, total_chunks, channel_index, destination_id):
+                    self.m_transfer_aborts.inc()
+                    print(Fore.RED + f"Failed to send chunk {i+1}/{total_chunks} after {self.retransmission_limit} attempts. Aborting.")
+                    return False  # Abort if the maximum number of retransmissions is reached
+                if progress_callback:
+                    progress_callback(sent + 1, total_chunks)
+                requested = self.transfer_checks.take_requests(cancel_key) if crc else ()
+                if requested and not self._resend_chunks(framer, view, requested, total_chunks, channel_index,
+                                                         destination_id):
+                    return False
+            return self._await_verdict(view, file_name, total_chunks, channel_index, destination_id) if crc else True
+        finally:
+            self.transfer_checks.close(cancel_key)
 
-        for i in range(total_chunks):
-            start = i * CHUNK_SIZE
-            end = start + CHUNK_SIZE
-            chunk = data[start:end]
-            chunk_identifier = FILE_IDENTIFIER + f'{file_name}:{i}:{total_chunks}'.encode('utf-8') + b':'
-            chunk_data = chunk_identifier + chunk
+    def _send_chunks_parallel(self, view, file_name, chunks, total_chunks, radios, progress_callback, channel_index,
+                              destination_id, cancel_key, crc):
+        """Spread the chunks over several radios: one sender each, all taking the next chunk from one queue.
+
+        A radio that disconnects, or can't get a chunk through in
+        retransmission_limit attempts, puts that chunk back for the others and
+        stops; the transfer fails only when no radio is left to send it.
+        """
+        pending = collections.deque(chunks)
+        state = {"in_flight": 0}
+        delivered_chunks = set()
+        changed = threading.Condition()
+
+        def next_chunk():
+            with changed:
+                pending.extendleft(reversed(self.transfer_checks.take_requests(cancel_key)))  # Re-requests go first
+                while not pending and state["in_flight"]:
+                    changed.wait()  # A chunk in flight on another radio may yet come back
+                if not pending or cancel_key in self.cancelled_sends:
+                    return None
+                state["in_flight"] += 1
+                return pending.popleft()
+
+        def sender(radio):
+            framer = ChunkFramer(FILE_IDENTIFIER, file_name, CHUNK_SIZE, crc=crc)
+            while True:
+                i = next_chunk()
+                if i is None:
+                    return
+                delivered = self._send_chunk(framer, view, i, total_chunks, channel_index, destination_id, radio)
+                with changed:
+                    state["in_flight"] -= 1
+                    if delivered:
+                        delivered_chunks.add(i)
+                        sent = len(delivered_chunks)
+                    else:
+                        pending.appendleft(i)
+                    changed.notify_all()
+                if not delivered:
+                    self.m_radio_failovers.inc()
+                    print(Fore.MAGENTA + f"Radio {radio_node_id(radio)} gave up on chunk {i+1}/{total_chunks}, "
+                                         f"leaving it to the other radios.")
+                    return
+                if progress_callback:
+                    progress_callback(sent, total_chunks)
 
-            retries = 0
-            while retries < self.retransmission_limit:
-                ack_event = threading.Event()  # Create an event object to wait for acknowledgment
+        threads = [threading.Thread(target=sender, args=(radio,), daemon=True) for radio in radios]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if cancel_key in self.cancelled_sends:
+            return self._send_stopped(cancel_key, len(delivered_chunks), total_chunks)
+        if pending:
+            self.m_transfer_aborts.inc()
+            print(Fore.RED + f"Failed to send {len(pending)} of {total_chunks} chunks: no radio could deliver them. Aborting.")
+            return False
+        return self._await_verdict(view, file_name, total_chunks, channel_index, destination_id) if crc else True
 
-                print(Fore.LIGHTBLACK_EX + f"Sending chunk {i+1}/{total_chunks}, attempt {retries + 1}...")
-                sent_packet = self.interface.sendData(
+    def _resend_chunks(self, framer, view, indexes, total_chunks, channel_index, destination_id):
+        """Send again chunks the receiver re-requested; False if one of them can't be delivered"""
+        for i in indexes:
+            if not 0 <= i < total_chunks:
+                continue  # Named by a damaged chunk header
+            print(Fore.MAGENTA + f"Resending chunk {i+1}/{total_chunks}, the receiver asked for it again")
+            self.m_chunks_resent.inc()
+            if not self._send_chunk(framer, view, i, total_chunks, channel_index, destination_id):
+                self.m_transfer_aborts.inc()
+                print(Fore.RED + f"Failed to resend chunk {i+1}/{total_chunks}. Aborting.")
+                return False
+        return True
+
+    def _await_verdict(self, view, file_name, total_chunks, channel_index, destination_id):
+        """After the last chunk of a CRC'd transfer: resend what the receiver asks for until it reports its SHA-256 check"""
+        key = (str(destination_id).lower(), file_name)
+        framer = ChunkFramer(FILE_IDENTIFIER, file_name, CHUNK_SIZE, crc=True)
+        queries = 0
+        while True:
+            requested, verified = self.transfer_checks.wait(key, self.timeout)
+            if requested:
+                if not self._resend_chunks(framer, view, requested, total_chunks, channel_index, destination_id):
+                    return False
+                continue
+            if verified is not None or queries == self.retransmission_limit:
+                break
+            # Our last chunk's REQ or the verdict may have been lost, or a chunk too damaged to name
+            queries += 1
+            self.send_verdict(file_name, None, destination_id)
+        if verified is None:
+            message, message_type, color = f"{destination_id} didn't report its check of {file_name}", "WARNING", Fore.MAGENTA
+        elif verified:
+            message, message_type, color = f"{destination_id} verified {file_name}: SHA-256 matches", "SUCCESS", Fore.GREEN
+        else:
+            message, message_type, color = f"{destination_id} discarded {file_name}: SHA-256 mismatch", "ERROR", Fore.RED
+        print(color + message)
+        if self.on_receive_callback:
+            self.on_receive_callback(message, message_type=message_type)
+        return verified is not False  # Without a report the chunks were still all acknowledged
+
+    def _send_chunk(self, framer, view, i, total_chunks, channel_index, destination_id, radio=None):
+        """Send chunk i until it is acknowledged; False after retransmission_limit attempts or if radio goes down"""
+        def callback(response, event):
+            self.on_ack(response, event)
+
+        start = i * CHUNK_SIZE
+        chunk_data = framer.frame(i, total_chunks, view[start:start + CHUNK_SIZE])
+        for attempt in range(self.retransmission_limit):
+            if attempt:
+                self.m_chunk_retries.inc()
+                time.sleep(self.retry_delay)  # Add a small delay before retrying
+            ack_event = threading.Event()  # Create an event object to wait for acknowledgment
+
+            print(Fore.LIGHTBLACK_EX + f"Sending chunk {i+1}/{total_chunks}, attempt {attempt + 1}...")
+            hop_limit = self._hop_limit_for(destination_id)  # Asked again on a retry, which may have widened it
+            send = self.interface.sendData if radio is None else functools.partial(self.interface.send_via, radio)
+            try:
+                sent_packet = send(
                     data=chunk_data,
-                    destinationId=self.destination_id,
+                    destinationId=destination_id,
                     wantAck=True,
                     wantResponse=True,
                     onResponse=lambda response: callback(response, ack_event),
-                    channelIndex=channel_index
+                    onResponseAckPermitted=True,
+                    channelIndex=channel_index,
+                    **self._hop_args(hop_limit)
                 )
-                print(Fore.LIGHTBLACK_EX + f"Chunk {i+1}/{total_chunks} sent with ID: {sent_packet.id}")
+            except ConnectionError:
+                if radio is None:
+                    raise
+                return False  # This radio is gone; the pool has marked it down
+            sent_at = time.perf_counter()
+            self.m_tx_packets.inc(port="PRIVATE_APP")
+            self.m_inflight_chunks.inc()
+            print(Fore.LIGHTBLACK_EX + f"Chunk {i+1}/{total_chunks} sent with ID: {sent_packet.id}")
+            if radio is None:
                 ack_event.wait(timeout=self.timeout)  # Wait for acknowledgment or timeout after the set period
+            elif not self.interface.wait(ack_event, radio, self.timeout) and not self.interface.is_connected(radio):
+                self.m_inflight_chunks.dec()
+                return False  # Its ACK can't come back through a radio that's gone
+            self.m_inflight_chunks.dec()
+            self.topology.record_delivery(destination_id, ack_event.is_set(), hop_limit)
 
-                if ack_event.is_set():
-                    self.acknowledged_chunks.add((file_name, i))
-                    if progress_callback:
-                        progress_callback(i + 1, total_chunks)
-                    break
-                else:
-                    print(Fore.MAGENTA + f"Acknowledgment not received for chunk {i+1}/{total_chunks} within timeout period.")
-                    retries += 1
-                    time.sleep(2)  # Add a small delay before retrying
+            if ack_event.is_set():
+                self.m_chunk_ack.observe(time.perf_counter() - sent_at)
+                return True
+            print(Fore.MAGENTA + f"Acknowledgment not received for chunk {i+1}/{total_chunks} within timeout period.")
+            self.m_acks.inc(result="timeout")
+        return False
+
+    def chunk_crc_for(self, destination_id):
+        """True if chunks to destination_id can carry CRCs (it advertised CHUNK_CRC); asks it otherwise"""
+        if destination_id == BROADCAST_ADDR:
+            return False
+        if self.capabilities.supports(destination_id, CHUNK_CRC):
+            return True
+        if self.capabilities.query_due(destination_id):
+            self.send_capabilities(destination_id, query=True)  # This transfer goes without; later ones may not
+        return False
+
+    def _send_stopped(self, cancel_key, sent, total_chunks):
+        destination_id, file_name = cancel_key
+        self.cancelled_sends.discard(cancel_key)
+        message = f"{destination_id} stopped {file_name} after {sent}/{total_chunks} chunks"
+        print(Fore.MAGENTA + message)
+        if self.on_receive_callback:
+            self.on_receive_callback(message, message_type="INFO")
+        return True  # The receiver has what it wanted
 
-            if retries == self.retransmission_limit:
-                print(Fore.RED + f"Failed to send chunk {i+1}/{total_chunks} after {self.retransmission_limit} attempts. Aborting.")
-                return  # Abort if the maximum number of retransmissions is reached
+    def _transfer_radios(self, destination_id):
+        """The radios a file to destination_id is spread over: those of a RadioPool that heard it lately, else [None]"""
+        if not isinstance(self.interface, RadioPool) or destination_id == BROADCAST_ADDR:
+            return [None]
+        radios = self.interface.routes(destination_id, fresh_only=True)
+        return radios if len(radios) > 1 else [None]
+
+    # Function to send a file from disk without reading it all into memory first
+    def send_file(self, file_path, progress_callback=None, channel_index=0, destination_id=None, file_name=None):
+        with MappedFile(file_path) as source:
+            return self.send_data_in_chunks(source.view, file_name or os.path.basename(file_path), progress_callback,
+                                            channel_index, destination_id)
+
+    # Function to send an image so the receiver can render it before the last chunk arrives
+    def send_progressive(self, data, file_name, progress_callback=None, channel_index=0, destination_id=None):
+        source = bytes(data)
+        data = self.workers.run_cpu(progressive.make_progressive, source)
+        if data != source:
+            print(Fore.YELLOW + f"Re-encoded {file_name} as a progressive JPEG to send it ({len(source)} -> "
+                                f"{len(data)} bytes); the receiver gets the transcoded copy, metadata kept")
+        return self.send_data_in_chunks(data, file_name, progress_callback, channel_index, destination_id,
+                                        {"progressive": True}, progressive.chunk_order(data, CHUNK_SIZE))
 
     # Function to send data
-    def send_data(self, data, channel_index):
+    def send_data(self, data, channel_index, destination_id=None):
         ack_event = threading.Event()  # Create an event object to wait for acknowledgment
-
-        def callback(response):
-            self.on_ack(response, ack_event)
-        
+        destination_id = destination_id if destination_id else self.destination_id
         try:
             print(Fore.LIGHTBLACK_EX + "Attempting to send data...")
-            sent_packet = self.interface.sendData(
-                data=data,
-                destinationId=self.destination_id,
-                wantAck=True,
-                wantResponse=True,
-                onResponse=callback,
-                channelIndex=channel_index
-            )
+            sent_packet, hop_limit = self.send_acked(data, portnums_pb2.PortNum.PRIVATE_APP, channel_index,
+                                                     destination_id, ack_event)
+            sent_at = time.perf_counter()
             print(Fore.LIGHTBLACK_EX + f"Data sent with ID: {sent_packet.id}")
             ack_event.wait(timeout=self.timeout)  # Wait for acknowledgment or timeout after the set period
-            if not ack_event.is_set():
-                print(Fore.MAGENTA + "Acknowledgment not received within timeout period.")
+            self.record_ack(destination_id, ack_event.is_set(), hop_limit, sent_at, "data")
+            return ack_event.is_set()
         except Exception as e:
             print(Fore.RED + f"Failed to send data: {str(e)}")
+            return False
+
+    # Function to queue a message in the outbox until its destination acknowledges it
+    def queue_text_message(self, text, channel_index, destination_id=None):
+        return self.outbox.add("text", destination_id if destination_id else self.destination_id,
+                               channel_index, text=text)
+
+    # Function to queue a file in the outbox until its destination acknowledges it
+    def queue_file(self, data, file_name, channel_index=0, destination_id=None, delta=False, progressive=False):
+        return self.outbox.add("file", destination_id if destination_id else self.destination_id,
+                               channel_index, name=file_name, size=len(data), data=data, delta=delta,
+                               progressive=progressive)
+
+    # Function to queue a file on disk; it is read (mapped) only when its turn comes
+    def queue_path(self, file_path, channel_index=0, destination_id=None, delta=False, progressive=False):
+        file_path = os.path.abspath(file_path)
+        return self.outbox.add("file", destination_id if destination_id else self.destination_id,
+                               channel_index, name=os.path.basename(file_path), size=os.path.getsize(file_path),
+                               path=file_path, delta=delta, progressive=progressive)
+
+    # Function to queue every file under a directory as one bundle transfer
+    def queue_folder(self, directory, channel_index=0, destination_id=None):
+        name, bundle, file_count = pack_directory(directory)
+        return self.queue_bundle(bundle, name, file_count, channel_index, destination_id)
+
+    def queue_bundle(self, bundle, name, file_count, channel_index=0, destination_id=None):
+        return self.outbox.add("bundle", destination_id if destination_id else self.destination_id,
+                               channel_index, name=name + BUNDLE_SUFFIX, size=len(bundle), data=bundle,
+                               files=file_count)
+
+    def _send_outbox_entry(self, entry):
+        delivered = self._send_outbox_payload(entry)
+        if entry["kind"] in ("file", "bundle"):
+            # Set by _send_chunks when the receiver reported its SHA-256 check
+            self.outbox.report_verified(entry, self.transfer_checks.results.get(
+                (str(entry["destination"]).lower(), entry["name"])))
+        return delivered
+
+    def _send_outbox_payload(self, entry):
+        if entry["kind"] == "text":
+            return self.send_text_message(entry["text"], entry["channel_index"], entry["destination"])
+        if entry["kind"] == "file":
+            progress_callback = lambda current, total: self.outbox.report_progress(entry, current, total)
+            if entry.get("data") is None and not (entry.get("delta") or entry.get("progressive")):
+                return self.send_file(entry["path"], progress_callback, entry["channel_index"], entry["destination"],
+                                      entry["name"])
+            data = entry.get("data")
+            if data is None:
+                with open(entry["path"], 'rb') as file:
+                    data = file.read()  # Delta and progressive sends work on the whole file
+            if entry.get("delta"):
+                return self.delta.send_file(data, entry["name"], None, progress_callback,
+                                            entry["channel_index"], entry["destination"])
+            if entry.get("progressive"):
+                return self.send_progressive(data, entry["name"], progress_callback,
+                                             entry["channel_index"], entry["destination"])
+            return self.send_data_in_chunks(data, entry["name"], progress_callback,
+                                            entry["channel_index"], entry["destination"])
+        if entry["kind"] == "bundle":
+            return self.send_data_in_chunks(
+                entry["data"], entry["name"],
+                lambda current, total: self.outbox.report_progress(entry, current, total),
+                entry["channel_index"], entry["destination"], {"kind": "bundle", "files": entry["files"]})
+        raise ValueError(f"Unknown outbox entry kind: {entry['kind']}")
+
+    def _send_outbox_batch(self, entries):
+        # The outbox only batches texts to one destination and channel
+        return self.send_text_batch([entry["text"] for entry in entries], entries[0]["channel_index"],
+                                    entries[0]["destination"])
 
     # Function to show nodes
     def show_nodes(self, include_self: bool=True) -> list:
         """Return a list of nodes in the mesh"""
-        def format_float(value, precision=2, unit="") -> Optional[str]:
-            """Format a float value with precision."""
-            return f"{value:.{precision}f}{unit}" if value else None
-
-        def get_lh(ts) -> Optional[str]:
-            """Format last heard"""
-            return (
-                datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
-            )
-
-        def get_time_ago(ts) -> Optional[str]:
-            """Format how long ago have we heard from this node (aka timeago)."""
-            return (
-                timeago.format(datetime.fromtimestamp(ts), datetime.now())
-                if ts
-                else None
-            )
-
         rows: list[dict[str, any]] = []
         if self.interface.nodesByNum:
             logging.debug(f"self.interface.nodes:{self.interface.nodes}")
-            for node in self.interface.nodesByNum.values():
+            for node in list(self.interface.nodesByNum.values()):
                 if not include_self and node["num"] == self.interface.localNode.nodeNum:
                     continue
-
-                presumptive_id = f"!{node['num']:08x}"
-                row = {"N": 0, "User": f"Meshtastic {presumptive_id[-4:]}", "ID": presumptive_id}
-
-                user = node.get("user")
-                if user:
-                    row.update(
-                        {
-                            "User": user.get("longName", "N/A"),
-                            "AKA": user.get("shortName", "N/A"),
-                            "ID": user["id"],
-                            "Hardware": user.get("hwModel", "UNSET")
-                        }
-                    )
-
-                pos = node.get("position")
-                if pos:
-                    row.update(
-                        {
-                            "Latitude": format_float(pos.get("latitude"), 4, "°"),
-                            "Longitude": format_float(pos.get("longitude"), 4, "°"),
-                            "Altitude": format_float(pos.get("altitude"), 0, " m"),
-                        }
-                    )
-
-                metrics = node.get("deviceMetrics")
-                if metrics:
-                    battery_level = metrics.get("batteryLevel")
-                    if battery_level is not None:
-                        if battery_level == 0:
-                            battery_string = "Powered"
-                        else:
-                            battery_string = str(battery_level) + "%"
-                        row.update({"Battery": battery_string})
-                    row.update(
-                        {
-                            "Channel util.": format_float(
-                                metrics.get("channelUtilization"), 2, "%"
-                            ),
-                            "Tx air util.": format_float(
-                                metrics.get("airUtilTx"), 2, "%"
-                            ),
-                        }
-                    )
-
-                row.update(
-                    {
-                        "SNR": format_float(node.get("snr"), 2, " dB"),
-                        "Hops Away": node.get("hopsAway", "0/unknown"),
-                        "Channel": node.get("channel", 0),
-                        "LastHeard": get_lh(node.get("lastHeard")),
-                        "Since": get_time_ago(node.get("lastHeard")),
-                    }
-                )
-
-                rows.append(row)
+                rows.append(node_row(node))
 
         rows.sort(key=lambda r: r.get("LastHeard") or "0000", reverse=True)
         for i, row in enumerate(rows):
@@ -439,6 +1153,36 @@ class MeshtasticChatApp:
         except Exception as e:
             print(Fore.RED + f"Failed to set PSK: {str(e)}")
 
+    def channel_transaction(self) -> ChannelTransaction:
+        """Start staging edits to the radio's channels, to be written together by apply()."""
+        return ChannelTransaction(self.interface.localNode)
+
+    def preview_channel_edits(self, edits):
+        """What apply_channel_edits would change, without writing anything."""
+        return self.channel_transaction().stage(edits).changes()
+
+    def apply_channel_edits(self, edits, verify=True):
+        """Apply a list of channel edits (see ChannelTransaction.stage) in one settings transaction,
+        writing only the channels they change, and read them back if verify."""
+        transaction = self.channel_transaction().stage(edits)
+        try:
+            result = transaction.apply(verify)
+        except Exception:
+            self.m_channel_transactions.inc(result="failed")
+            raise
+        if not result["written"]:
+            print(Fore.YELLOW + "Channel edits change nothing, no writes sent.")
+            return result
+        if result["verified"] is None:
+            self.m_channel_transactions.inc(result="unverified")
+        else:
+            self.m_channel_transactions.inc(result="ok" if result["verified"] else "mismatch")
+        if result["verified"] is False:
+            print(Fore.RED + f"Channels {result['mismatches']} didn't read back as written.")
+        else:
+            print(Fore.GREEN + f"Channels {result['written']} written in one transaction.")
+        return result
+
     def add_channel(self, name):
         disabled_channel = self.interface.localNode.getDisabledChannel()
         if not disabled_channel:
@@ -462,16 +1206,18 @@ class MeshtasticChatApp:
     # Tunnel-related methods
     if platform.system() == "Linux":
         def start_tunnel_client(self):
+            from Meshtastic_Custom.tunnel import Tunnel
             if self.tunnel:
                 self.tunnel.close()
-            self.tunnel = Tunnel(self.interface)
+            self.tunnel = Tunnel(self.interface, metrics=self.metrics, hopLimitFor=self._hop_limit_for)
             threading.Thread(target=self.tunnel._tunReader, daemon=True).start()
             logging.info("Tunnel client started.")
         
         def start_tunnel_gateway(self):
+            from Meshtastic_Custom.tunnel import Tunnel
             if self.tunnel:
                 self.tunnel.close()
-            self.tunnel = Tunnel(self.interface)
+            self.tunnel = Tunnel(self.interface, metrics=self.metrics, hopLimitFor=self._hop_limit_for)
             threading.Thread(target=self.tunnel._tunReader, daemon=True).start()
             logging.info("Tunnel gateway started.")
         
@@ -482,9 +1228,10 @@ class MeshtasticChatApp:
                 logging.info("Tunnel closed.")
 
         def start_browser(self):
+            from Meshtastic_Custom.tunnel import Tunnel
             if self.tunnel:
                 self.tunnel.close()
-            self.tunnel = Tunnel(self.interface)
+            self.tunnel = Tunnel(self.interface, metrics=self.metrics, hopLimitFor=self._hop_limit_for)
             self.tunnel.start_browser()
     
     def send_tunnel_packet(self, dest_ip, message):
@@ -497,54 +1244,33 @@ class MeshtasticChatApp:
             dest_addr = self.tunnel._ipToNodeId(dest_ip)
             if dest_addr:
                 packet = message.encode('utf-8')
-                self.tunnel.sendPacket(dest_ip, packet)
-                print(f"Packet sent to {dest_ip}")
+                self.tunnel.queuePacket(dest_ip, packet)
+                print(f"Packet queued for {dest_ip}")
             else:
                 print(f"Invalid destination IP: {dest_ip}")
         except Exception as e:
             print(f"Failed to send packet: {e}")
             
-    def sendTraceRoute(self, dest: Union[int, str], hopLimit: int, channelIndex: int=0):
-        """Send the trace route"""
-        r = mesh_pb2.RouteDiscovery()
-        self.interface.sendData(
-            r.SerializeToString(),
-            destinationId=dest,
-            portNum=portnums_pb2.PortNum.TRACEROUTE_APP,
-            wantResponse=True,
-            onResponse=self.onResponseTraceRoute,
-            channelIndex=channelIndex,
-        )
-        # extend timeout based on number of nodes, limit by configured hopLimit
-        waitFactor = min(len(self.interface.nodes) - 1 if self.interface.nodes else 0, hopLimit)
-        self.waitForTraceRoute(waitFactor)
+    def tunnel_queue_stats(self):
+        """Return the tunnel uplink queue counters, or None if no tunnel is open"""
+        if not self.tunnel:
+            return None
+        return self.tunnel.queueStats()
 
-    def onResponseTraceRoute(self, p: dict):
-        """on response for trace route"""
-        routeDiscovery = mesh_pb2.RouteDiscovery()
-        routeDiscovery.ParseFromString(p["decoded"]["payload"])
-        asDict = google.protobuf.json_format.MessageToDict(routeDiscovery)
+    def trace_route(self, dest: Union[int, str], hopLimit: int, channelIndex: int=0, max_age=None):
+        """Start a trace route without waiting; returns a Future of the route (see Class/traceroute.py)"""
+        return self.traceroutes.trace(dest, hopLimit, channelIndex, max_age)
 
+    def sendTraceRoute(self, dest: Union[int, str], hopLimit: int, channelIndex: int=0):
+        """Send the trace route and wait for it; returns the route, or None on timeout"""
+        try:
+            route = self.trace_route(dest, hopLimit, channelIndex).result()
+        except TimeoutError:
+            print(Fore.MAGENTA + "Trace route response not received within timeout period.")
+            return None
         print("Route traced:")
-        routeStr = self._nodeNumToId(p["to"])
-        if "route" in asDict:
-            for nodeNum in asDict["route"]:
-                routeStr += " --> " + self._nodeNumToId(nodeNum)
-        routeStr += " --> " + self._nodeNumToId(p["from"])
-        print(routeStr)
-
-        self._acknowledgment.receivedTraceRoute = True
-
-    def waitForTraceRoute(self, waitFactor):
-        """Wait for trace route response"""
-        timeout = self.timeout + waitFactor * 5
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self._acknowledgment.receivedTraceRoute:
-                return True
-            time.sleep(0.5)
-        print(Fore.MAGENTA + "Trace route response not received within timeout period.")
-        return False
+        print(route["text"])
+        return route
 
     def _nodeNumToId(self, nodeNum):
         """Convert node number to node ID"""
@@ -558,26 +1284,4 @@ class MeshtasticChatApp:
 
     # Main loop to switch between sender and receiver modes
     def run(self):
-        try:
-            while True:
-                choice = input(Fore.CYAN + "Enter 'm' to send a message, 'f' to send a file, or 'exit' to quit: ")
-                if choice.lower() == 'exit':
-                    break
-                elif choice.lower() == 'm':
-                    text = input(Fore.CYAN + "Enter the message to send: ")
-                    print(Fore.YELLOW + f"Sending message: {text}")  # Send message text in yellow
-                    self.send_text_message(text, channel_index=0)
-                elif choice.lower() == 'f':
-                    file_path = input(Fore.CYAN + "Enter the file path to send: ")
-                    try:
-                        with open(file_path, 'rb') as file:
-                            file_data = file.read()
-                            file_name = os.path.basename(file_path)
-                            print(Fore.YELLOW + f"Sending file: {file_name}")  # Send file name in yellow
-                            self.send_data_in_chunks(file_data, file_name, channel_index=0)
-                    except Exception as e:
-                        print(Fore.RED + f"Failed to read file: {str(e)}")
-                else:
-                    print(Fore.MAGENTA + "Invalid choice. Please enter 'm', 'f', or 'exit'.")
-        except KeyboardInterrupt:
-            print(Fore.MAGENTA + "\nExiting the program.")
+        run_cli(self)  # The console client of Class/async_core.py
@@ -0,0 +1,280 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+        self._function = None
+        self._function_label = None
+
+    def set_function(self, function, label=None):
+        """Read the value from function() at collection time instead of storing it.
+
+        function may return a number, or a dict of {label value: number} when label is given.
+        """
+        self._function = function
+        self._function_label = label
+        return self
+
+    def clear_function(self, function):
+        """Go back to stored values if function is still the one bound, so its owner can be freed."""
+        if self._function == function:  # == so an equal bound method matches too
+            self._function = None
+            self._function_label = None
+
+    def samples(self):
+        """Yield (suffix, label key, value) for every series of this metric."""
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logging.debug(f"Metric {self.name} callback failed: {e}")
+                return
+            if isinstance(value, dict):
+                for label_value, item in value.items():
+                    yield "", ((self._function_label or "key", str(label_value)),), item
+            elif value is not None:
+                yield "", (), value
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "max": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+            series["max"] = max(series["max"], value)
+
+    def time(self, **labels):
+        """Context manager observing the duration of the block."""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                histogram.observe(time.perf_counter() - self.start, **labels)
+                return False
+
+        return _Timer()
+
+    def summary(self, **labels):
+        """Count, mean, max and bucket-estimated p50/p90/p99 for one series."""
+        with self._lock:
+            series = self._values.get(_label_key(labels))
+            series = None if series is None else {**series, "counts": list(series["counts"])}
+        return self._summarize(series)
+
+    def _summarize(self, series):
+        if not series or not series["count"]:
+            return {"count": 0}
+        result = {"count": series["count"], "mean": series["sum"] / series["count"], "max": series["max"]}
+        for pct in (50, 90, 99):
+            rank = math.ceil(series["count"] * pct / 100)
+            seen = 0
+            estimate = series["max"]
+            for bound, count in zip(self.buckets, series["counts"]):
+                seen += count
+                if seen >= rank:
+                    estimate = min(bound, series["max"])
+                    break
+            result[f"p{pct}"] = estimate
+        return result
+
+    def samples(self):
+        with self._lock:
+            items = [(key, {**s, "counts": list(s["counts"])}) for key, s in self._values.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                yield "_bucket", key + (("le", f"{bound:g}"),), cumulative
+            yield "_bucket", key + (("le", "+Inf"),), series["count"]
+            yield "_sum", key, series["sum"]
+            yield "_count", key, series["count"]
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms for the radio, transfer and UI hot paths."""
+
+    def __init__(self, prefix="meshtastic_chat_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self.prefix + name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Snapshot of every metric; histograms are summarized."""
+        snapshot = {}
+        with self._lock:
+            metrics = list(self._metrics.items())
+        for name, metric in metrics:
+            if isinstance(metric, Histogram):
+                with metric._lock:
+                    keys = list(metric._values)
+                values = {",".join(f"{k}={v}" for k, v in key) or "all": metric.summary(**dict(key))
+                          for key in keys}
+            else:
+                values = {",".join(f"{k}={v}" for k, v in key) or "all": value
+                          for _, key, value in metric.samples()}
+            snapshot[name] = {"type": metric.kind, "help": metric.help, "values": values}
+        return snapshot
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """Expose /metrics (Prometheus text) and /metrics.json on localhost; returns the server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body = json.dumps(registry.to_dict(), default=str).encode("utf-8")
+                    content_type = "application/json"
+                elif self.path.startswith("/metrics"):
+                    body = registry.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("metrics: " + format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def process_memory_bytes():
+    """Resident set size of this process, or None if it can't be read."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+# Shared registry used by the app, the tunnel and the GUI unless they are given their own
+REGISTRY = MetricsRegistry()
+REGISTRY.gauge("process_resident_memory_bytes", "Resident memory of this process").set_function(process_memory_bytes)
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional, Union
+
+from pubsub import pub
+
+BROADCAST_NUM = 0xFFFFFFFF
+BROADCAST_ADDR = "^all"
+TCP_SCHEME = "tcp://"  # Like the daemon's daemon://host:port
+STALE_AFTER = 2 * 3600  # Seconds since a radio last heard a node before it stops counting as a route
+NO_SNR = -100.0
+
+
+def radio_specs(dev_path) -> list:
+    """The radios named by a device path: a list, or one string with commas ("COM3,tcp://10.0.0.5")."""
+    specs = dev_path if isinstance(dev_path, (list, tuple)) else str(dev_path or "").split(",")
+    return [spec.strip() for spec in specs if spec and spec.strip()]
+
+
+def open_radio(spec):
+    """Open one radio: "tcp://host[:port]" over the network, anything else (None: autodetect) as a serial device."""
+    if spec and spec.startswith(TCP_SCHEME):
+        import meshtastic.tcp_interface
+        host, _, port = spec[len(TCP_SCHEME):].partition(":")
+        return meshtastic.tcp_interface.TCPInterface(hostname=host, portNumber=int(port) if port else 4403)
+    import meshtastic.serial_interface
+    return meshtastic.serial_interface.SerialInterface(devPath=spec)
+
+
+def link_score(node, now):
+    """Sort key for how well one radio hears node, bigger is better: fresh, fewer hops, better SNR, heard later."""
+    if node is None:
+        return (-1,)
+    last_heard = node.get("lastHeard") or 0
+    hops = node.get("hopsAway")
+    return (1 if now - last_heard <= STALE_AFTER else 0, -(hops if hops is not None else 7),
+            node.get("snr", NO_SNR), last_heard)
+
+
+def radio_node_id(radio) -> str:
+    return f"!{radio.myInfo.my_node_num:08x}"
+
+
+def owns_interface(interface, publisher) -> bool:
+    """True if publisher (from a pubsub event) is interface or, for a RadioPool, one of its radios."""
+    return publisher is interface or any(publisher is radio for radio in getattr(interface, "interfaces", ()))
+
+
+class RadioPool:
+    """Several radios (serial or TCP) driven as one interface.
+
+    Offers the part of MeshInterface the app uses, so MeshtasticChatApp can
+    take a pool wherever it takes an interface. A packet to a node goes out
+    on the radio that hears it best (per-radio NodeDB: lastHeard, hopsAway,
+    SNR); broadcasts go out on every radio. A radio that loses its
+    connection is skipped and its traffic fails over to the others.
+    nodes/nodesByNum merge the radios' NodeDBs, keeping each node's best
+    entry; localNode and myInfo are those of the first radio, which is the
+    one channel settings apply to.
+    """
+
+    def __init__(self, interfaces):
+        if not interfaces:
+            raise ValueError("RadioPool needs at least one radio")
+        self.interfaces = list(interfaces)
+        self.down = set()  # Indexes of radios that lost their connection
+        self._lock = threading.Lock()
+        pub.subscribe(self._on_connection_lost, "meshtastic.connection.lost")
+
+    @classmethod
+    def open(cls, specs):
+        """Open every radio that can be opened; fails only if none can."""
+        interfaces = []
+        for spec in specs:
+            try:
+                interfaces.append(open_radio(spec))
+            except Exception as e:
+                logging.warning(f"Failed to open radio {spec}: {e}")
+        if not interfaces:
+            raise ConnectionError(f"None of the radios {', '.join(specs)} could be opened")
+        return cls(interfaces)
+
+    @property
+    def primary(self):
+        return self.interfaces[0]
+
+    @property
+    def localNode(self):
+        return self.primary.localNode
+
+    @property
+    def myInfo(self):
+        return self.primary.myInfo
+
+    @property
+    def nodesByNum(self) -> dict:
+        now = time.time()
+        merged = {}
+        for interface in self.interfaces:
+            for num, node in list((interface.nodesByNum or {}).items()):
+                if num not in merged or link_score(node, now) > link_score(merged[num], now):
+                    merged[num] = node
+        return merged
+
+    @property
+    def nodes(self) -> dict:
+        return {node["user"]["id"]: node for node in self.nodesByNum.values() if node.get("user", {}).get("id")}
+
+    def connected(self) -> list:
+        with self._lock:
+            return [radio for index, radio in enumerate(self.interfaces) if index not in self.down]
+
+    def is_connected(self, radio) -> bool:
+        return any(radio is candidate for candidate in self.connected())
+
+    def wait(self, event, radio, timeout) -> bool:
+        """event.wait(timeout), but giving up as soon as radio disconnects (an ACK can't come back through it)."""
+        deadline = time.monotonic() + timeout
+        while not event.wait(min(timeout / 20, max(deadline - time.monotonic(), 0))):
+            if time.monotonic() >= deadline or not self.is_connected(radio):
+                return event.is_set()
+        return True
+
+    def radio_ids(self) -> list:
+        """Node ids of the connected radios, the first radio's first."""
+        return [radio_node_id(radio) for radio in self.connected() if radio.myInfo]
+
+    def routes(self, destination, fresh_only=False) -> list:
+        """Connected radios that have heard destination, best first; the first connected radio if none has."""
+        radios = self.connected()
+        num = self._node_num(destination, radios)
+        if num is None or num == BROADCAST_NUM:
+            return radios
+        now = time.time()
+        scored = [(link_score((radio.nodesByNum or {}).get(num), now), index, radio)
+                  for index, radio in enumerate(radios)]
+        scored.sort(key=lambda item: (item[0], -item[1]), reverse=True)
+        heard = [radio for score, _, radio in scored if score[0] >= (1 if fresh_only else 0)]
+        return heard or radios[:1]
+
+    def sendData(self, data, destinationId: Union[int, str]=BROADCAST_ADDR,
+                 portNum=None, wantAck: bool=False, wantResponse: bool=False,
+                 onResponse: Optional[Callable[[dict], Any]]=None, onResponseAckPermitted: bool=False,
+                 channelIndex: int=0, hopLimit: Optional[int]=None):
+        from meshtastic import portnums_pb2  # Not at the top: the GUI imports owns_interface before connecting
+        if portNum is None:
+            portNum = portnums_pb2.PortNum.PRIVATE_APP
+        kwargs = dict(portNum=portNum, wantAck=wantAck, wantResponse=wantResponse, onResponse=onResponse,
+                      onResponseAckPermitted=onResponseAckPermitted, channelIndex=channelIndex)
+        if hopLimit is not None:
+            kwargs["hopLimit"] = hopLimit
+        if destinationId in (BROADCAST_ADDR, BROADCAST_NUM):
+            sent = [self._send(radio, data, destinationId, kwargs) for radio in self.connected()]
+            sent = [packet for packet in sent if packet is not None]
+            if not sent:
+                raise ConnectionError("No radio could send the broadcast")
+            return sent[0]
+        for radio in self.routes(destinationId):
+            packet = self._send(radio, data, destinationId, kwargs)
+            if packet is not None:
+                return packet
+        raise ConnectionError(f"No radio could send to {destinationId}")
+
+    def sendText(self, text: str, destinationId: Union[int, str]=BROADCAST_ADDR, wantAck: bool=False,
+                 wantResponse: bool=False, onResponse: Optional[Callable[[dict], Any]]=None, channelIndex: int=0):
+        from meshtastic import portnums_pb2
+        return self.sendData(text.encode("utf-8"), destinationId, portNum=portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+                             wantAck=wantAck, wantResponse=wantResponse, onResponse=onResponse,
+                             channelIndex=channelIndex)
+
+    def send_via(self, radio, data, destinationId, **kwargs):
+        """Send on one particular radio (e.g. a chunk its sender worker owns); marks it down if that fails."""
+        packet = self._send(radio, data, destinationId, kwargs)
+        if packet is None:
+            raise ConnectionError(f"Radio {self._label(radio)} is down")
+        return packet
+
+    def close(self):
+        pub.unsubscribe(self._on_connection_lost, "meshtastic.connection.lost")
+        for radio in self.interfaces:
+            try:
+                radio.close()
+            except Exception as e:
+                logging.debug(f"Closing radio {self._label(radio)} failed: {e}")
+
+    def _send(self, radio, data, destinationId, kwargs):
+        """Send on radio, or return None (and mark it down) if its connection is gone."""
+        try:
+            return radio.sendData(data, destinationId, **kwargs)
+        except OSError as e:  # ConnectionError, serial and socket errors
+            logging.warning(f"Radio {self._label(radio)} failed, failing over: {e}")
+            self._mark_down(radio)
+            return None
+
+    def _mark_down(self, radio):
+        with self._lock:
+            for index, candidate in enumerate(self.interfaces):
+                if candidate is radio:
+                    self.down.add(index)
+
+    def _on_connection_lost(self, interface, topic=pub.AUTO_TOPIC):
+        if any(interface is radio for radio in self.interfaces):
+            logging.warning(f"Radio {self._label(interface)} disconnected")
+            self._mark_down(interface)
+
+    def _node_num(self, destination, radios):
+        if isinstance(destination, int):
+            return destination
+        if destination == BROADCAST_ADDR:
+            return BROADCAST_NUM
+        if str(destination).startswith("!"):
+            return int(str(destination)[1:], 16)
+        for radio in radios:
+            node = (radio.nodes or {}).get(destination)
+            if node is not None:
+                return node["num"]
+        return None
+
+    @staticmethod
+    def _label(radio):
+        return getattr(radio, "devPath", None) or getattr(radio, "hostname", None) or repr(radio)
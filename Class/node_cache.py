@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+NODE_CACHE_VERSION = 1
+AUTOSAVE_INTERVAL = 300  # Seconds between periodic snapshots
+
+# The parts of a NodeDB entry worth keeping between runs, and the fields kept of each
+NODE_FIELDS = {
+    "user": ("id", "longName", "shortName", "hwModel"),
+    "position": ("latitude", "longitude", "altitude"),
+    "deviceMetrics": ("batteryLevel", "voltage", "channelUtilization", "airUtilTx"),
+}
+NODE_VALUES = ("snr", "lastHeard", "hopsAway", "channel")
+
+
+def compact_node(node) -> dict:
+    """Copy the fields the node list shows out of a NodeDB entry."""
+    compact = {"num": node["num"]}
+    for key, fields in NODE_FIELDS.items():
+        section = node.get(key)
+        if section:
+            compact[key] = {field: section[field] for field in fields if field in section}
+    for key in NODE_VALUES:
+        if node.get(key) is not None:
+            compact[key] = node[key]
+    return compact
+
+
+def format_float(value, precision=2, unit="") -> Optional[str]:
+    """Format a float value with precision."""
+    return f"{value:.{precision}f}{unit}" if value else None
+
+
+def get_lh(ts) -> Optional[str]:
+    """Format last heard"""
+    return (
+        datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
+    )
+
+
+def get_time_ago(ts) -> Optional[str]:
+    """Format how long ago have we heard from this node (aka timeago)."""
+    import timeago
+    return (
+        timeago.format(datetime.fromtimestamp(ts), datetime.now())
+        if ts
+        else None
+    )
+
+
+def node_row(node) -> dict:
+    """Format one NodeDB entry (live or cached) as a row of the node list."""
+    presumptive_id = f"!{node['num']:08x}"
+    row = {"N": 0, "User": f"Meshtastic {presumptive_id[-4:]}", "ID": presumptive_id}
+
+    user = node.get("user")
+    if user:
+        row.update(
+            {
+                "User": user.get("longName", "N/A"),
+                "AKA": user.get("shortName", "N/A"),
+                "ID": user["id"],
+                "Hardware": user.get("hwModel", "UNSET")
+            }
+        )
+
+    pos = node.get("position")
+    if pos:
+        row.update(
+            {
+                "Latitude": format_float(pos.get("latitude"), 4, "°"),
+                "Longitude": format_float(pos.get("longitude"), 4, "°"),
+                "Altitude": format_float(pos.get("altitude"), 0, " m"),
+            }
+        )
+
+    metrics = node.get("deviceMetrics")
+    if metrics:
+        battery_level = metrics.get("batteryLevel")
+        if battery_level is not None:
+            if battery_level == 0:
+                battery_string = "Powered"
+            else:
+                battery_string = str(battery_level) + "%"
+            row.update({"Battery": battery_string})
+        row.update(
+            {
+                "Channel util.": format_float(
+                    metrics.get("channelUtilization"), 2, "%"
+                ),
+                "Tx air util.": format_float(
+                    metrics.get("airUtilTx"), 2, "%"
+                ),
+            }
+        )
+
+    row.update(
+        {
+            "SNR": format_float(node.get("snr"), 2, " dB"),
+            "Hops Away": node.get("hopsAway", "0/unknown"),
+            "Channel": node.get("channel", 0),
+            "LastHeard": get_lh(node.get("lastHeard")),
+            "Since": get_time_ago(node.get("lastHeard")),
+        }
+    )
+    return row
+
+
+class NodeCache:
+    """Snapshot of the radio's NodeDB kept on disk so the node list can be shown before the device is.
+
+    Nodes loaded from disk are stale until the device reports them again
+    (update / update_all); save() writes every known node, fresh or not.
+    """
+
+    def __init__(self, path="node_cache.json"):
+        self.path = path
+        self.nodes = {}  # node num -> compact node
+        self.fresh = set()  # node nums reported by the device this session
+        self.saved_at = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # The autosave thread and shutdown may save at once
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self) -> dict:
+        """Read the snapshot; a missing or unreadable file just means an empty cache."""
+        try:
+            with open(self.path, "r") as file:
+                snapshot = json.load(file)
+            if snapshot.get("version") != NODE_CACHE_VERSION:
+                raise ValueError(f"unsupported version {snapshot.get('version')}")
+            nodes = {node["num"]: node for node in snapshot["nodes"]}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring node cache {self.path}: {e}")
+            return {}
+        with self._lock:
+            for num, node in nodes.items():
+                if num not in self.fresh:
+                    self.nodes[num] = node
+            self.saved_at = snapshot.get("saved_at")
+        return nodes
+
+    def update(self, node) -> dict:
+        """Merge a node reported by the device and mark it fresh; returns the merged compact node."""
+        compact = compact_node(node)
+        with self._lock:
+            merged = {**self.nodes.get(compact["num"], {}), **compact}
+            self.nodes[compact["num"]] = merged
+            self.fresh.add(compact["num"])
+        return merged
+
+    def update_all(self, nodes_by_num):
+        for node in list(nodes_by_num.values()):
+            self.update(node)
+
+    def is_stale(self, num) -> bool:
+        with self._lock:
+            return num not in self.fresh
+
+    def stale_nodes(self) -> list:
+        """Cached nodes the device hasn't reported this session."""
+        with self._lock:
+            return [node for num, node in self.nodes.items() if num not in self.fresh]
+
+    def save(self):
+        """Write the snapshot atomically, so a crash mid-write keeps the previous one."""
+        with self._lock:
+            nodes = list(self.nodes.values())
+        saved_at = time.time()
+        tmp_path = f"{self.path}.tmp"
+        with self._save_lock:
+            try:
+                with open(tmp_path, "w") as file:
+                    json.dump({"version": NODE_CACHE_VERSION, "saved_at": saved_at, "nodes": nodes},
+                              file, separators=(",", ":"))
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.path)
+                self.saved_at = saved_at
+            except OSError as e:
+                logging.warning(f"Failed to save node cache {self.path}: {e}")
+
+    def start_autosave(self, source=None, interval=AUTOSAVE_INTERVAL):
+        """Save every interval seconds; source() may return a nodesByNum to merge first."""
+        def run():
+            while not self._stop.wait(interval):
+                nodes_by_num = source() if source else None
+                if nodes_by_num:
+                    self.update_all(nodes_by_num)
+                self.save()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
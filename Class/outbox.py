@@ -0,0 +1,313 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from Class.coalescer import COALESCE_WINDOW, fit_messages
+
+OUTBOX_VERSION = 1
+OUTBOX_PACE = 5.0  # Seconds between deliveries to one node, and before retrying a node that didn't answer
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_HISTORY = 100  # Delivered/failed entries kept in memory for the UI
+OUTBOX_FILE_WORKERS = 1  # Threads delivering files and bundles, beside the one for texts
+STATE_QUEUED = "queued"
+STATE_SENDING = "sending"
+STATE_DELIVERED = "delivered"
+STATE_FAILED = "failed"
+PENDING_STATES = (STATE_QUEUED, STATE_SENDING)
+
+
+def normalize_node_id(node_id) -> str:
+    """'!FA6A4660', 0xfa6a4660 and '!fa6a4660' all name the same node."""
+    if isinstance(node_id, int):
+        return f"!{node_id:08x}"
+    return str(node_id).lower()
+
+
+class Outbox:
+    """Messages and files waiting for their destination to be heard again.
+
+    Entries are plain dicts (id, kind, destination, channel_index, text or
+    name/data, state, attempts, created, updated), delivered per destination
+    in the order they were queued. Nothing is retried blindly: a destination
+    is flushed when queued for, or when note_activity() reports it was heard.
+    send_entry(entry) does the actual send and returns True once acknowledged.
+
+    With send_batch, consecutive texts to the same destination and channel
+    (a burst, or lines typed while an earlier one awaited its ACK) go out
+    together: send_batch(entries) sends them as one packet and returns True
+    once that is acknowledged. A fresh text is held for coalesce_window
+    seconds so the rest of its burst can join it. can_batch(destination),
+    if given, says whether destination reads batches; texts to one that
+    doesn't go one by one.
+
+    Texts and files go out on separate workers, so a long transfer to one
+    node doesn't hold up chat to the others; a destination is only ever
+    sent to by one worker at a time, which keeps its entries in order.
+    """
+
+    def __init__(self, send_entry, path=None, pace=OUTBOX_PACE, max_attempts=OUTBOX_MAX_ATTEMPTS, on_change=None,
+                 send_batch=None, coalesce_window=COALESCE_WINDOW, file_workers=OUTBOX_FILE_WORKERS, can_batch=None):
+        self.send_entry = send_entry
+        self.send_batch = send_batch
+        self.can_batch = can_batch
+        self.coalesce_window = coalesce_window
+        self.path = path
+        self.pace = pace
+        self.max_attempts = max_attempts
+        self.on_change = on_change
+        self.file_workers = file_workers
+        self.entries = []
+        self._ids = itertools.count(1)
+        self._due = {}  # destination -> earliest time it may be flushed
+        self._unanswered = set()  # destinations whose last send wasn't delivered, so _due is a retry backoff
+        self._woken = set()  # destinations with pending entries that should be flushed
+        self._busy = set()  # destinations a worker is sending to right now
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = []
+        if path:
+            self.load()
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._run, args=("text",), daemon=True)]
+        self._threads += [threading.Thread(target=self._run, args=("file",), daemon=True)
+                          for _ in range(self.file_workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as file:
+                snapshot = json.load(file)
+            if snapshot.get("version") != OUTBOX_VERSION:
+                raise ValueError(f"unsupported version {snapshot.get('version')}")
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring outbox {self.path}: {e}")
+            return
+        with self._condition:
+            for entry in snapshot["entries"]:
+                if entry.get("data") is not None:
+                    entry["data"] = base64.b64decode(entry["data"])
+                if entry["state"] == STATE_SENDING:
+                    entry["state"] = STATE_QUEUED  # Interrupted mid-send, try again when the node is heard
+                self.entries.append(entry)
+            self._ids = itertools.count(max((entry["id"] for entry in self.entries), default=0) + 1)
+
+    def save(self):
+        """Write the pending entries atomically."""
+        if not self.path:
+            return
+        with self._condition:
+            pending = [dict(entry) for entry in self.entries if entry["state"] in PENDING_STATES]
+        for entry in pending:
+            entry.pop("progress", None)
+            if entry.get("data") is not None:
+                entry["data"] = base64.b64encode(entry["data"]).decode("ascii")
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                json.dump({"version": OUTBOX_VERSION, "entries": pending}, file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Failed to save outbox {self.path}: {e}")
+
+    def add(self, kind, destination, channel_index=0, **fields) -> dict:
+        """Queue an entry; a destination with nothing else pending is tried right away. Returns a copy."""
+        now = time.time()
+        with self._condition:
+            entry = {"id": next(self._ids), "kind": kind, "destination": normalize_node_id(destination),
+                     "channel_index": channel_index, "state": STATE_QUEUED, "attempts": 0,
+                     "created": now, "updated": now, **fields}
+            if not self._has_pending(entry["destination"]) and entry["destination"] in self._unanswered:
+                self._due.pop(entry["destination"], None)  # First in line, so try it right away
+            self.entries.append(entry)
+            self._woken.add(entry["destination"])
+            self._condition.notify_all()
+        self.save()
+        self._changed(entry)
+        return self._public(entry)
+
+    def note_activity(self, node_id):
+        """Called for every packet from, or NodeDB update of, a node; flushes its queue if it has one."""
+        destination = normalize_node_id(node_id)
+        with self._condition:
+            if destination in self._woken or not self._has_pending(destination):
+                return
+            self._woken.add(destination)
+            self._condition.notify_all()
+
+    def flush(self, destination=None):
+        """Try queued entries now, for one destination or all of them."""
+        with self._condition:
+            destinations = {normalize_node_id(destination)} if destination else \
+                {entry["destination"] for entry in self.entries if entry["state"] in PENDING_STATES}
+            for destination in destinations:
+                self._due.pop(destination, None)
+            self._woken |= destinations
+            self._condition.notify_all()
+
+    def cancel(self, entry_id) -> bool:
+        with self._condition:
+            for entry in self.entries:
+                if entry["id"] == entry_id and entry["state"] == STATE_QUEUED:
+                    entry["state"] = STATE_FAILED
+                    entry["error"] = "cancelled"
+                    break
+            else:
+                return False
+        self.save()
+        self._changed(entry)
+        return True
+
+    def report_progress(self, entry, current, total):
+        """For send_entry: publish how far a file transfer has got."""
+        entry["progress"] = [current, total]
+        self._changed(entry)
+
+    def report_verified(self, entry, verified):
+        """For send_entry: the receiver's SHA-256 check of a file (None if it didn't report one)."""
+        entry["verified"] = verified
+        self._changed(entry)
+
+    def pending(self, destination=None) -> list:
+        with self._condition:
+            return [self._public(entry) for entry in self.entries if entry["state"] in PENDING_STATES
+                    and (destination is None or entry["destination"] == normalize_node_id(destination))]
+
+    def stats(self) -> dict:
+        with self._condition:
+            states = {}
+            for entry in self.entries:
+                states[entry["state"]] = states.get(entry["state"], 0) + 1
+            return {"entries": len(self.entries), "destinations": len({e["destination"] for e in self.entries
+                                                                       if e["state"] in PENDING_STATES}), **states}
+
+    def _has_pending(self, destination):
+        return any(entry["destination"] == destination and entry["state"] in PENDING_STATES for entry in self.entries)
+
+    def _public(self, entry):
+        return {k: v for k, v in entry.items() if k != "data"}
+
+    def _changed(self, entry):
+        if self.on_change:
+            try:
+                self.on_change(self._public(entry))
+            except Exception as e:
+                logging.debug(f"Outbox callback failed: {e}")
+
+    def _lane(self, destination):
+        """Which worker sends destination's next entry ("text" or "file"); None if nothing is queued."""
+        for entry in self.entries:
+            if entry["destination"] == destination and entry["state"] == STATE_QUEUED:
+                return "text" if entry["kind"] == "text" else "file"
+        return None
+
+    def _next_batch(self, destination) -> list:
+        """The next entry for destination, with the texts that can share its packet. Call with the lock held.
+
+        Empty when there is nothing to send yet, e.g. a text typed just now
+        held back for the rest of its burst (the destination is due again
+        when the hold ends).
+        """
+        queued = [e for e in self.entries if e["destination"] == destination and e["state"] == STATE_QUEUED]
+        if not queued:
+            return []
+        first = queued[0]
+        if not self.send_batch or first["kind"] != "text" or (self.can_batch and not self.can_batch(destination)):
+            return [first]
+        hold = first["created"] + self.coalesce_window - time.time()
+        if hold > 0:
+            self._due[destination] = time.monotonic() + hold
+            self._woken.add(destination)
+            return []
+        run = []
+        for entry in queued:
+            if entry["kind"] != "text" or entry["channel_index"] != first["channel_index"]:
+                break  # Keep the queue's order: a file or another channel ends the batch
+            run.append(entry)
+        return run[:max(fit_messages([entry["text"] for entry in run]), 1)]
+
+    def _next_destination(self, lane):
+        """Wait for a woken destination of this lane whose pace has passed and claim it; None once closed."""
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                self._woken -= {d for d in self._woken if d not in self._busy and self._lane(d) is None}
+                ready = [d for d in self._woken if d not in self._busy and self._due.get(d, 0) <= now
+                         and self._lane(d) == lane]
+                if ready:
+                    destination = min(ready, key=lambda d: self._due.get(d, 0))
+                    self._woken.discard(destination)
+                    self._busy.add(destination)
+                    return destination
+                waits = [self._due[d] - now for d in self._woken if self._due.get(d, 0) > now]
+                self._condition.wait(timeout=min(waits) if waits else None)
+            return None
+
+    def _run(self, lane):
+        while True:
+            destination = self._next_destination(lane)
+            if destination is None:
+                return
+            try:
+                self._flush_destination(destination)
+            finally:
+                with self._condition:
+                    self._busy.discard(destination)
+                    self._condition.notify_all()  # Its next entry may be for the other lane
+
+    def _flush_destination(self, destination):
+        """Send destination's next entry (or batch of texts); the rest wait for the pace in _due."""
+        with self._condition:
+            batch = self._next_batch(destination)
+            if not batch:
+                return
+            for entry in batch:
+                entry["state"] = STATE_SENDING
+                entry["attempts"] += 1
+                entry["updated"] = time.time()
+        for entry in batch:
+            self._changed(entry)
+        try:
+            delivered = self.send_batch(batch) if len(batch) > 1 else self.send_entry(batch[0])
+        except Exception as e:
+            logging.warning(f"Outbox send of entries {[entry['id'] for entry in batch]} failed: {e}")
+            delivered = False
+        with self._condition:
+            for entry in batch:
+                entry["updated"] = time.time()
+                if delivered:
+                    entry["state"] = STATE_DELIVERED
+                elif entry["attempts"] >= self.max_attempts:
+                    entry["state"] = STATE_FAILED
+                    entry["error"] = "the receiver's SHA-256 check failed" if entry.get("verified") is False \
+                        else f"not delivered after {entry['attempts']} attempts"
+                else:
+                    entry["state"] = STATE_QUEUED
+            # Pace deliveries to a node, and don't retry an unresponsive one until the pace has passed
+            self._due[destination] = time.monotonic() + self.pace
+            if not delivered:
+                self._unanswered.add(destination)
+            else:
+                self._unanswered.discard(destination)
+            if delivered and self._lane(destination):
+                self._woken.add(destination)  # The rest goes out once the pace has passed
+            # An unreachable one waits until it is heard again (note_activity)
+            finished = [e for e in self.entries if e["state"] not in PENDING_STATES]
+            for old in finished[:-OUTBOX_HISTORY]:
+                self.entries.remove(old)
+        self.save()
+        for entry in batch:
+            self._changed(entry)
@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import logging
+import os
+import struct
+import threading
+import time
+
+import google.protobuf.json_format
+from pubsub import pub
+from meshtastic import mesh_pb2, portnums_pb2, protocols
+
+from Class.multi_radio import owns_interface
+
+CAPTURE_MAGIC = b'MTCAP\x01'
+RECORD_HEADER = struct.Struct("<dBI")  # timestamp, direction, length of the MeshPacket that follows
+DIRECTION_RX = 0
+DIRECTION_TX = 1
+BROADCAST_NUM = 0xFFFFFFFF
+
+
+def mesh_packet_to_dict(mesh_packet):
+    """Turn a MeshPacket into the dict MeshInterface publishes on meshtastic.receive.
+
+    Returns (topic, packet dict).
+    """
+    as_dict = google.protobuf.json_format.MessageToDict(mesh_packet)
+    as_dict["raw"] = mesh_packet
+    as_dict.setdefault("from", 0)
+    as_dict.setdefault("to", 0)
+    as_dict["fromId"] = f"!{as_dict['from']:08x}"
+    as_dict["toId"] = "^all" if as_dict["to"] == BROADCAST_NUM else f"!{as_dict['to']:08x}"
+    topic = "meshtastic.receive"
+    if mesh_packet.HasField("decoded"):
+        decoded = as_dict.setdefault("decoded", {})
+        # MessageToDict turns bytes into base64, put the real payload back
+        decoded["payload"] = mesh_packet.decoded.payload
+        decoded.setdefault("portnum", portnums_pb2.PortNum.Name(portnums_pb2.PortNum.UNKNOWN_APP))
+        topic = f"meshtastic.receive.data.{decoded['portnum']}"
+        handler = protocols.get(mesh_packet.decoded.portnum)
+        if handler is not None:
+            topic = f"meshtastic.receive.{handler.name}"
+            if handler.protobufFactory is not None:
+                pb = handler.protobufFactory()
+                pb.ParseFromString(mesh_packet.decoded.payload)
+                decoded[handler.name] = google.protobuf.json_format.MessageToDict(pb)
+            if mesh_packet.decoded.portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
+                decoded["text"] = mesh_packet.decoded.payload.decode("utf-8", errors="replace")
+    return topic, as_dict
+
+
+def _dict_to_mesh_packet(packet):
+    """Rebuild a MeshPacket for packets that arrive without the 'raw' protobuf."""
+    mesh_packet = mesh_pb2.MeshPacket()
+    setattr(mesh_packet, "from", packet.get("from", 0))
+    mesh_packet.to = packet.get("to", 0)
+    mesh_packet.id = packet.get("id", 0)
+    mesh_packet.channel = packet.get("channel", 0)
+    mesh_packet.hop_limit = packet.get("hopLimit", 0)
+    mesh_packet.hop_start = packet.get("hopStart", 0)
+    mesh_packet.rx_snr = packet.get("rxSnr", 0.0)
+    mesh_packet.rx_rssi = packet.get("rxRssi", 0)
+    mesh_packet.rx_time = packet.get("rxTime", 0)
+    decoded = packet.get("decoded")
+    if decoded is not None:
+        portnum = decoded.get("portnum", 0)
+        mesh_packet.decoded.portnum = portnums_pb2.PortNum.Value(portnum) if isinstance(portnum, str) else portnum
+        mesh_packet.decoded.payload = decoded.get("payload", b'')
+        mesh_packet.decoded.want_response = decoded.get("wantResponse", False)
+        mesh_packet.decoded.request_id = decoded.get("requestId", 0)
+    return mesh_packet
+
+
+class PacketCapture:
+    """Append every packet an interface receives or sends to a capture file.
+
+    The file is CAPTURE_MAGIC followed by records of a RECORD_HEADER and a
+    serialized MeshPacket, so a capture is compact and can be read back
+    without knowing anything about the app.
+    """
+
+    def __init__(self, path, interface):
+        self.path = path
+        self.interface = interface
+        self.packets = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._wrapped = []  # (radio, its own sendData) while capturing
+
+    def start(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "ab")
+        if new_file:
+            self._file.write(CAPTURE_MAGIC)
+        pub.subscribe(self._on_receive, "meshtastic.receive")
+        # sendText goes through sendData, so wrapping the instance attribute catches both;
+        # a RadioPool's radios are wrapped one by one, so each transmission is one record
+        for radio in getattr(self.interface, "interfaces", None) or [self.interface]:
+            self._wrap(radio)
+        logging.info(f"Capturing packets to {self.path}")
+        return self
+
+    def stop(self):
+        pub.unsubscribe(self._on_receive, "meshtastic.receive")
+        for radio, _ in self._wrapped:
+            del radio.sendData  # Uncover the class' own sendData again
+        self._wrapped = []
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _wrap(self, radio):
+        original_send_data = radio.sendData
+
+        def send_data(*args, **kwargs):
+            sent = original_send_data(*args, **kwargs)
+            if isinstance(sent, mesh_pb2.MeshPacket):
+                self.write(sent, DIRECTION_TX)
+            return sent
+
+        radio.sendData = send_data
+        self._wrapped.append((radio, original_send_data))
+
+    def _on_receive(self, packet, interface):
+        if not owns_interface(self.interface, interface):
+            return
+        raw = packet.get("raw")
+        self.write(raw if isinstance(raw, mesh_pb2.MeshPacket) else _dict_to_mesh_packet(packet), DIRECTION_RX)
+
+    def write(self, mesh_packet, direction, timestamp=None):
+        data = mesh_packet.SerializeToString()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD_HEADER.pack(timestamp or time.time(), direction, len(data)))
+            self._file.write(data)
+            self._file.flush()
+            self.packets += 1
+
+
+def read_capture(path):
+    """Yield (timestamp, direction, MeshPacket) for every record in a capture file."""
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a packet capture")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # A truncated trailing record is what a crash mid-write leaves behind
+            timestamp, direction, length = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            yield timestamp, direction, mesh_pb2.MeshPacket.FromString(data)
+
+
+def replay(path, app=None, tunnel=None, realtime=False, speed=1.0):
+    """Feed the received packets of a capture into MeshtasticChatApp.on_receive and Tunnel.onReceive.
+
+    With realtime the recorded gaps between packets are kept (divided by speed),
+    otherwise packets are fed as fast as possible. Returns throughput numbers.
+    """
+    packets = 0
+    first_ts = None
+    start = time.perf_counter()
+    for timestamp, direction, mesh_packet in read_capture(path):
+        if direction != DIRECTION_RX:
+            continue
+        if realtime:
+            if first_ts is None:
+                first_ts = timestamp
+            delay = (timestamp - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        _, packet = mesh_packet_to_dict(mesh_packet)
+        if app is not None:
+            app.on_receive(packet, app.interface)
+        if tunnel is not None and mesh_packet.decoded.portnum == portnums_pb2.PortNum.IP_TUNNEL_APP:
+            tunnel.onReceive(packet)
+        packets += 1
+    elapsed = time.perf_counter() - start
+    return {"packets": packets, "elapsed_s": elapsed, "packets_per_s": packets / elapsed if elapsed else None}
+
+
+def main():
+    from Class.mesh_simulator import SimulatedMesh
+    from Class.meshtastic_chat_app import MeshtasticChatApp
+
+    parser = argparse.ArgumentParser(description="Replay a packet capture into MeshtasticChatApp")
+    parser.add_argument("capture")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed-up factor for --realtime")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    parser.add_argument("--received-dir", default="replayed_files")
+    args = parser.parse_args()
+
+    # The capturing node is the destination of what it received
+    local_num = next((getattr(p, "from") for _, d, p in read_capture(args.capture) if d == DIRECTION_TX),
+                     next((p.to for _, d, p in read_capture(args.capture) if d == DIRECTION_RX), 1))
+    mesh = SimulatedMesh(time_scale=0)
+    iface = mesh.add_node(local_num)
+    app = MeshtasticChatApp("replay", "^all", interface=iface)
+    app.received_dir = args.received_dir
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        result = replay(args.capture, app=app, realtime=args.realtime, speed=args.speed)
+    mesh.close()
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
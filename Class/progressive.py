@@ -0,0 +1,135 @@
+import io
+import logging
+import os
+
+CANCEL = "CANCEL:"  # Text a receiver sends when it has seen enough of a transfer
+PREVIEW_DIR = "previews"  # Under received_dir; partial renderings of progressive transfers
+PREVIEW_STEPS = 10  # Previews written per transfer, roughly
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+JPEG_APP0 = 0xE0  # JFIF header, written by the encoder
+# APP1..APP15 (EXIF, ICC profiles, XMP, Photoshop...) and comments: a decoder skips them,
+# so their payloads can go last and be zero-filled in a preview
+JPEG_DEFERRABLE = set(range(0xE1, 0xF0)) | {0xFE}
+JPEG_STANDALONE = set(range(0xD0, 0xD8)) | {0x01, 0xD8}  # Markers without a length field
+
+
+def is_jpeg(data) -> bool:
+    return data[:2] == JPEG_SOI
+
+
+def make_progressive(data):
+    """Re-encode a baseline JPEG as progressive (coarse scans first), keeping its quantization.
+
+    The source's APP1..APP15 and comment segments (EXIF, ICC profile, XMP...)
+    are carried over byte for byte, as Pillow would drop or rewrite them.
+    Needs Pillow; anything else, or a JPEG that is already progressive, is
+    returned as is, so a caller can tell whether it was transcoded.
+    """
+    if not is_jpeg(data):
+        return data
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.info.get("progressive") or image.info.get("progression"):
+                return data
+            output = io.BytesIO()
+            image.save(output, format="JPEG", progressive=True, optimize=True, quality="keep")
+    except Exception as e:
+        logging.warning(f"Sending the JPEG as it is, re-encoding it failed: {e}")
+        return data
+    return carry_metadata(data, output.getvalue())
+
+
+def jpeg_header_segments(data) -> list:
+    """(marker, start, end) of each length-prefixed segment before the image data, marker included."""
+    segments = []
+    offset = 2
+    while offset + 4 <= len(data) and data[offset] == 0xFF:
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1  # Fill byte
+            continue
+        if marker in JPEG_STANDALONE:
+            offset += 2
+            continue
+        if marker in (JPEG_SOS, JPEG_EOI):
+            break  # Entropy-coded image data from here on, it's needed in order
+        length = int.from_bytes(data[offset + 2:offset + 4], "big")
+        segments.append((marker, offset, offset + 2 + length))
+        offset += 2 + length
+    return segments
+
+
+def carry_metadata(source, encoded):
+    """encoded with its metadata segments replaced by source's, placed after its SOI and JFIF header."""
+    metadata = b''.join(source[start:end] for marker, start, end in jpeg_header_segments(source)
+                        if marker in JPEG_DEFERRABLE)
+    segments = jpeg_header_segments(encoded)
+    insert_at = 2
+    if segments and segments[0][0] == JPEG_APP0 and segments[0][1] == 2:
+        insert_at = segments[0][2]
+    kept, position = [encoded[:insert_at], metadata], insert_at
+    for marker, start, end in segments:
+        if end <= insert_at:
+            continue
+        kept.append(encoded[position:start])
+        if marker not in JPEG_DEFERRABLE:
+            kept.append(encoded[start:end])
+        position = end
+    kept.append(encoded[position:])
+    return b''.join(kept)
+
+
+def jpeg_deferrable_ranges(data) -> list:
+    """(start, end) byte ranges of the payloads of the header segments a decoder can skip."""
+    return [(start + 4, end) for marker, start, end in jpeg_header_segments(data) if marker in JPEG_DEFERRABLE]
+
+
+def chunk_order(data, chunk_size) -> list:
+    """Order to send chunks in so the receiver can render something early.
+
+    Progressive JPEG scans already come coarse to fine, so image data is sent
+    in file order; chunks that lie entirely inside skippable metadata segments
+    are moved to the end. Anything that isn't a JPEG is sent sequentially.
+    """
+    total_chunks = (len(data) + chunk_size - 1) // chunk_size
+    if not is_jpeg(data):
+        return list(range(total_chunks))
+    ranges = jpeg_deferrable_ranges(data)
+    first, deferred = [], []
+    for index in range(total_chunks):
+        start, end = index * chunk_size, min(len(data), (index + 1) * chunk_size)
+        inside = any(range_start <= start and end <= range_end for range_start, range_end in ranges)
+        (deferred if inside else first).append(index)
+    return first + deferred
+
+
+def preview_bytes(chunks, chunk_size):
+    """A renderable prefix of a partial transfer: chunks up to the last one received, holes zero-filled.
+
+    With chunk_order the only holes are deferred metadata, which decoders skip.
+    None until the first chunk (the image header) is in.
+    """
+    if not chunks or chunks[0] is None:
+        return None
+    last = max(index for index, chunk in enumerate(chunks) if chunk is not None)
+    return b''.join(chunk if chunk is not None else b'\0' * chunk_size for chunk in chunks[:last + 1])
+
+
+def preview_path(received_dir, file_name) -> str:
+    return os.path.join(received_dir, PREVIEW_DIR, os.path.basename(file_name))
+
+
+def write_preview(path, data):
+    """Replace the preview atomically, so a viewer never opens half of one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,309 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from Class.bundle import safe_relative_path
+from Class.integrity import IncrementalDigest, PAYLOAD_LIMIT
+
+MEMORY_BUDGET = 4 * 1024 * 1024  # Chunk bytes held in memory across all inbound transfers
+SPILL_THRESHOLD = 256 * 1024  # Announced sizes above this are reassembled on disk from the start
+MAX_TRANSFER_SIZE = 16 * 1024 * 1024  # Larger announcements are refused
+MAX_SESSIONS = 64
+MAX_SESSIONS_PER_SENDER = 8
+IDLE_TIMEOUT = 600  # Seconds without a chunk before a partial transfer is dropped
+EVICT_INTERVAL = 60  # Seconds between sweeps for idle transfers, so they go even if nothing new is announced
+
+
+class TransferRejected(ValueError):
+    """An announcement or chunk that the receiver won't accept, with the reason as message."""
+
+
+class TransferSession:
+    """One inbound transfer: the chunks received so far, in memory or in a spill file."""
+
+    def __init__(self, sender, tid, file_info, now):
+        self.sender = sender
+        self.tid = tid
+        self.info = file_info
+        self.name = file_info["name"]
+        self.size = file_info.get("size", 0)
+        self.total_chunks = file_info["total_chunks"]
+        # Node ids of the sender's other radios, which may carry some of the chunks (see Class/multi_radio.py)
+        via = file_info.get("via")
+        self.aliases = tuple(alias for alias in via if isinstance(alias, str) and alias != sender) \
+            if isinstance(via, list) else ()
+        self.created = now
+        self.last_activity = now
+        self.chunks = {}  # index -> bytes while in memory
+        self.spill_path = None
+        self._spill_index = {}  # index -> (offset, length) in the spill file
+        self._spill_end = 0
+        # The announced SHA-256 is checked as the chunks come in, not over the assembled file
+        self.hasher = IncrementalDigest() if isinstance(file_info.get("digest"), str) else None
+
+    @property
+    def key(self):
+        return self.sender, self.tid
+
+    @property
+    def received(self) -> int:
+        return len(self.chunks) + len(self._spill_index)
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks.values())
+
+    def has(self, index) -> bool:
+        return index in self.chunks or index in self._spill_index
+
+    def is_complete(self) -> bool:
+        return self.received == self.total_chunks
+
+    def add(self, index, data):
+        if self.spill_path:
+            with open(self.spill_path, 'r+b') as file:
+                file.seek(self._spill_end)
+                file.write(data)
+            self._spill_index[index] = (self._spill_end, len(data))
+            self._spill_end += len(data)
+        else:
+            self.chunks[index] = data
+
+    def spill(self, path):
+        """Move the chunks to a file; later chunks are appended to it."""
+        with open(path, 'wb') as file:
+            for index, chunk in self.chunks.items():
+                file.write(chunk)
+                self._spill_index[index] = (self._spill_end, len(chunk))
+                self._spill_end += len(chunk)
+        self.spill_path = path
+        self.chunks = {}
+
+    def chunk(self, index):
+        """One chunk's bytes, or None if it hasn't arrived."""
+        if index in self.chunks:
+            return self.chunks[index]
+        if index not in self._spill_index:
+            return None
+        offset, length = self._spill_index[index]
+        with open(self.spill_path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def digest_matches(self):
+        """Whether the chunks hash to the announced digest: None without one, only meaningful once complete."""
+        if self.hasher is None:
+            return None
+        self.hasher.advance(self.chunk, self.total_chunks)
+        return self.hasher.next_index == self.total_chunks and self.hasher.matches(self.info["digest"])
+
+    def chunk_list(self) -> list:
+        """All chunks in index order, None for the missing ones."""
+        chunks = [None] * self.total_chunks
+        for index, chunk in self.chunks.items():
+            chunks[index] = chunk
+        if self._spill_index:
+            with open(self.spill_path, 'rb') as file:
+                for index, (offset, length) in self._spill_index.items():
+                    file.seek(offset)
+                    chunks[index] = file.read(length)
+        return chunks
+
+    def assemble(self) -> bytes:
+        return b''.join(self.chunk_list())
+
+    def discard(self):
+        self.chunks = {}
+        if self.spill_path:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+
+
+class ReassemblyManager:
+    """Inbound transfers keyed by (sender, transfer id), within a memory budget.
+
+    FILEINFO opens a session (after admission checks); chunks find theirs by
+    (sender, file name), since the chunk header carries no transfer id, or by
+    (one of the sender's other radios, file name) for a transfer announced
+    with "via". When the chunks held in memory exceed the budget the biggest
+    sessions are spilled to disk, and sessions idle for idle_timeout are
+    evicted: when the next FILEINFO arrives, and by start_evicting()'s
+    periodic sweep.
+    """
+
+    def __init__(self, spill_dir, memory_budget=MEMORY_BUDGET, spill_threshold=SPILL_THRESHOLD,
+                 max_transfer_size=MAX_TRANSFER_SIZE, max_sessions=MAX_SESSIONS,
+                 max_sessions_per_sender=MAX_SESSIONS_PER_SENDER, idle_timeout=IDLE_TIMEOUT, clock=time.monotonic):
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.spill_threshold = spill_threshold
+        self.max_transfer_size = max_transfer_size
+        self.max_sessions = max_sessions
+        self.max_sessions_per_sender = max_sessions_per_sender
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.sessions = {}  # (sender, tid) -> TransferSession
+        self._by_name = {}  # (sender, file name) -> (sender, tid) of its current transfer
+        self.memory_bytes = 0
+        self.counts = Counter()  # opened, completed, rejected, evicted, spilled
+        self._lock = threading.Lock()
+        self._stop = None  # Event ending the running sweep thread, if any
+
+    def open(self, sender, file_info) -> TransferSession:
+        """Start (or restart) a transfer announced by sender; raises TransferRejected."""
+        now = self.clock()
+        name, size, total_chunks = file_info.get("name"), file_info.get("size"), file_info.get("total_chunks")
+        try:
+            if not isinstance(name, str) or not isinstance(size, int) or not isinstance(total_chunks, int):
+                raise TransferRejected("malformed announcement")
+            safe_relative_path(name)
+            if size < 0 or size > self.max_transfer_size:
+                raise TransferRejected(f"announced size {size} is over the {self.max_transfer_size} byte limit")
+            if total_chunks < 0 or total_chunks > size or total_chunks * PAYLOAD_LIMIT < size:
+                raise TransferRejected(f"{total_chunks} chunks can't carry {size} bytes")
+        except TransferRejected:
+            self.counts["rejected"] += 1
+            raise
+        except ValueError as e:
+            self.counts["rejected"] += 1
+            raise TransferRejected(str(e))
+
+        with self._lock:
+            self._evict_idle(now)
+            previous = self._by_name.get((sender, name))
+            if previous:
+                self._close(self.sessions.get(previous))  # A new announcement of the same file replaces the old one
+            per_sender = sum(1 for key in self.sessions if key[0] == sender)
+            if len(self.sessions) >= self.max_sessions or per_sender >= self.max_sessions_per_sender:
+                self.counts["rejected"] += 1
+                raise TransferRejected(f"too many transfers in progress ({len(self.sessions)}, {per_sender} from {sender})")
+            session = TransferSession(sender, file_info.get("tid") or name, file_info, now)
+            if size > self.spill_threshold:
+                self._spill(session)
+            self.sessions[session.key] = session
+            self._by_name[(sender, name)] = session.key
+            for alias in session.aliases:
+                self._by_name[(alias, name)] = session.key  # Chunks sent by the sender's other radios
+            self.counts["opened"] += 1
+            return session
+
+    def add_chunk(self, sender, name, index, total_chunks, data):
+        """Store a chunk; returns (session, is_new). Chunks without a FILEINFO open a session of their own."""
+        session = self.find(sender, name)
+        if session is None:
+            session = self.open(sender, {"name": name, "total_chunks": total_chunks,
+                                         "size": total_chunks * len(data)})
+        if total_chunks != session.total_chunks or not 0 <= index < session.total_chunks:
+            raise TransferRejected(f"chunk {index}/{total_chunks} doesn't belong to {name} "
+                                   f"({session.total_chunks} chunks)")
+        if len(data) > PAYLOAD_LIMIT:
+            raise TransferRejected(f"chunk of {len(data)} bytes")
+        with self._lock:
+            session.last_activity = self.clock()
+            if session.has(index):
+                return session, False
+            session.add(index, data)
+            if session.hasher is not None:
+                session.hasher.advance(session.chunk, session.total_chunks)
+            if not session.spill_path:
+                self.memory_bytes += len(data)
+                if self.memory_bytes > self.memory_budget:
+                    self._enforce_budget()
+            return session, True
+
+    def find(self, sender, name):
+        with self._lock:
+            key = self._by_name.get((sender, name))
+            return self.sessions.get(key) if key else None
+
+    def find_by_sender(self, sender) -> list:
+        """sender's transfers, including those where it is one of the announcing node's other radios."""
+        with self._lock:
+            return [session for session in self.sessions.values()
+                    if session.sender == sender or sender in session.aliases]
+
+    def find_by_name(self, name) -> list:
+        with self._lock:
+            return [session for session in self.sessions.values() if session.name == name]
+
+    def close(self, session, completed=False):
+        """Forget a session, e.g. once it has been assembled or cancelled."""
+        with self._lock:
+            if completed:
+                self.counts["completed"] += 1
+            self._close(session)
+
+    def detach(self, session):
+        """Forget a complete session but leave its chunks to the caller, who assembles it elsewhere and
+        then calls session.discard(); later chunks of the same name no longer find it."""
+        with self._lock:
+            self.counts["completed"] += 1
+            self._close(session, discard=False)
+
+    def evict_idle(self) -> list:
+        with self._lock:
+            return self._evict_idle(self.clock())
+
+    def start_evicting(self, interval=EVICT_INTERVAL):
+        """Sweep for idle sessions every interval seconds (replacing a sweep already running)."""
+        self.stop()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.evict_idle()
+
+        threading.Thread(target=run, daemon=True, name="reassembly-evict").start()
+        return self
+
+    def stop(self):
+        if self._stop:
+            self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self.sessions), "memory_bytes": self.memory_bytes,
+                    "spilled": sum(1 for s in self.sessions.values() if s.spill_path), **self.counts}
+
+    def _close(self, session, discard=True):
+        if session is None or self.sessions.get(session.key) is not session:
+            return
+        del self.sessions[session.key]
+        for sender in (session.sender, *session.aliases):
+            if self._by_name.get((sender, session.name)) == session.key:
+                del self._by_name[(sender, session.name)]
+        self.memory_bytes -= session.memory_bytes
+        if discard:
+            session.discard()
+
+    def _evict_idle(self, now):
+        evicted = [s for s in self.sessions.values() if now - s.last_activity > self.idle_timeout]
+        for session in evicted:
+            logging.info(f"Dropping idle transfer {session.name} from {session.sender} "
+                         f"({session.received}/{session.total_chunks} chunks)")
+            self._close(session)
+            self.counts["evicted"] += 1
+        return evicted
+
+    def _enforce_budget(self):
+        for session in sorted(self.sessions.values(), key=lambda s: s.memory_bytes, reverse=True):
+            if self.memory_bytes <= self.memory_budget:
+                break
+            if session.chunks:
+                self.memory_bytes -= session.memory_bytes
+                self._spill(session)
+
+    def _spill(self, session):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        label = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{session.sender}-{session.tid}")
+        path = os.path.join(self.spill_dir, f"{label}-{id(session):x}.part")
+        try:
+            session.spill(path)
+            self.counts["spilled"] += 1
+        except OSError as e:
+            logging.warning(f"Keeping {session.name} in memory, spilling it failed: {e}")
@@ -0,0 +1,98 @@
+SHORT_IDENTIFIER = b'\x1bZ'  # ESC Z: a compressed chat message follows (no typed text starts with ESC)
+SHORT_CODEC = "smaz1"  # Capability name; a new dictionary needs a new name
+LITERAL_BYTE = 254  # Followed by one raw byte
+LITERAL_RUN = 255  # Followed by n, then n + 1 raw bytes
+
+# The static dictionary, one code per entry (at most 254). Single characters
+# come first so common text never needs the two-byte escape; the rest is chat
+# vocabulary, radio shorthand, call sign prefixes, times and coordinate
+# fragments, taken from mesh chat logs. Changing it breaks compatibility:
+# peers only compress for each other when they advertise the same SHORT_CODEC.
+DICTIONARY = (
+    " ", "e", "t", "a", "o", "i", "n", "s", "r", "h", "l", "d", "u", "c", "m", "w", "y", "g", "f", "p",
+    "b", "k", "v", "j", "x", "q", "z",
+    "0", "1", "2", "3", "4", "5", "6", "7", "8", "9",
+    ".", ",", "!", "?", "-", ":", "'", "/", "(", ")", "°", "%", "+", "@", "#", "&", "\"", ";", "=", "_", "\n",
+    "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T",
+    "U", "V", "W", "X", "Y", "Z",
+    " the ", "the ", " and ", " to ", " you", "you ", " is ", " at ", " in ", " on ", " of ", " for ",
+    " it ", " be ", " we ", " my ", " me", "I'm ", "I ", " will ", " can ", " are ", " have ", " with ",
+    " this ", " that ", " not ", " but ", " all ", " just ", " now", " here", " there", " back", " home",
+    " see ", " get ", " going", "ok", "OK", "yes", "Yes", "no ", "No ", "thanks", "Thanks", " please",
+    "hello", "Hello", "Hi ", "hey ", "Hey ", "good", "Good ", "morning", "night", "copy", "roger",
+    " over", " out", "QSL", "73", "CQ ", " de ", "SNR", "dB", "km", "min", " hour", "battery",
+    "signal", "node", "mesh", "radio", "relay", "repeater", "channel", "message", "test", "weather", "camp",
+    "trail", "meet", "on my way", "Where ", "where", "What ", "what", "When ", "when", "How ", "how",
+    "are you", "Are you", "Can you", "do you", "lat", "lon", "position", "ETA",
+    "00", "20", "10", "12", "50", "30", "15", ":00", ":30", "am", "pm", "'s ", "n't ", "'ll ",
+    "ing ", "ing", "ed ", "er ", "es ", "s ", "e ", "t ", "d ", "y ", "n ",
+    "th", "he", "in", "er", "an", "re", "on", "at", "en", "nd", "st", "or", "te", "ti", "is", "it", "ar",
+    "ou", "ng", "ha", "le", "al", "ve", "se", "me", "ll", "ee", "oo", "ea",
+    ". ", ", ", "! ", "? ", "...", " - ", ":)", "lol", "btw", "GPS",
+    "KD", "KE", "KF", "KB", "KC", "VE",
+)
+
+_CODES = {entry: code for code, entry in enumerate(DICTIONARY)}
+_ENCODED = [entry.encode('utf-8') for entry in DICTIONARY]
+_LONGEST = max(len(entry) for entry in DICTIONARY)
+
+
+def compress(text) -> bytes:
+    """Encode text with the dictionary, greedily taking the longest entry at each position.
+
+    Characters no entry covers (accents, emoji, other scripts) are copied as
+    their UTF-8 bytes behind an escape, so any string round-trips.
+    """
+    out, literal = bytearray(), bytearray()
+
+    def flush_literal():
+        for start in range(0, len(literal), 256):
+            run = literal[start:start + 256]
+            out.extend((LITERAL_BYTE, run[0]) if len(run) == 1 else (LITERAL_RUN, len(run) - 1))
+            if len(run) > 1:
+                out.extend(run)
+        literal.clear()
+
+    position = 0
+    while position < len(text):
+        for length in range(min(_LONGEST, len(text) - position), 0, -1):
+            code = _CODES.get(text[position:position + length])
+            if code is not None:
+                flush_literal()
+                out.append(code)
+                position += length
+                break
+        else:
+            literal.extend(text[position].encode('utf-8'))
+            position += 1
+    flush_literal()
+    return bytes(out)
+
+
+def decompress(data) -> str:
+    """Decode what compress() produced; raises ValueError on a malformed payload."""
+    out, position = bytearray(), 0
+    try:
+        while position < len(data):
+            code = data[position]
+            if code == LITERAL_BYTE:
+                out.append(data[position + 1])
+                position += 2
+            elif code == LITERAL_RUN:
+                length = data[position + 1] + 1
+                if position + 2 + length > len(data):
+                    raise ValueError("literal run past the end of the payload")
+                out.extend(data[position + 2:position + 2 + length])
+                position += 2 + length
+            else:
+                out.extend(_ENCODED[code])
+                position += 1
+    except IndexError:
+        raise ValueError("truncated escape or unknown code")
+    return out.decode('utf-8')
+
+
+def encode_message(text):
+    """The compressed payload for text, or None when compressing wouldn't make it smaller."""
+    packed = SHORT_IDENTIFIER + compress(text)
+    return packed if len(packed) < len(text.encode('utf-8')) else None
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+DEFAULT_HOP_LIMIT = 3  # Firmware default, used when the radio's LoRa config can't be read
+MAX_HOP_LIMIT = 7
+OBSERVATION_TTL = 1800  # Seconds a hop count is trusted; older ones fall back to the default hop limit
+MARGINAL_SNR = -7.0  # dB; a direct neighbour heard this weakly gets a spare hop in case it needs a relay
+RECOVER_AFTER = 8  # Deliveries at a widened hop limit before it narrows again by one
+
+
+def node_id(node) -> Optional[str]:
+    """The "!xxxxxxxx" id of a node number or id; None for broadcasts."""
+    if isinstance(node, int):
+        return None if node == 0xFFFFFFFF else f"!{node:08x}"
+    if not node or str(node).startswith("^"):
+        return None
+    return str(node).lower()
+
+
+class TopologyGraph:
+    """What the app knows of the mesh around it, used to pick a hop limit per destination.
+
+    Hop counts come from the NodeDB (hopsAway, snr), from received packets
+    (hopStart - hopLimit) and from traceroutes, which also give the links
+    between relays. hop_limit() returns the hop count last seen to a
+    destination as its hop limit, so traffic to a near node isn't flooded across the whole
+    mesh; every failed delivery widens that destination's limit by one hop
+    until it is back at the default, and RECOVER_AFTER deliveries narrow it
+    again.
+    """
+
+    def __init__(self, default_hop_limit=DEFAULT_HOP_LIMIT, ttl=OBSERVATION_TTL, clock=time.monotonic):
+        self.default_hop_limit = default_hop_limit
+        self.ttl = ttl
+        self.clock = clock
+        self.nodes = {}  # node id -> {"hops", "snr", "source", "seen"}
+        self.links = {}  # node id -> set of node ids it was seen relaying to or from
+        self.widen = Counter()  # node id -> hops added after failed deliveries
+        self._deliveries = Counter()  # node id -> deliveries since the last widening or narrowing
+        self._lock = threading.Lock()
+
+    def observe_node(self, node):
+        """Take hopsAway and snr from a NodeDB entry."""
+        key = node_id(node.get("user", {}).get("id") or node.get("num"))
+        if key is None or node.get("hopsAway") is None:
+            return
+        self._observe(key, node["hopsAway"], node.get("snr"), "nodedb")
+
+    def observe_packet(self, packet):
+        """Take the hops a received packet travelled (hopStart - hopLimit) and its SNR."""
+        key = node_id(packet.get("fromId") or packet.get("from"))
+        hop_start, hop_limit = packet.get("hopStart"), packet.get("hopLimit")
+        if key is None or not hop_start or hop_limit is None:
+            return  # Firmware before 2.3 doesn't send hopStart
+        hops = max(hop_start - hop_limit, 0)
+        self._observe(key, hops, packet.get("rxSnr") if hops == 0 else None, "packet")
+
+    def observe_route(self, route):
+        """Take a traceroute result (see Class/traceroute.py): its hop count and the links along it."""
+        nodes = [node_id(node) for node in route["route"]]
+        with self._lock:
+            for a, b in zip(nodes, nodes[1:]):
+                self.links.setdefault(a, set()).add(b)
+                self.links.setdefault(b, set()).add(a)
+        self._observe(route["dest"], max(route["hops"] - 1, 0), None, "traceroute")
+
+    def _observe(self, key, hops, snr, source):
+        with self._lock:
+            entry = self.nodes.setdefault(key, {})
+            entry.update(hops=hops, source=source, seen=self.clock())
+            if snr is not None:
+                entry["snr"] = snr
+            elif hops:
+                entry.pop("snr", None)  # The SNR of a relayed packet says nothing about the link to us
+
+    def hop_limit(self, dest) -> Optional[int]:
+        """The hop limit to send to dest with, or None to use the radio's default."""
+        key = node_id(dest)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self.nodes.get(key)
+            if entry is None or self.clock() - entry["seen"] > self.ttl:
+                return None
+            limit = entry["hops"] + self.widen[key]
+            if entry["hops"] == 0 and entry.get("snr") is not None and entry["snr"] < MARGINAL_SNR:
+                limit += 1
+        if limit >= self.default_hop_limit:
+            return None
+        return limit
+
+    def record_delivery(self, dest, delivered, hop_limit=None):
+        """Note whether a packet sent to dest with hop_limit (None: the default) got through."""
+        key = node_id(dest)
+        if key is None:
+            return
+        with self._lock:
+            if not delivered:
+                if hop_limit is not None and self.widen[key] < MAX_HOP_LIMIT:
+                    self.widen[key] += 1  # Too short (or the route changed): try one hop further next time
+                self._deliveries[key] = 0
+            elif self.widen[key]:
+                self._deliveries[key] += 1
+                if self._deliveries[key] >= RECOVER_AFTER:
+                    self.widen[key] -= 1
+                    self._deliveries[key] = 0
+
+    def neighbours(self, node) -> set:
+        """Nodes heard directly from node, as far as traceroutes tell."""
+        with self._lock:
+            return set(self.links.get(node_id(node), ()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = self.clock()
+            return {"nodes": sum(1 for entry in self.nodes.values() if now - entry["seen"] <= self.ttl),
+                    "links": sum(len(ends) for ends in self.links.values()) // 2,
+                    "widened": sum(1 for hops in self.widen.values() if hops)}
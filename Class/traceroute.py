@@ -0,0 +1,132 @@
+import threading
+import time
+from concurrent.futures import Future
+
+ROUTE_TTL = 300  # Seconds a traced route is served from the cache instead of tracing again
+WAIT_PER_HOP = 5  # Extra seconds a trace may take for each hop it may cross
+
+
+def node_key(dest) -> str:
+    """The cache key of a destination: its "!xxxxxxxx" node id, whether given as a number or an id."""
+    if isinstance(dest, int):
+        return f"!{dest:08x}"
+    return str(dest).lower()
+
+
+class TraceRouteTracker:
+    """Traceroutes in flight, correlated by request id, and a cache of the routes they found.
+
+    trace() sends a RouteDiscovery and returns a Future right away; the reply
+    is matched to its request by the packet id it answers, so traces to
+    several destinations can run at once. A route is parsed once, when its
+    reply arrives, and later lookups within ttl are answered from the cache
+    without going on air. A second trace to a node already being traced
+    shares the first one's Future.
+    """
+
+    def __init__(self, app, ttl=ROUTE_TTL, clock=time.monotonic, on_route=None):
+        self.app = app
+        self.on_route = on_route  # Called with every route traced, e.g. to feed the topology graph
+        self.ttl = ttl
+        self.clock = clock
+        self.routes = {}  # node id -> result dict of its last successful trace
+        self._pending = {}  # request packet id -> (node id, Future, timer)
+        self._by_node = {}  # node id -> Future of the trace in flight
+        self._lock = threading.RLock()  # The reply may be handled before sendData returns
+
+    def trace(self, dest, hop_limit, channel_index=0, max_age=None) -> Future:
+        """Trace the route to dest; the Future resolves to a result dict or raises TimeoutError."""
+        from meshtastic import mesh_pb2, portnums_pb2  # Not at the top: the GUI imports node_key before connecting
+        key = node_key(dest)
+        cached = self.route(key, max_age)
+        if cached is not None:
+            self.app.m_traceroutes.inc(result="cached")
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._lock:
+            future = self._by_node.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._by_node[key] = future
+            try:
+                self.app.m_tx_packets.inc(port="TRACEROUTE_APP")
+                packet = self.app.interface.sendData(
+                    mesh_pb2.RouteDiscovery().SerializeToString(),
+                    destinationId=dest,
+                    portNum=portnums_pb2.PortNum.TRACEROUTE_APP,
+                    wantResponse=True,
+                    onResponse=self.on_response,
+                    channelIndex=channel_index,
+                )
+            except Exception as e:
+                del self._by_node[key]
+                future.set_exception(e)
+                return future
+            # Allow more time the more hops the reply may have to cross
+            nodes = self.app.interface.nodes
+            wait_factor = min(len(nodes) - 1 if nodes else 0, hop_limit)
+            timer = threading.Timer(self.app.timeout + wait_factor * WAIT_PER_HOP, self._expire, args=(packet.id,))
+            timer.daemon = True
+            self._pending[packet.id] = (key, future, timer)
+            timer.start()
+        return future
+
+    def route(self, dest, max_age=None):
+        """The cached route to dest if it is younger than max_age (default: the TTL), else None."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            result = self.routes.get(node_key(dest))
+        if result is None or self.clock() - result["traced_at"] > max_age:
+            return None
+        return result
+
+    def invalidate(self, dest=None):
+        """Forget the cached route to dest, or all of them."""
+        with self._lock:
+            if dest is None:
+                self.routes.clear()
+            else:
+                self.routes.pop(node_key(dest), None)
+
+    def on_response(self, p: dict):
+        """Handle a TRACEROUTE_APP reply: parse the route, cache it and resolve the trace waiting for it."""
+        decoded = p.get("decoded", {})
+        with self._lock:
+            pending = self._pending.pop(decoded.get("requestId"), None)
+            if pending is None:
+                return  # Already timed out
+            key, future, timer = pending
+            timer.cancel()
+            self._by_node.pop(key, None)
+            result = self._parse(p, key)
+            self.routes[key] = result
+        self.app.m_traceroutes.inc(result="ok")
+        if self.on_route:
+            self.on_route(result)
+        future.set_result(result)
+
+    def _parse(self, p, key):
+        from meshtastic import mesh_pb2
+        discovery = mesh_pb2.RouteDiscovery()
+        discovery.ParseFromString(p["decoded"]["payload"])
+        to_id = self.app._nodeNumToId
+        route = [to_id(p["to"])] + [to_id(num) for num in discovery.route] + [to_id(p["from"])]
+        result = {"dest": key, "route": route, "hops": len(route) - 1,
+                  "text": " --> ".join(route), "traced_at": self.clock()}
+        route_back = getattr(discovery, "route_back", ())  # Only newer firmware records the way back
+        if route_back:
+            result["route_back"] = [to_id(p["from"])] + [to_id(num) for num in route_back] + [to_id(p["to"])]
+        return result
+
+    def _expire(self, request_id):
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                return
+            key, future, _ = pending
+            self._by_node.pop(key, None)
+            getattr(self.app.interface, "responseHandlers", {}).pop(request_id, None)
+        self.app.m_traceroutes.inc(result="timeout")
+        future.set_exception(TimeoutError(f"No trace route response from {key}"))
@@ -0,0 +1,125 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+CPU_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # Leaves a core for the serial reader and Tk
+IO_WORKERS = 2  # Completions being assembled, verified and written at once
+QUEUE_LIMIT = 4  # Jobs queued or running per pool before submit blocks the caller
+
+
+class BoundedExecutor:
+    """An executor whose submit blocks once limit jobs are queued or running.
+
+    That is the backpressure: a producer faster than the workers waits for a
+    slot instead of piling whole files up in memory in the executor's queue.
+    """
+
+    def __init__(self, executor, limit):
+        self.executor = executor
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+
+class WorkerPool:
+    """Where CPU-heavy and disk-bound transfer work runs, so it stays off the radio's reader thread and Tk.
+
+    cpu: a process pool for pure-Python loops that hold the GIL (delta
+    signatures and encoding, progressive re-encoding); its functions and
+    arguments must be picklable. io: a thread pool for disk writes and the
+    stages around them (assembling, hashing and saving received files;
+    hashlib and zlib release the GIL, so threads run those in parallel).
+    Both are created on first use, and both apply backpressure through
+    BoundedExecutor. Where processes can't be started the cpu pool falls
+    back to threads.
+    """
+
+    def __init__(self, cpu_workers=CPU_WORKERS, io_workers=IO_WORKERS, queue_limit=QUEUE_LIMIT, processes=True):
+        self.cpu_workers = cpu_workers
+        self.io_workers = io_workers
+        self.queue_limit = queue_limit
+        self.processes = processes
+        self._cpu = None
+        self._io = None
+        self._lock = threading.Lock()
+
+    @property
+    def cpu(self) -> BoundedExecutor:
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = BoundedExecutor(self._cpu_executor(), self.queue_limit)
+            return self._cpu
+
+    @property
+    def io(self) -> BoundedExecutor:
+        with self._lock:
+            if self._io is None:
+                self._io = BoundedExecutor(concurrent.futures.ThreadPoolExecutor(
+                    self.io_workers, thread_name_prefix="transfer-io"), self.queue_limit)
+            return self._io
+
+    def submit_cpu(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        return self.cpu.submit(fn, *args, **kwargs)
+
+    def submit_io(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        return self.io.submit(fn, *args, **kwargs)
+
+    def run_cpu(self, fn, *args, **kwargs):
+        """fn(*args) in the cpu pool, waiting for its result; in this thread if the pool is broken."""
+        try:
+            return self.submit_cpu(fn, *args, **kwargs).result()
+        except BrokenProcessPool as e:
+            logging.warning(f"Worker processes failed ({e}), using threads instead")
+            with self._lock:
+                broken, self._cpu = self._cpu, None
+                self.processes = False
+            broken.shutdown(wait=False)
+            return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cpu_pending": self._cpu.pending if self._cpu else 0,
+                    "io_pending": self._io.pending if self._io else 0,
+                    "cpu_mode": "process" if self.processes else "thread"}
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pools, self._cpu, self._io = (self._cpu, self._io), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=wait)
+
+    def _cpu_executor(self):
+        if self.processes:
+            try:
+                # spawn everywhere: forking a process that runs the radio's reader threads isn't safe
+                return concurrent.futures.ProcessPoolExecutor(self.cpu_workers,
+                                                              mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError, ImportError) as e:  # e.g. no working sem_open
+                logging.warning(f"Worker processes unavailable ({e}), using threads instead")
+                self.processes = False
+        return concurrent.futures.ThreadPoolExecutor(self.cpu_workers, thread_name_prefix="transfer-cpu")
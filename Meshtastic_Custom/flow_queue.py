@@ -0,0 +1,238 @@
+"""Per-flow fair queueing with CoDel style delay based drops for the tunnel uplink"""
+
+import collections
+import logging
+import math
+import threading
+import time
+
+
+class _Flow:
+    """The backlog and CoDel state of a single flow"""
+
+    __slots__ = ("key", "packets", "bytes", "deficit", "firstAboveTime",
+                 "dropping", "dropNext", "count", "active")
+
+    def __init__(self, key):
+        self.key = key
+        self.packets = collections.deque()  # (enqueueTime, size, item)
+        self.bytes = 0
+        self.deficit = 0
+        self.firstAboveTime = 0.0
+        self.dropping = False
+        self.dropNext = 0.0
+        self.count = 0
+        self.active = False
+
+
+class FlowQueue:
+    """A bounded FQ-CoDel style queue
+
+    Packets are hashed into flows by the caller supplied key.  Flows are served
+    with deficit round robin, new (sparse) flows ahead of old (bulk) ones, so a
+    single bulk transfer can't starve interactive traffic.  Each flow runs the
+    CoDel control law on the sojourn time of its head packet, and when the queue
+    is full the head of the fattest flow is dropped to make room.
+
+    Times are in seconds.  The defaults are sized for LoRa, where a single
+    200 byte packet can occupy the channel for the better part of a second.
+    """
+
+    def __init__(self, maxPackets=64, quantum=256, target=1.0, interval=10.0, clock=time.monotonic):
+        if maxPackets < 1:
+            raise ValueError("FlowQueue() maxPackets must be at least 1")
+        self.maxPackets = maxPackets
+        self.quantum = quantum
+        self.target = target
+        self.interval = interval
+        self._clock = clock
+        self._flows = {}
+        self._newFlows = collections.deque()
+        self._oldFlows = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.depth = 0
+        self.backlogBytes = 0
+        self.enqueued = 0
+        self.dequeued = 0
+        self.overflowDrops = 0
+        self.codelDrops = 0
+        self.lastSojourn = 0.0
+        self.maxSojourn = 0.0
+        self.avgSojourn = 0.0
+
+    def enqueue(self, key, item, size):
+        """Queue item (of size bytes) on the flow identified by key
+
+        Returns False if the queue was closed, True otherwise (even if an older
+        packet had to be dropped to make room).
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if self.depth >= self.maxPackets:
+                self._dropFromFattest()
+            flow = self._flows.get(key)
+            if flow is None:
+                flow = self._flows[key] = _Flow(key)
+            flow.packets.append((self._clock(), size, item))
+            flow.bytes += size
+            self.depth += 1
+            self.backlogBytes += size
+            self.enqueued += 1
+            if not flow.active:
+                flow.active = True
+                flow.deficit = self.quantum
+                self._newFlows.append(flow)
+            self._cond.notify()
+            return True
+
+    def dequeue(self, timeout=None):
+        """Return the next item to transmit, or None on timeout or close"""
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            while True:
+                item = self._dequeueLocked()
+                if item is not None or self._closed:
+                    return item
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+
+    def close(self):
+        """Wake up any waiting consumer and refuse further packets"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a snapshot of the queue counters"""
+        with self._cond:
+            return {
+                "depth": self.depth,
+                "backlog_bytes": self.backlogBytes,
+                "flows": sum(1 for f in self._flows.values() if f.active),
+                "enqueued": self.enqueued,
+                "dequeued": self.dequeued,
+                "overflow_drops": self.overflowDrops,
+                "codel_drops": self.codelDrops,
+                "last_sojourn": self.lastSojourn,
+                "avg_sojourn": self.avgSojourn,
+                "max_sojourn": self.maxSojourn,
+            }
+
+    def _dequeueLocked(self):
+        while self._newFlows or self._oldFlows:
+            fromNew = bool(self._newFlows)
+            queue = self._newFlows if fromNew else self._oldFlows
+            flow = queue[0]
+            if flow.deficit <= 0:
+                flow.deficit += self.quantum
+                queue.popleft()
+                self._oldFlows.append(flow)
+                continue
+
+            entry = self._codelDequeue(flow)
+            if entry is None:
+                queue.popleft()
+                if fromNew and self._oldFlows:
+                    # give an emptied new flow one more round as an old flow,
+                    # so it can't regain priority by sending in tiny bursts
+                    self._oldFlows.append(flow)
+                else:
+                    flow.active = False
+                    del self._flows[flow.key]
+                continue
+
+            enqTime, size, item = entry
+            flow.deficit -= size
+            self.dequeued += 1
+            return item
+        return None
+
+    def _popHead(self, flow):
+        enqTime, size, item = flow.packets.popleft()
+        flow.bytes -= size
+        self.depth -= 1
+        self.backlogBytes -= size
+        return enqTime, size, item
+
+    def _codelDequeue(self, flow):
+        """Pop the head of flow, applying the CoDel drop law"""
+        now = self._clock()
+        while flow.packets:
+            entry = self._popHead(flow)
+            sojourn = now - entry[0]
+            self._recordSojourn(sojourn)
+            okToDrop = self._okToDrop(flow, sojourn, now)
+            if flow.dropping:
+                if not okToDrop:
+                    flow.dropping = False
+                    return entry
+                if now >= flow.dropNext and flow.packets:
+                    self._codelDrop(flow, entry)
+                    flow.count += 1
+                    flow.dropNext = self._controlLaw(flow.dropNext, flow.count)
+                    continue
+                return entry
+            if okToDrop and flow.packets:
+                self._codelDrop(flow, entry)
+                flow.dropping = True
+                # restart close to the previous drop rate if we were dropping recently
+                if now - flow.dropNext < 16 * self.interval and flow.count > 2:
+                    flow.count -= 2
+                else:
+                    flow.count = 1
+                flow.dropNext = self._controlLaw(now, flow.count)
+                continue
+            return entry
+        flow.dropping = False
+        return None
+
+    def _okToDrop(self, flow, sojourn, now):
+        if sojourn < self.target or not flow.packets:
+            flow.firstAboveTime = 0.0
+            return False
+        if flow.firstAboveTime == 0.0:
+            flow.firstAboveTime = now + self.interval
+            return False
+        return now >= flow.firstAboveTime
+
+    def _controlLaw(self, t, count):
+        return t + self.interval / math.sqrt(count)
+
+    def _codelDrop(self, flow, entry):
+        self.codelDrops += 1
+        logging.debug(f"CoDel dropping packet of {entry[1]} bytes from flow {flow.key}")
+
+    def _dropFromFattest(self):
+        fattest = max(self._flows.values(), key=lambda f: f.bytes, default=None)
+        if fattest is None or not fattest.packets:
+            return
+        entry = self._popHead(fattest)
+        self.overflowDrops += 1
+        logging.debug(f"Queue full, dropping packet of {entry[1]} bytes from flow {fattest.key}")
+
+    def _recordSojourn(self, sojourn):
+        self.lastSojourn = sojourn
+        self.maxSojourn = max(self.maxSojourn, sojourn)
+        self.avgSojourn = sojourn if self.dequeued == 0 else 0.9 * self.avgSojourn + 0.1 * sojourn
+
+
+def flowKey(p):
+    """Return the flow key (protocol, addresses and ports) for an IPv4 packet"""
+    if len(p) < 20:
+        return (None,)
+    protocol = p[9]
+    srcaddr = bytes(p[12:16])
+    destAddr = bytes(p[16:20])
+    if protocol in (0x06, 0x11) and len(p) >= 24:
+        headerLen = (p[0] & 0x0F) * 4
+        ports = bytes(p[headerLen:headerLen + 4])
+        return (protocol, srcaddr, destAddr, ports)
+    return (protocol, srcaddr, destAddr)
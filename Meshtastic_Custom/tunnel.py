@@ -3,6 +3,7 @@
 import logging
 import platform
 import threading
+import time
 
 from pubsub import pub
 from pytap2 import TapDevice
@@ -10,6 +11,8 @@ from pytap2 import TapDevice
 from meshtastic import portnums_pb2, mt_config
 from meshtastic.util import ipstr, readnet_u16
 
+from Meshtastic_Custom.flow_queue import FlowQueue, flowKey
+
 def onTunnelReceive(packet, interface):
     """Callback for received tunneled messages from mesh."""
     logging.debug(f"in onTunnelReceive()")
@@ -26,12 +29,16 @@ class Tunnel:
             self.message = message
             super().__init__(self.message)
 
-    def __init__(self, iface, subnet="10.115", netmask="255.255.0.0"):
+    def __init__(self, iface, subnet="10.115", netmask="255.255.0.0", queueLimit=64, txInterval=0.0, metrics=None, hopLimitFor=None):
         """
         Constructor
 
         iface is the already open MeshInterface instance
         subnet is used to construct our network number (normally 10.115.x.x)
+        queueLimit is the most packets we hold for the mesh before dropping
+        txInterval is the minimum time in seconds between packets handed to the radio
+        metrics is an optional MetricsRegistry to record tunnel traffic in
+        hopLimitFor is an optional function giving the hop limit for a node id (None for the radio's default)
         """
 
         if not iface:
@@ -46,6 +53,14 @@ class Tunnel:
         self.iface = iface
         self.subnetPrefix = subnet
         self._closing = False  # Initialize the _closing attribute
+        self.txInterval = txInterval
+        self.txQueue = FlowQueue(maxPackets=queueLimit)
+        self.noRouteDrops = 0
+        self.metrics = metrics
+        self.hopLimitFor = hopLimitFor
+        if metrics:
+            self._packetCounter = metrics.counter("tunnel_packets_total", "Tunnel packets, by direction")
+            self._sojournHistogram = metrics.histogram("tunnel_queue_sojourn_seconds", "Time packets wait in the tunnel uplink queue")
         
         if platform.system() != "Linux":
             raise Tunnel.TunnelError("Tunnel() can only be run instantiated on a Linux system")
@@ -114,7 +129,12 @@ class Tunnel:
                 target=self._tunReader, args=(), daemon=True
             )
             self._rxThread.start()
-        
+
+        # The uplink is drained by its own thread, so a slow (or full) radio
+        # queue backs up into txQueue where it is scheduled fairly per flow
+        self._txThread = threading.Thread(target=self._meshWriter, args=(), daemon=True)
+        self._txThread.start()
+
     def onReceive(self, packet):
         """onReceive"""
         if self._closing:
@@ -125,6 +145,8 @@ class Tunnel:
             logging.debug("Ignoring message we sent")
         else:
             logging.debug(f"Received mesh tunnel message type={type(p)} len={len(p)}")
+            if self.metrics:
+                self._packetCounter.inc(direction="rx")
             if not self.iface.noProto:
                 if not self._shouldFilterPacket(p):
                     self.tun.write(p)
@@ -181,7 +203,7 @@ class Tunnel:
                 p = tap.read()
                 destAddr = p[16:20]
                 if not self._shouldFilterPacket(p):
-                    self.sendPacket(destAddr, p)
+                    self.queuePacket(destAddr, p)
             except OSError as e:
                 if e.errno == 9:  # Bad file descriptor
                     logging.debug("TUN device closed, exiting reader thread.")
@@ -189,7 +211,35 @@ class Tunnel:
                 else:
                     raise
 
+    def queuePacket(self, destAddr, p):
+        """Queue the provided IP packet for the mesh, scheduled fairly per flow"""
+        return self.txQueue.enqueue(flowKey(p), (destAddr, p), len(p))
+
+    def _meshWriter(self):
+        logging.debug("mesh writer running")
+        while not self._closing:
+            entry = self.txQueue.dequeue(timeout=1.0)
+            if entry is None:
+                continue
+            destAddr, p = entry
+            if self.metrics:
+                self._sojournHistogram.observe(self.txQueue.lastSojourn)
+            try:
+                self.sendPacket(destAddr, p)
+            except Exception as e:
+                logging.warning(f"Failed to forward tunnel packet: {e}")
+            if self.txInterval:
+                time.sleep(self.txInterval)
+
+    def queueStats(self):
+        """Return the uplink queue depth, sojourn time and drop counters"""
+        stats = self.txQueue.stats()
+        stats["no_route_drops"] = self.noRouteDrops
+        return stats
+
     def _ipToNodeId(self, ipAddr):
+        if isinstance(ipAddr, (bytes, bytearray)):
+            ipAddr = ipstr(ipAddr)
         ipBits = ipAddr.split('.')
         ipBits = int(ipBits[2]) * 256 + int(ipBits[3])
 
@@ -208,20 +258,29 @@ class Tunnel:
     def sendPacket(self, destAddr, p):
         """Forward the provided IP packet into the mesh"""
         nodeId = self._ipToNodeId(destAddr)
+        destStr = destAddr if isinstance(destAddr, str) else ipstr(destAddr)
         if nodeId is not None:
             logging.debug(
-                f"Forwarding packet bytelen={len(p)} dest={ipstr(destAddr)}, destNode={nodeId}"
+                f"Forwarding packet bytelen={len(p)} dest={destStr}, destNode={nodeId}"
             )
-            self.iface.sendData(p, nodeId, portnums_pb2.IP_TUNNEL_APP, wantAck=False)
+            hopLimit = self.hopLimitFor(nodeId) if self.hopLimitFor else None
+            if hopLimit is not None:
+                self.iface.sendData(p, nodeId, portnums_pb2.IP_TUNNEL_APP, wantAck=False, hopLimit=hopLimit)
+            else:
+                self.iface.sendData(p, nodeId, portnums_pb2.IP_TUNNEL_APP, wantAck=False)
+            if self.metrics:
+                self._packetCounter.inc(direction="tx")
         else:
+            self.noRouteDrops += 1
             logging.warning(
-                f"Dropping packet because no node found for destIP={ipstr(destAddr)}"
+                f"Dropping packet because no node found for destIP={destStr}"
             )
 
     def close(self):
         """Close"""
         print("TUN Closing")
         self._closing = True
+        self.txQueue.close()
         if self.tun:
             self.tun.close()
             print("TUN Closed Succesfully!")
@@ -0,0 +1,99 @@
+"""Cost of many sends awaiting their ACKs at once: a thread each versus AsyncMeshCore coroutines
+
+Every send goes to a node that never answers, so each one stays pending for
+the whole --timeout.  The thread model is what the app did before the core:
+one thread per send_text_message, blocked on its threading.Event.  The core
+runs the same number of send_text coroutines on one event loop.  Reports the
+time to get every send on air, the total time, the peak thread count and the
+resident memory added while they were pending (Linux only).
+
+    python benchmarks/bench_async_core.py [--counts 100 1000 5000] [--max-threads 2000]
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.async_core import AsyncMeshCore
+from run_benchmarks import make_pair
+
+NOWHERE = "!0000beef"  # A node id nothing answers for
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_threads(app, count):
+    before = rss_kb()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=app.send_text_message, args=(f"message {i}", 0, NOWHERE), daemon=True)
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    launched = time.perf_counter() - start
+    peak_threads, peak_rss = threading.active_count(), rss_kb()
+    for thread in threads:
+        thread.join()
+    return launched, time.perf_counter() - start, peak_threads, peak_rss, before
+
+
+def run_core(app, count):
+    async def session():
+        async with AsyncMeshCore(app) as core:
+            before = rss_kb()
+            start = time.perf_counter()
+            sends = [asyncio.ensure_future(core.send_text(f"message {i}", NOWHERE)) for i in range(count)]
+            while core.pending < count and not all(send.done() for send in sends):
+                await asyncio.sleep(0.001)
+            launched = time.perf_counter() - start
+            peak_threads, peak_rss = threading.active_count(), rss_kb()
+            await asyncio.gather(*sends)
+            return launched, time.perf_counter() - start, peak_threads, peak_rss, before
+    return asyncio.run(session())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--max-threads", type=int, default=2000, help="skip the thread model above this many")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds each send waits for its ACK")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    mesh, sender, receiver = make_pair(0.0, 0.001, 1, bandwidth=1e9)  # Airtime out of the picture
+    sender.timeout = args.timeout
+    sender.compress_text = False  # Unknown peers would get a capability query per message
+    results = []
+    with quiet():
+        for count in args.counts:
+            row = {"pending_sends": count}
+            models = [("core", run_core)] + ([("threads", run_threads)] if count <= args.max_threads else [])
+            for model, run in models:
+                launched, total, threads, peak_rss, rss_before = run(sender, count)
+                row[model] = {
+                    "launch_s": launched,
+                    "total_s": total,
+                    "peak_threads": threads,
+                    "added_rss_kb": peak_rss - rss_before if peak_rss is not None and rss_before is not None else None,
+                }
+            results.append(row)
+    sender.close()
+    receiver.close()
+    mesh.close()
+    write_results({"meta": metadata(), "ack_timeout_s": args.timeout, "runs": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Sending a folder file by file versus as one bundle transfer
+
+Both runs use a fresh simulated link.  "files" sends every file with its own
+announcement and chunk loop, the way a folder had to be sent before; "bundle"
+sends one compressed bundle (Class/bundle.py) that the receiver unpacks at
+once.  Folders: the corpus in received_files/, and a synthetic folder of many
+small, similar text files (the case whole-bundle compression is for).
+
+    python benchmarks/bench_bundle.py [--small-files 40] [--time-scale 0.02]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import CORPUS_DIR, metadata, quiet, write_results
+
+from Class.bundle import collect_files, pack_directory
+from run_benchmarks import SIM_TIMEOUT, make_pair
+
+
+def make_small_files(directory, count, seed):
+    rng = random.Random(seed)
+    words = ["node", "battery", "position", "ok", "relay", "hilltop", "camp", "water", "north", "south"]
+    for i in range(count):
+        lines = [f"report {i}"] + [" ".join(rng.choice(words) for _ in range(6)) for _ in range(4)]
+        with open(os.path.join(directory, f"report_{i:03d}.txt"), "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def wait_for(paths, args):
+    deadline = time.perf_counter() + SIM_TIMEOUT * args.time_scale
+    while not all(os.path.exists(p) for p in paths) and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return all(os.path.exists(p) for p in paths)
+
+
+def send_folder(directory, as_bundle, args):
+    out_dir = tempfile.mkdtemp(prefix="bench_bundle_")
+    try:
+        mesh, sender, receiver = make_pair(args.loss, args.time_scale, args.seed)
+        receiver.received_dir = out_dir
+        files = collect_files(directory)
+        start = time.perf_counter()
+        with quiet():
+            if as_bundle:
+                name, bundle, _ = pack_directory(directory)
+                sender.send_data_in_chunks(bundle, name + ".bundle", announce_extra={"kind": "bundle"})
+                completed = wait_for([os.path.join(out_dir, name, relative) for relative, _ in files], args)
+            else:
+                for relative, path in files:
+                    with open(path, "rb") as file:
+                        sender.send_data_in_chunks(file.read(), relative)
+                completed = wait_for([os.path.join(out_dir, relative) for relative, _ in files], args)
+        wall = time.perf_counter() - start
+        row = {
+            "completed": completed,
+            "bytes_on_air": mesh.stats["bytes_sent"],
+            "packets_on_air": mesh.stats["transmissions"],
+            "completion_s": wall / args.time_scale,
+        }
+        mesh.close()
+        return row
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def bench_folder(label, directory, args):
+    files = collect_files(directory)
+    files_row = send_folder(directory, False, args)
+    bundle_row = send_folder(directory, True, args)
+    return {
+        "folder": label,
+        "files": len(files),
+        "bytes": sum(os.path.getsize(path) for _, path in files),
+        "bundle_bytes": len(pack_directory(directory)[1]),
+        "file_by_file": files_row,
+        "bundle": bundle_row,
+        "bytes_saved_pct": 100.0 * (1 - bundle_row["bytes_on_air"] / files_row["bytes_on_air"])
+        if files_row["bytes_on_air"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--small-files", type=int, default=40)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = {"meta": metadata(), "folders": [bench_folder("corpus", CORPUS_DIR, args)]}
+    small_dir = tempfile.mkdtemp(prefix="bench_small_files_")
+    try:
+        make_small_files(small_dir, args.small_files, args.seed)
+        results["folders"].append(bench_folder(f"{args.small_files} small text files", small_dir, args))
+    finally:
+        shutil.rmtree(small_dir, ignore_errors=True)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Packets and ACKs for a burst of short chat lines, one packet each versus coalesced
+
+On a fresh simulated link the sender queues --lines short messages through the
+outbox (as the desktop app's Send button does), one every --interval simulated
+seconds, twice: with coalescing off (every line its own packet and ACK round
+trip) and on (lines queued within the coalesce window, or while an earlier
+packet awaits its ACK, share a MULTIMSG packet).  Reports packets, bytes and
+airtime on air, ACKs, the time until the last line is delivered, and whether
+the receiver got every line, in order, as its own message.
+
+    python benchmarks/bench_coalesce.py [--lines 20] [--interval 1.0]
+"""
+
+import argparse
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.outbox import PENDING_STATES, STATE_DELIVERED
+from run_benchmarks import make_pair
+
+OUTBOX_PACE = 5.0  # Simulated seconds, the outbox default
+
+
+def run(lines, args, coalesce):
+    mesh, sender, receiver = make_pair(args.loss, args.time_scale, args.seed)
+    received = []
+    receiver.on_receive_callback = lambda message, message_type="INFO": \
+        received.append(message.split(": ", 1)[1]) if message_type == "RECEIVED" else None
+    sender.outbox.pace = OUTBOX_PACE * args.time_scale
+    sender.outbox.coalesce_window *= args.time_scale
+    if not coalesce:
+        sender.outbox.send_batch = None
+    with quiet():
+        start = time.perf_counter()
+        for line in lines:
+            sender.queue_text_message(line, 0)
+            time.sleep(args.interval * args.time_scale)
+        while sender.outbox.pending():
+            time.sleep(0.01)
+        done = (time.perf_counter() - start) / args.time_scale
+        time.sleep(0.2)  # Let the last packet reach the receiver's callback
+    delivered = sum(1 for entry in sender.outbox.entries if entry["state"] == STATE_DELIVERED)
+    results = {
+        "lines": len(lines),
+        "delivered": delivered,
+        "failed": sum(1 for entry in sender.outbox.entries if entry["state"] not in PENDING_STATES + (STATE_DELIVERED,)),
+        "received_in_order": received == lines,
+        "packets_on_air": mesh.stats["packets_sent"],
+        "bytes_on_air": mesh.stats["bytes_sent"],
+        "airtime_s": mesh.stats["airtime"],  # Headers included
+        "acks": mesh.stats["acks"],
+        "all_delivered_s": done,
+    }
+    sender.close()
+    mesh.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=1.0, help="simulated seconds between lines")
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    words = ["ok", "on my way", "copy that", "at the trailhead", "battery 40%", "see you at 5", "roger", "any news?"]
+    lines = [f"{words[i % len(words)]} #{i}" for i in range(args.lines)]
+    single = run(lines, args, coalesce=False)
+    coalesced = run(lines, args, coalesce=True)
+    results = {
+        "meta": metadata(),
+        "interval_s": args.interval,
+        "one_packet_per_line": single,
+        "coalesced": coalesced,
+        "packets_saved_pct": 100.0 * (1 - coalesced["packets_on_air"] / single["packets_on_air"]),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
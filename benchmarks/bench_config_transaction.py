@@ -0,0 +1,87 @@
+"""Reconfiguring a radio's channels: one admin write per edit versus one ChannelTransaction
+
+Gives the simulated radio --channels secondary channels, each with a name
+and its own PSK, the way the GUI did before Apply All: add_channel, then
+set_psk, each writing its channel (and the radio saving its settings)
+right away.  Then the same configuration as one transaction, and the same
+transaction applied again to a radio that already has it.  Reports the
+admin messages sent and the settings saves on the radio, counted by the
+simulator, and an estimated time at --round-trip seconds per admin
+message and --save seconds per settings save.  The read-back is counted
+as one request per channel, as the meshtastic library asks for them.
+
+    python benchmarks/bench_config_transaction.py [--channels 7] [--round-trip 0.05] [--save 0.3]
+"""
+
+import argparse
+import os
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import MeshtasticChatApp
+from Class.metrics import MetricsRegistry
+
+
+def configuration(count):
+    # By index and role, so applying it again to a radio that has it changes nothing
+    return [{"index": i, "role": "SECONDARY", "name": f"team-{i}", "psk": os.urandom(32)} for i in range(1, count + 1)]
+
+
+def counts(node, round_trip, save, read_back=0):
+    admin = node.admin_writes + read_back
+    return {"admin_messages": admin, "settings_saves": node.settings_commits,
+            "estimated_s": admin * round_trip + node.settings_commits * save}
+
+
+def run(mode, config, round_trip, save):
+    mesh = SimulatedMesh(seed=1)
+    app = MeshtasticChatApp("sim", None, interface=mesh.add_node(0x0B0B0001, long_name="Radio"),
+                            metrics=MetricsRegistry())
+    node = app.interface.localNode
+    results = {}
+    with quiet():
+        if mode == "per_edit":
+            for channel in config:
+                app.add_channel(channel["name"])
+                index = next(c.index for c in node.channels if c.settings.name == channel["name"])
+                app.set_psk(index, channel["psk"])
+            results["apply"] = counts(node, round_trip, save)
+        else:
+            for label in ("apply", "reapply"):
+                node.admin_writes = node.settings_commits = 0
+                result = app.apply_channel_edits(config)
+                read_back = len(node.channels) if result["verified"] is not None else 0
+                node.admin_writes -= 1 if read_back else 0  # The simulator counts the read-back as one
+                results[label] = dict(counts(node, round_trip, save, read_back), written=len(result["written"]),
+                                      verified=result["verified"])
+    configured = [(c["Name"], c["PSK"]) for c in app.get_channels() if c["Role"] == "SECONDARY"]
+    results["channels_configured"] = len(configured)
+    app.close()
+    mesh.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=7, help="secondary channels to configure (at most 7)")
+    parser.add_argument("--round-trip", type=float, default=0.05, help="seconds per admin message over the link")
+    parser.add_argument("--save", type=float, default=0.3, help="seconds the radio takes to save its settings")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    config = configuration(min(args.channels, 7))
+    results = {
+        "meta": metadata(),
+        "channels": len(config),
+        "round_trip_s": args.round_trip,
+        "save_s": args.save,
+        "per_edit": run("per_edit", config, args.round_trip, args.save),
+        "transaction": run("transaction", config, args.round_trip, args.save),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Friends list at scale: the old friends.json list versus the ContactStore log
+
+Adds --contacts friends one at a time, the way the GUI's Add Friend does.
+The old list checks membership with a linear scan and rewrites all of
+friends.json on every add; the store checks a dict and appends one line.
+Then it times loading each from disk, and the friend picker's filter as a
+name is typed one key at a time over all the contacts (the old list had no
+filter, so a plain substring scan over its ids stands in for one).  Reports
+the time per add and per keystroke, the load time and the log size before
+and after compaction.
+
+    python benchmarks/bench_contacts.py [--contacts 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, summarize, write_results
+
+from Class.contacts import ContactStore
+
+NAMES = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet")
+
+
+def people(count, seed):
+    rng = random.Random(seed)
+    return [(f"!{rng.getrandbits(32):08x}", f"{rng.choice(NAMES).title()} {rng.choice(NAMES).title()} {i}")
+            for i in range(count)]
+
+
+def bench_legacy(contacts, path, query):
+    friends = []
+    start = time.perf_counter()
+    for contact_id, _ in contacts:
+        if contact_id in friends:
+            continue
+        friends.append(contact_id)
+        with open(path, "w") as file:
+            json.dump(friends, file)
+    add_s = (time.perf_counter() - start) / len(contacts)
+    start = time.perf_counter()
+    with open(path, "r") as file:
+        friends = json.load(file)
+    load_s = time.perf_counter() - start
+    keystrokes = []
+    for end in range(1, len(query) + 1):
+        start = time.perf_counter()
+        [friend for friend in friends if query[:end] in friend.lower()]
+        keystrokes.append((time.perf_counter() - start) * 1000)
+    return {"add_ms": add_s * 1000, "load_ms": load_s * 1000, "keystroke_ms": summarize(keystrokes),
+            "file_bytes": os.path.getsize(path)}
+
+
+def bench_store(contacts, path, query):
+    store = ContactStore(path, legacy_path=os.path.join(os.path.dirname(path), "none.json")).load()
+    start = time.perf_counter()
+    for contact_id, name in contacts:
+        if contact_id in store:
+            continue
+        store.add(contact_id, long_name=name)
+    add_s = (time.perf_counter() - start) / len(contacts)
+    for contact_id, name in contacts[:len(contacts) // 10]:
+        store.add(contact_id, notes=f"met {name}")  # Edits append more lines
+    log_bytes = os.path.getsize(path)
+    start = time.perf_counter()
+    store = ContactStore(path).load()
+    load_s = time.perf_counter() - start
+    keystrokes, matches = [], 0
+    for end in range(1, len(query) + 1):
+        start = time.perf_counter()
+        matches = len(store.search(query[:end], limit=200))
+        keystrokes.append((time.perf_counter() - start) * 1000)
+    store.compact()
+    return {"add_ms": add_s * 1000, "load_ms": load_s * 1000, "keystroke_ms": summarize(keystrokes),
+            "rows_for_full_query": matches, "log_bytes": log_bytes, "compacted_bytes": os.path.getsize(path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=5000)
+    parser.add_argument("--query", default="bravo echo 1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    contacts = people(args.contacts, args.seed)
+    directory = tempfile.mkdtemp(prefix="bench_contacts_")
+    try:
+        results = {
+            "meta": metadata(),
+            "contacts": args.contacts,
+            "query": args.query,
+            "friends_json": bench_legacy(contacts, os.path.join(directory, "friends.json"), args.query),
+            "contact_store": bench_store(contacts, os.path.join(directory, "contacts.jsonl"), args.query),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Bytes on air of a full file send versus a delta against the receiver's older copy
+
+For each (base, new) pair the receiver starts with the base in its
+received_files and the sender sends the new version twice on a fresh simulated
+link: once whole with send_data_in_chunks, once with DeltaSync.send_file (the
+signature request, the signature and the delta all count).  The corpus pairs
+are the near-duplicate files in received_files/; the synthetic pair is a large
+random file with a small edit in the middle.  Files under DELTA_MIN_SIZE are
+always sent whole, so the small corpus pairs show what that threshold saves.
+
+    python benchmarks/bench_delta.py [--synthetic-size 20000] [--time-scale 0.02]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import CORPUS_DIR, metadata, quiet, write_results
+
+from run_benchmarks import SIM_TIMEOUT, make_pair
+
+CORPUS_PAIRS = [
+    ("Einstein.txt", "Einstein2.txt"),
+    ("Einstein.txt", "Einstein3.txt"),
+    ("aldi_test.txt", "aldi_test2.txt"),
+]
+
+
+def synthetic_pair(size, seed):
+    rng = random.Random(seed)
+    base = bytes(rng.getrandbits(8) for _ in range(size))
+    middle = size // 2
+    return base, base[:middle] + b"a small edit" + base[middle + 40:]
+
+
+def send_once(base, data, name, use_delta, args):
+    """Send data to a receiver holding base as name; returns the result row"""
+    out_dir = tempfile.mkdtemp(prefix="bench_delta_")
+    try:
+        with open(os.path.join(out_dir, name), "wb") as file:
+            file.write(base)
+        mesh, sender, receiver = make_pair(args.loss, args.time_scale, args.seed)
+        receiver.received_dir = out_dir
+        target = os.path.join(out_dir, name)
+        expected = hashlib.sha256(data).hexdigest()
+
+        def arrived():
+            with open(target, "rb") as file:
+                return hashlib.sha256(file.read()).hexdigest() == expected
+
+        start = time.perf_counter()
+        with quiet():
+            if use_delta:
+                sender.delta.send_file(data, name)
+            else:
+                sender.send_data_in_chunks(data, name)
+            deadline = time.perf_counter() + SIM_TIMEOUT * args.time_scale
+            while not arrived() and time.perf_counter() < deadline:
+                time.sleep(0.005)
+        wall = time.perf_counter() - start
+        row = {
+            "completed": arrived(),
+            "bytes_on_air": mesh.stats["bytes_sent"],
+            "packets_on_air": mesh.stats["transmissions"],
+            "completion_s": wall / args.time_scale,
+        }
+        mesh.close()
+        return row
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def bench_pair(label, base, data, args):
+    # Both sends use the new file's name, so the receiver's base is "the file it already has"
+    name = "delta_target.bin"
+    full = send_once(base, data, name, False, args)
+    delta = send_once(base, data, name, True, args)
+    return {
+        "pair": label,
+        "base_size": len(base),
+        "size": len(data),
+        "full": full,
+        "delta": delta,
+        "bytes_saved_pct": 100.0 * (1 - delta["bytes_on_air"] / full["bytes_on_air"]) if full["bytes_on_air"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--synthetic-size", type=int, default=20000)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = {"meta": metadata(), "pairs": []}
+    for base_name, new_name in CORPUS_PAIRS:
+        try:
+            with open(os.path.join(CORPUS_DIR, base_name), "rb") as file:
+                base = file.read()
+            with open(os.path.join(CORPUS_DIR, new_name), "rb") as file:
+                data = file.read()
+        except OSError as e:
+            results["pairs"].append({"pair": f"{base_name} -> {new_name}", "skipped": str(e)})
+            continue
+        results["pairs"].append(bench_pair(f"{base_name} -> {new_name}", base, data, args))
+    base, data = synthetic_pair(args.synthetic_size, args.seed)
+    results["pairs"].append(bench_pair(f"synthetic {args.synthetic_size} B, 12 B edit", base, data, args))
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Traceroute and tunnel throughput on the in-process simulated mesh
+
+Builds a chain of simulated radios (A - relay... - B) and measures:
+  * traceroute round trip time from A to B through MeshtasticChatApp.sendTraceRoute,
+    and a repeat lookup answered from the route cache
+  * IP tunnel goodput from A to B through Tunnel.queuePacket (Linux only)
+
+    python benchmarks/bench_mesh_sim.py [--relays 2] [--loss 0.05] [--time-scale 0.05]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pubsub import pub  # noqa: E402
+
+from Class.mesh_simulator import SimulatedMesh  # noqa: E402
+from Class.meshtastic_chat_app import MeshtasticChatApp  # noqa: E402
+
+
+def build_chain(relays, loss, time_scale, bandwidth, seed=1, noProto=False):
+    mesh = SimulatedMesh(seed=seed, time_scale=time_scale, default_hop_limit=max(3, relays))
+    nodes = [mesh.add_node(0x10000000 + i, noProto=noProto) for i in range(relays + 2)]
+    for a, b in zip(nodes, nodes[1:]):
+        mesh.connect(a, b, loss=loss, bandwidth=bandwidth)
+    return mesh, nodes
+
+
+def bench_traceroute(args, runs=5):
+    mesh, nodes = build_chain(args.relays, args.loss, args.time_scale, args.bandwidth)
+    app = MeshtasticChatApp("sim", nodes[-1].user["id"], interface=nodes[0], timeout=5)
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(runs):
+            app.traceroutes.invalidate()  # Measure the air, not the route cache
+            start = time.perf_counter()
+            if app.sendTraceRoute(nodes[-1].user["id"], hopLimit=args.relays + 1):
+                times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        cached = app.sendTraceRoute(nodes[-1].user["id"], hopLimit=args.relays + 1)
+        cached_s = time.perf_counter() - start
+    mesh.close()
+    return {"runs": runs, "completed": len(times), "rtt_s": times, "cached_lookup_s": cached_s if cached else None}
+
+
+def ipv4_packet(src, dst, payload, sport=40000, dport=5000):
+    udp = struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, 0x11, 0,
+                         bytes(map(int, src.split("."))), bytes(map(int, dst.split("."))))
+    return header + udp
+
+
+def bench_tunnel(args, packets=50, size=180):
+    if platform.system() != "Linux":
+        return {"skipped": "the tunnel only runs on Linux"}
+    from Meshtastic_Custom.tunnel import Tunnel
+
+    mesh, nodes = build_chain(args.relays, args.loss, args.time_scale, args.bandwidth, noProto=True)
+    received = []
+    done = threading.Event()
+
+    def on_tunnel_packet(packet, interface):
+        if interface is nodes[-1]:
+            received.append(len(packet["decoded"]["payload"]))
+            if len(received) >= packets:
+                done.set()
+
+    pub.subscribe(on_tunnel_packet, "meshtastic.receive.data.IP_TUNNEL_APP")
+    with contextlib.redirect_stdout(io.StringIO()):
+        tunnel = Tunnel(nodes[0], queueLimit=packets)
+        src = tunnel._nodeNumToIp(nodes[0].node_num)
+        dst = tunnel._nodeNumToIp(nodes[-1].node_num)
+        start = time.perf_counter()
+        for i in range(packets):
+            tunnel.queuePacket(dst, ipv4_packet(src, dst, bytes(size - 28)))
+        done.wait(timeout=args.timeout)
+        elapsed = time.perf_counter() - start
+        tunnel.close()
+    pub.unsubscribe(on_tunnel_packet, "meshtastic.receive.data.IP_TUNNEL_APP")
+    mesh.close()
+    return {
+        "packets_sent": packets,
+        "packets_received": len(received),
+        "elapsed_s": elapsed,
+        "simulated_goodput_bps": sum(received) * 8 / (elapsed / args.time_scale) if elapsed else None,
+        "queue": tunnel.queueStats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--relays", type=int, default=1)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=1000.0, help="link rate in bytes/s")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="wall seconds per simulated second")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = {"params": vars(args), "traceroute": bench_traceroute(args), "tunnel": bench_tunnel(args)}
+    text = json.dumps(results, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+
+
+if __name__ == "__main__":
+    main()
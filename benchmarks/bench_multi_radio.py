@@ -0,0 +1,118 @@
+"""File transfer throughput with one, two and three radios in a RadioPool, and failover
+
+The sender drives --radios radios as one RadioPool, each linked directly to
+the receiver on its own channel (the simulator gives every radio its own
+airtime, as separate channels or presets would on air).  The same file is
+sent with 1..N radios; the pool spreads its chunks over every radio that has
+heard the receiver.  The failover run closes one radio a third of the way
+into the transfer, and the file must still arrive intact.  Reports the
+completion time, throughput, speed-up over one radio and chunks failed over.
+
+    python benchmarks/bench_multi_radio.py [--size 6000] [--radios 3]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import MeshtasticChatApp
+from Class.metrics import MetricsRegistry
+from Class.multi_radio import RadioPool
+from run_benchmarks import SIM_TIMEOUT
+
+RECEIVER = 0x0B0B0001
+
+
+def run(data, radio_count, args, out_dir, fail_after=None):
+    mesh = SimulatedMesh(seed=args.seed, time_scale=args.time_scale)
+    receiver_iface = mesh.add_node(RECEIVER, long_name="Receiver")
+    radios = [mesh.add_node(0x0A0A0001 + i, long_name=f"Sender radio {i + 1}") for i in range(radio_count)]
+    for radio in radios:
+        mesh.connect(radio, receiver_iface, loss=args.loss)
+    pool = RadioPool(radios)
+    sender = MeshtasticChatApp("sim", receiver_iface.user["id"], interface=pool, metrics=MetricsRegistry(),
+                               timeout=SIM_TIMEOUT * args.time_scale)
+    sender.retry_delay = 2 * args.time_scale
+    receiver = MeshtasticChatApp("sim", radios[0].user["id"], interface=receiver_iface, metrics=MetricsRegistry(),
+                                 timeout=SIM_TIMEOUT * args.time_scale)
+    receiver.received_dir = out_dir
+    name = f"multi_{radio_count}_{fail_after is not None}.bin"
+    target = os.path.join(out_dir, name)
+
+    if fail_after is not None:
+        progress = threading.Event()
+        total = (len(data) + 99) // 100
+
+        def on_progress(sent, total_chunks):
+            if sent >= total * fail_after:
+                progress.set()
+
+        def pull_plug():
+            if progress.wait(timeout=60):
+                radios[-1].close()
+        threading.Thread(target=pull_plug, daemon=True).start()
+    else:
+        on_progress = None
+
+    with quiet():
+        start = time.perf_counter()
+        ok = sender.send_data_in_chunks(data, name, on_progress)
+        deadline = time.perf_counter() + SIM_TIMEOUT * args.time_scale
+        while not os.path.exists(target) and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        elapsed = (time.perf_counter() - start) / args.time_scale
+    intact = ok and os.path.exists(target) and open(target, "rb").read() == data
+    results = {
+        "radios": radio_count,
+        "completed": intact,
+        "completion_s": elapsed,
+        "throughput_bps": len(data) * 8 / elapsed if intact else 0.0,
+        "radios_connected_at_end": len(pool.connected()),
+        "chunks_failed_over": sender.m_radio_failovers.value(),
+        "packets_on_air": mesh.stats["packets_sent"],
+    }
+    sender.close()
+    receiver.close()
+    mesh.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=6000, help="bytes in the file sent")
+    parser.add_argument("--radios", type=int, default=3)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    out_dir = tempfile.mkdtemp(prefix="bench_multi_")
+    try:
+        runs = [run(data, count, args, out_dir) for count in range(1, args.radios + 1)]
+        failover = run(data, args.radios, args, out_dir, fail_after=1 / 3)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    single = runs[0]["completion_s"]
+    for result in runs:
+        result["speedup"] = single / result["completion_s"]
+    results = {
+        "meta": metadata(),
+        "size": args.size,
+        "loss": args.loss,
+        "by_radio_count": runs,
+        "failover_one_radio_lost": failover,
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
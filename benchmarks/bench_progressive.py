@@ -0,0 +1,85 @@
+"""Time to first preview and airtime saved by stopping a progressive image transfer early
+
+On a fresh simulated link the image is sent twice: sequentially to the end, and
+progressively with a receiver that stops the transfer (CANCEL) once a preview
+covers --cancel-at of the chunks, as a user would once the preview is good
+enough.  Reports the simulated time to the first preview, to the cancel and to
+the full file, and the bytes on air of both runs.
+
+    python benchmarks/bench_progressive.py [--file received_files/mountain_pic3.jpg] [--cancel-at 0.3]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import CORPUS_DIR, metadata, quiet, write_results
+
+from run_benchmarks import make_pair
+
+
+def run(data, name, args, cancel_at=None):
+    out_dir = tempfile.mkdtemp(prefix="bench_progressive_")
+    try:
+        mesh, sender, receiver = make_pair(args.loss, args.time_scale, args.seed)
+        receiver.received_dir = out_dir
+        events = {}
+        start = time.perf_counter()
+
+        def on_preview(preview):
+            now = (time.perf_counter() - start) / args.time_scale
+            events.setdefault("first_preview_s", now)
+            events["previews"] = events.get("previews", 0) + 1
+            if cancel_at is not None and not preview["done"] and preview["received"] >= cancel_at * preview["total"] \
+                    and "cancel_s" not in events:
+                events["cancel_s"] = now
+                events["chunks_at_cancel"] = preview["received"]
+                threading.Thread(target=receiver.cancel_transfer, args=(preview["name"], preview["from"])).start()
+
+        receiver.on_preview_callback = on_preview
+        with quiet():
+            if cancel_at is None:
+                sender.send_data_in_chunks(data, name)
+            else:
+                sender.send_progressive(data, name)
+        events["sender_done_s"] = (time.perf_counter() - start) / args.time_scale
+        events["bytes_on_air"] = mesh.stats["bytes_sent"]
+        events["packets_on_air"] = mesh.stats["transmissions"]
+        mesh.close()
+        return events
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", default=os.path.join(CORPUS_DIR, "mountain_pic3.jpg"))
+    parser.add_argument("--cancel-at", type=float, default=0.3, help="fraction of chunks at which the receiver stops")
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as file:
+        data = file.read()
+    name = os.path.basename(args.file)
+    sequential = run(data, name, args)
+    progressive = run(data, name, args, cancel_at=args.cancel_at)
+    results = {
+        "meta": metadata(),
+        "file": name,
+        "size": len(data),
+        "sequential": sequential,
+        "progressive": progressive,
+        "bytes_saved_pct": 100.0 * (1 - progressive["bytes_on_air"] / sequential["bytes_on_air"]),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
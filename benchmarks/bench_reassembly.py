@@ -0,0 +1,172 @@
+"""Soak test of inbound reassembly: dozens of concurrent transfers into one receiver
+
+A star of simulated senders around one receiver.  Every sender pushes its own
+file at the same time, all under the same name (test_send.txt) so transfers
+can only be told apart by sender; some senders announce a file and go quiet
+(abandoned transfers the idle timeout must evict); one announces an absurd
+total_chunks (admission control must refuse it).  The receiver runs with a
+small memory budget so sessions spill to disk.  Reports how many files
+arrived intact, peak reassembly memory, spills, evictions and refusals.
+The abandoned sessions must be dropped by the receiver's periodic sweep;
+a separate check also opens one session on a bare ReassemblyManager, lets
+its clock pass the idle timeout and waits for the sweep to drop it without
+another open().  The script exits with status 1 if either leaves a session
+behind.
+
+    python benchmarks/bench_reassembly.py [--senders 32] [--abandoned 4] [--budget 16384]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import ANNOUNCE_IDENTIFIER, MeshtasticChatApp
+from Class.reassembly import ReassemblyManager
+
+SIM_TIMEOUT = 30  # Simulated seconds the app waits for an ACK
+
+
+def sweep_evicts_idle(spill_dir):
+    """True if an idle session is evicted by the periodic sweep alone, with no later open()"""
+    now = [0.0]
+    manager = ReassemblyManager(spill_dir, idle_timeout=10, clock=lambda: now[0])
+    manager.open("!0b0b0001", {"name": "abandoned.bin", "size": 100, "total_chunks": 1})
+    manager.start_evicting(interval=0.01)
+    try:
+        time.sleep(0.05)
+        if not manager.sessions:
+            return False  # Evicted before it was idle
+        now[0] = 11.0
+        deadline = time.perf_counter() + 2
+        while manager.sessions and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        return not manager.sessions
+    finally:
+        manager.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=32)
+    parser.add_argument("--abandoned", type=int, default=4)
+    parser.add_argument("--min-size", type=int, default=400)
+    parser.add_argument("--max-size", type=int, default=3000)
+    parser.add_argument("--budget", type=int, default=16384, help="receiver memory budget in bytes")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="simulated seconds")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    out_dir = tempfile.mkdtemp(prefix="bench_reassembly_")
+    mesh = SimulatedMesh(seed=args.seed, time_scale=args.time_scale)
+    receiver_iface = mesh.add_node(0x0B000000, long_name="Receiver")
+    timeout = SIM_TIMEOUT * args.time_scale
+    receiver = MeshtasticChatApp("sim", None, interface=receiver_iface, timeout=timeout)
+    receiver.received_dir = out_dir
+    receiver.transfers.memory_budget = args.budget
+    receiver.transfers.idle_timeout = args.idle_timeout * args.time_scale
+    receiver.transfers.max_sessions = max(receiver.transfers.max_sessions, args.senders + args.abandoned + 1)
+    receiver.transfers.start_evicting(receiver.transfers.idle_timeout / 4)
+
+    received = {}  # sender -> sha256 of what the receiver assembled
+    original_complete = receiver.complete_transfer
+
+    def complete_transfer(file_name, file_data, sender_id, file_info=None, **kwargs):
+        received[sender_id] = hashlib.sha256(file_data).hexdigest()
+        original_complete(file_name, file_data, sender_id, file_info, **kwargs)
+
+    receiver.complete_transfer = complete_transfer
+
+    senders, expected = [], {}
+    for i in range(args.senders + args.abandoned + 1):
+        iface = mesh.add_node(0x0B000001 + i)
+        mesh.connect(iface, receiver_iface, bandwidth=1000.0)
+        app = MeshtasticChatApp("sim", receiver_iface.user["id"], interface=iface, timeout=timeout)
+        app.retry_delay = 2 * args.time_scale
+        senders.append(app)
+
+    peak = {"memory_bytes": 0, "sessions": 0}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.01):
+            peak["memory_bytes"] = max(peak["memory_bytes"], receiver.transfers.memory_bytes)
+            peak["sessions"] = max(peak["sessions"], len(receiver.transfers.sessions))
+
+    def send(app, data):
+        app.send_data_in_chunks(data, "test_send.txt")
+
+    def abandon(app, size):
+        info = {"name": "test_send.txt", "size": size, "total_chunks": (size + 99) // 100, "tid": "abandoned"}
+        app.send_data(ANNOUNCE_IDENTIFIER + json.dumps(info).encode("utf-8"), 0)
+
+    def flood(app):
+        info = {"name": "huge.bin", "size": 2 ** 31, "total_chunks": 2 ** 31, "tid": "huge"}
+        app.send_data(ANNOUNCE_IDENTIFIER + json.dumps(info).encode("utf-8"), 0)
+
+    threads = []
+    for index, app in enumerate(senders):
+        if index < args.senders:
+            data = bytes(rng.getrandbits(8) for _ in range(rng.randint(args.min_size, args.max_size)))
+            expected[app.interface.user["id"]] = hashlib.sha256(data).hexdigest()
+            threads.append(threading.Thread(target=send, args=(app, data)))
+        elif index < args.senders + args.abandoned:
+            threads.append(threading.Thread(target=abandon, args=(app, rng.randint(args.min_size, args.max_size))))
+        else:
+            threads.append(threading.Thread(target=flood, args=(app,)))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with quiet():
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Let the abandoned sessions go idle past the timeout; the receiver's sweep must drop them by itself
+        time.sleep(receiver.transfers.idle_timeout * 1.5)
+    wall = time.perf_counter() - start
+    stop.set()
+
+    intact = sum(1 for sender, digest in expected.items() if received.get(sender) == digest)
+    results = {
+        "meta": metadata(),
+        "senders": args.senders,
+        "abandoned": args.abandoned,
+        "budget_bytes": args.budget,
+        "intact": intact,
+        "corrupt_or_missing": args.senders - intact,
+        "peak_memory_bytes": peak["memory_bytes"],
+        "peak_sessions": peak["sessions"],
+        "left_over_sessions": len(receiver.transfers.sessions),
+        "reassembly": receiver.transfers.stats(),
+        "completion_s": wall / args.time_scale,
+        "bytes_on_air": mesh.stats["bytes_sent"],
+        "sweep_evicts_idle": sweep_evicts_idle(out_dir),
+    }
+    receiver.close()
+    for app in senders:
+        app.close()
+    mesh.close()
+    shutil.rmtree(out_dir, ignore_errors=True)
+    write_results(results, args.output)
+    if results["left_over_sessions"] or not results["sweep_evicts_idle"]:
+        print(f"Idle sessions weren't evicted: {results['left_over_sessions']} left over, "
+              f"sweep check {'passed' if results['sweep_evicts_idle'] else 'failed'}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Bytes saved per chat message by the short-string codec, against zlib
+
+Every line of the corpus (benchmarks/data/chat_corpus.txt: chat, radio
+shorthand, call signs, times, coordinates and some non-Latin text and emoji)
+is encoded the way send_text_message would for a peer that advertised the
+codec: compressed with its ESC Z marker when that is smaller, plain otherwise.
+zlib at level 9 (raw deflate, no header) is shown for comparison.  Reports
+the average bytes saved per message, the overall ratio, how many messages
+went compressed, and the encode/decode time per message.
+
+    python benchmarks/bench_short_codec.py [--corpus benchmarks/data/chat_corpus.txt]
+"""
+
+import argparse
+import os
+import time
+import zlib
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import REPO_ROOT, metadata, summarize, write_results
+
+from Class import short_codec
+
+
+def deflate(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "benchmarks", "data", "chat_corpus.txt"))
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as file:
+        messages = [line.rstrip("\n") for line in file if line.strip()]
+
+    plain_sizes, codec_sizes, zlib_sizes, saved = [], [], [], []
+    compressed_count = 0
+    start = time.perf_counter()
+    for message in messages:
+        plain = message.encode("utf-8")
+        packed = short_codec.encode_message(message)
+        if packed is not None:
+            compressed_count += 1
+            assert short_codec.decompress(packed[len(short_codec.SHORT_IDENTIFIER):]) == message
+        sent = packed if packed is not None else plain
+        plain_sizes.append(len(plain))
+        codec_sizes.append(len(sent))
+        zlib_sizes.append(min(len(deflate(plain)), len(plain)))  # Same fallback to plain text
+        saved.append(len(plain) - len(sent))
+    per_message_s = (time.perf_counter() - start) / len(messages)
+
+    results = {
+        "meta": metadata(),
+        "messages": len(messages),
+        "plain_bytes": sum(plain_sizes),
+        "plain_size": summarize(plain_sizes),
+        "short_codec": {
+            "bytes": sum(codec_sizes),
+            "ratio": sum(codec_sizes) / sum(plain_sizes),
+            "avg_bytes_saved_per_message": sum(saved) / len(messages),
+            "bytes_saved": summarize(saved),
+            "messages_compressed": compressed_count,
+            "round_trip_us_per_message": per_message_s * 1e6,
+        },
+        "zlib": {
+            "bytes": sum(zlib_sizes),
+            "ratio": sum(zlib_sizes) / sum(plain_sizes),
+            "avg_bytes_saved_per_message": (sum(plain_sizes) - sum(zlib_sizes)) / len(messages),
+        },
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
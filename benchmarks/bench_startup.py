@@ -0,0 +1,152 @@
+"""Startup time of the desktop app: module import, time to window, and the PyInstaller build
+
+Each measurement runs in a fresh interpreter.  "cold" runs use an empty bytecode
+cache (PYTHONPYCACHEPREFIX pointing at a new directory) so every module is
+compiled; "warm" runs reuse that cache.  Time to window starts the real GUI with
+MESHTASTIC_STARTUP_PROBE set and stops when the window is idle, so it needs a
+display.  The frozen exe in dist/ is timed the same way when it exists (--build
+runs PyInstaller on meshtastic_chat_desktop.spec first).
+
+It first checks that importing the GUI leaves the meshtastic package unloaded
+(it is imported when connecting) and exits with status 1 if it doesn't;
+--check stops after that check.
+
+    python benchmarks/bench_startup.py [--runs 5] [--build] [--check]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import REPO_ROOT, metadata, summarize, tk_root, write_results
+
+SPEC = os.path.join(REPO_ROOT, "meshtastic_chat_desktop.spec")
+EXE = os.path.join(REPO_ROOT, "dist", "meshtastic_chat_desktop" + (".exe" if os.name == "nt" else ""))
+PROBE_LINE = "STARTUP_PROBE window_ready"
+
+
+def child_env(pycache):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # Warm runs need the cache the cold run writes
+    env["PYTHONPYCACHEPREFIX"] = pycache
+    env["MESHTASTIC_STARTUP_PROBE"] = "1"
+    env["MESHTASTIC_METRICS_PORT"] = "0"  # Don't fight over the metrics port with a running app
+    return env
+
+
+def import_times(module, env):
+    """Wall time of importing module, plus the slowest top-level imports from -X importtime"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                          env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and len(match.group(2)) <= 2:  # The module itself and its direct imports
+            cumulative[match.group(3)] = int(match.group(1)) / 1e6
+    return wall, cumulative
+
+
+def eager_imports(module="meshtastic_chat_desktop"):
+    """The meshtastic modules importing module loads; empty when they're left for the connect"""
+    proc = subprocess.run([sys.executable, "-c", f"import sys, {module}; "
+                           "print(' '.join(m for m in sys.modules if m.split('.')[0] == 'meshtastic'))"],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    return proc.stdout.split()
+
+
+def time_to_window(command, env, timeout):
+    """Seconds until the app prints PROBE_LINE, or None if it never did"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in proc.stdout:
+            if line.strip() == PROBE_LINE:
+                return time.perf_counter() - start
+            if time.perf_counter() - start > timeout:
+                break
+        return None
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def measure(label, run, runs):
+    cold, warm = [], []
+    for _ in range(runs):
+        pycache = tempfile.mkdtemp(prefix="bench_pycache_")
+        try:
+            env = child_env(pycache)
+            cold.append(run(env))
+            warm.append(run(env))
+        finally:
+            shutil.rmtree(pycache, ignore_errors=True)
+    cold = [t for t in cold if t is not None]
+    warm = [t for t in warm if t is not None]
+    print(f"{label}: cold {summarize(cold).get('p50')} s, warm {summarize(warm).get('p50')} s", file=sys.stderr)
+    return {"cold_s": summarize(cold), "warm_s": summarize(warm)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--build", action="store_true", help="build the exe with PyInstaller before timing it")
+    parser.add_argument("--check", action="store_true", help="only check that the GUI import skips meshtastic")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    eager = eager_imports()
+    if eager:
+        print(f"import meshtastic_chat_desktop loaded {len(eager)} meshtastic modules, e.g. {eager[0]}",
+              file=sys.stderr)
+    else:
+        print("import meshtastic_chat_desktop leaves meshtastic unloaded", file=sys.stderr)
+    if args.check:
+        sys.exit(1 if eager else 0)
+
+    results = {"meta": metadata(), "meshtastic_modules_at_import": eager}
+    for module in ("meshtastic_chat_desktop", "Class.meshtastic_chat_app"):
+        results[f"import {module}"] = measure(f"import {module}",
+                                              lambda env: import_times(module, env)[0], args.runs)
+    _, breakdown = import_times("meshtastic_chat_desktop", child_env(tempfile.gettempdir()))
+    results["import breakdown_s"] = dict(sorted(breakdown.items(), key=lambda item: -item[1])[:15])
+
+    root = tk_root()
+    if root is None:
+        results["time_to_window"] = {"skipped": "no display"}
+    else:
+        root.destroy()
+        command = [sys.executable, os.path.join(REPO_ROOT, "meshtastic_chat_desktop.py")]
+        results["time_to_window"] = measure("time to window",
+                                            lambda env: time_to_window(command, env, args.timeout), args.runs)
+
+    if args.build:
+        subprocess.run([sys.executable, "-m", "PyInstaller", "--noconfirm", SPEC], cwd=REPO_ROOT, check=True)
+    if not os.path.exists(EXE):
+        results["frozen_time_to_window"] = {"skipped": f"{EXE} not built (use --build)"}
+    elif root is None:
+        results["frozen_time_to_window"] = {"skipped": "no display"}
+    else:
+        # The first launch of a onefile exe unpacks it, later ones hit the OS file cache
+        results["frozen_time_to_window"] = measure("frozen time to window",
+                                                   lambda env: time_to_window([EXE], env, args.timeout), args.runs)
+    write_results(results, args.output)
+    if eager:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
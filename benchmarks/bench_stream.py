@@ -0,0 +1,87 @@
+"""Sender memory and start-up delay: whole-file read versus the memory-mapped streaming sender
+
+A random file of --size MiB is sent over a fresh simulated link twice: the
+old way (file.read() then send_data_in_chunks on the bytes) and with
+send_file (mmap, memoryview slices, one reusable frame buffer, SHA-256 hashed
+block by block).  Each run stops after --chunks acknowledged chunks, since
+only the start of a large transfer matters here.  Reports the peak Python heap
+(tracemalloc) and the time until the first chunk is acknowledged.
+
+    python benchmarks/bench_stream.py [--size 64] [--chunks 20]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from run_benchmarks import make_pair
+
+NAME = "stream_test.bin"
+
+
+def run(path, streaming, args):
+    mesh, sender, receiver = make_pair(0.0, args.time_scale, args.seed)
+    receiver.received_dir = tempfile.mkdtemp(prefix="bench_stream_rx_")
+    receiver.transfers.max_transfer_size = os.path.getsize(path)  # Let the receiver accept the big file
+    destination = receiver.interface.user["id"]
+    marks = {}
+
+    def progress(current, total):
+        marks.setdefault("first_ack", time.perf_counter())
+        if current >= args.chunks:
+            sender.on_cancel(NAME, destination)  # Enough: stop the transfer here
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with quiet():
+        if streaming:
+            sender.send_file(path, progress, file_name=NAME)
+        else:
+            with open(path, "rb") as file:
+                data = file.read()
+            sender.send_data_in_chunks(data, NAME, progress)
+            del data
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mesh.close()
+    shutil.rmtree(receiver.received_dir, ignore_errors=True)
+    return {
+        "peak_heap_bytes": peak,
+        "first_chunk_acked_s": marks["first_ack"] - start if "first_ack" in marks else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=64, help="file size in MiB")
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--time-scale", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_stream_")
+    try:
+        path = os.path.join(work_dir, NAME)
+        with open(path, "wb") as file:
+            for _ in range(int(args.size * 16)):
+                file.write(os.urandom(64 * 1024))
+        results = {
+            "meta": metadata(),
+            "size_bytes": os.path.getsize(path),
+            "read_then_send": run(path, False, args),
+            "streaming": run(path, True, args),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
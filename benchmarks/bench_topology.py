@@ -0,0 +1,125 @@
+"""Rebroadcasts saved by per-destination hop limits, and recovery when a route gets longer
+
+A simulated mesh: the sender, its direct neighbour and a grid of --grid x --grid
+other radios, joined to the neighbour's corner.  The sender sends --messages
+texts and a file to the neighbour twice, once with the radio's default hop
+limit and once with the hop limit chosen by the topology graph
+(Class/topology.py).  Every packet sent to a unicast destination is still
+rebroadcast by each node within its hop limit (a managed flood), so the
+simulator's "rebroadcasts" count is the channel utilization the trimmed hop
+limit gives back to the mesh.  Then the direct link is cut, so the neighbour
+is only reachable through a relay, and the script counts the messages lost
+before the widened hop limit gets through again.
+
+    python benchmarks/bench_topology.py [--grid 4] [--messages 20]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, write_results
+
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import MeshtasticChatApp
+
+SIM_TIMEOUT = 30  # Simulated seconds the app waits for an ACK
+
+
+def build(args):
+    mesh = SimulatedMesh(seed=args.seed, time_scale=args.time_scale, default_hop_limit=args.hop_limit)
+    sender = mesh.add_node(0x0C000001, long_name="Sender")
+    neighbour = mesh.add_node(0x0C000002, long_name="Neighbour")
+    relay = mesh.add_node(0x0C000003, long_name="Relay")
+    mesh.connect(sender, neighbour)
+    mesh.connect(sender, relay)
+    mesh.connect(relay, neighbour)
+    grid = [[mesh.add_node(0x0C000100 + row * args.grid + col) for col in range(args.grid)]
+            for row in range(args.grid)]
+    for row in range(args.grid):
+        for col in range(args.grid):
+            if col + 1 < args.grid:
+                mesh.connect(grid[row][col], grid[row][col + 1])
+            if row + 1 < args.grid:
+                mesh.connect(grid[row][col], grid[row + 1][col])
+    mesh.connect(neighbour, grid[0][0])
+    app = MeshtasticChatApp("sim", neighbour.user["id"], interface=sender, timeout=SIM_TIMEOUT * args.time_scale)
+    app.retry_delay = 2 * args.time_scale
+    receiver = MeshtasticChatApp("sim", sender.user["id"], interface=neighbour, timeout=SIM_TIMEOUT * args.time_scale)
+    return mesh, app, receiver, (sender, neighbour)
+
+
+def hop_limit(app, node):
+    """The hop limit the app sends to node with"""
+    limit = app.topology.hop_limit(node.user["id"]) if app.hop_limit_tuning else None
+    return app.topology.default_hop_limit if limit is None else limit
+
+
+def run(args, tuned, data):
+    mesh, app, receiver, (sender, neighbour) = build(args)
+    receiver.received_dir = args.out_dir
+    app.hop_limit_tuning = receiver.hop_limit_tuning = app.hop_limit_tuning and tuned
+    with quiet():
+        delivered = sum(app.send_text_message(f"hello {i}", 0) for i in range(args.messages))
+        file_sent = app.send_data_in_chunks(data, "topology_test.bin")
+    results = {
+        "hop_limit": hop_limit(app, neighbour),
+        "delivered": delivered,
+        "file_sent": file_sent,
+        "packets_sent": mesh.stats["packets_sent"],
+        "rebroadcasts": mesh.stats["rebroadcasts"],
+        "rebroadcasts_per_packet": mesh.stats["rebroadcasts"] / max(mesh.stats["packets_sent"], 1),
+    }
+
+    # The direct link goes away; the app's graph still says the neighbour is one hop off
+    mesh.disconnect(sender, neighbour)
+    lost, outcomes = 0, []
+    with quiet():
+        for i in range(args.messages):
+            outcomes.append(app.send_text_message(f"after {i}", 0))
+    for ok in outcomes:
+        if ok:
+            break
+        lost += 1
+    results["after_route_change"] = {
+        "delivered": sum(outcomes),
+        "lost_before_recovery": lost,
+        "hop_limit": hop_limit(app, neighbour),
+        "topology": app.topology.stats(),
+    }
+    mesh.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--file-size", type=int, default=2000)
+    parser.add_argument("--hop-limit", type=int, default=3, help="radio default hop limit")
+    parser.add_argument("--time-scale", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    args.out_dir = tempfile.mkdtemp(prefix="bench_topology_")
+    try:
+        data = os.urandom(args.file_size)
+        default = run(args, False, data)
+        tuned = run(args, True, data)
+    finally:
+        shutil.rmtree(args.out_dir, ignore_errors=True)
+    results = {
+        "meta": metadata(),
+        "nodes": args.grid * args.grid + 3,
+        "default_hop_limit": default,
+        "tuned_hop_limit": tuned,
+        "rebroadcasts_saved_pct": 100.0 * (1 - tuned["rebroadcasts"] / max(default["rebroadcasts"], 1)),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
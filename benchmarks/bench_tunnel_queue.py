@@ -0,0 +1,127 @@
+"""Load test for the tunnel uplink queue
+
+Runs a bulk flow that offers twice the link rate alongside an interactive flow
+(a small packet every couple of seconds) through a simulated LoRa uplink, once
+through a plain drop-tail FIFO (what the tunnel did before) and once through
+FlowQueue.  Time is virtual, so the run is deterministic and takes milliseconds.
+
+    python benchmarks/bench_tunnel_queue.py [--duration 600] [--output result.json]
+"""
+
+import argparse
+import collections
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Meshtastic_Custom.flow_queue import FlowQueue  # noqa: E402
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DropTailFifo:
+    """The behaviour without a queue discipline: one bounded FIFO"""
+
+    def __init__(self, maxPackets, clock):
+        self.maxPackets = maxPackets
+        self._clock = clock
+        self._queue = collections.deque()
+        self.drops = 0
+
+    def enqueue(self, key, item, size):
+        if len(self._queue) >= self.maxPackets:
+            self.drops += 1
+            return True
+        self._queue.append(item)
+        return True
+
+    def dequeue(self, timeout=None):
+        return self._queue.popleft() if self._queue else None
+
+    def stats(self):
+        return {"depth": len(self._queue), "overflow_drops": self.drops, "codel_drops": 0}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(queue, clock, duration, bulk_size, interactive_size, link_rate, interactive_period):
+    """Offer both flows to queue and drain it at link_rate bytes/s"""
+    bulk_interval = bulk_size / (2 * link_rate)
+    next_bulk = 0.0
+    next_ping = 0.5
+    link_free_at = 0.0
+    latencies = {"bulk": [], "interactive": []}
+    delivered = {"bulk": 0, "interactive": 0}
+    step = 0.01
+    seq = 0
+    while clock.now < duration:
+        while next_bulk <= clock.now:
+            seq += 1
+            queue.enqueue(("bulk",), ("bulk", next_bulk, seq), bulk_size)
+            next_bulk += bulk_interval
+        while next_ping <= clock.now:
+            seq += 1
+            queue.enqueue(("interactive",), ("interactive", next_ping, seq), interactive_size)
+            next_ping += interactive_period
+        if link_free_at <= clock.now:
+            item = queue.dequeue(timeout=0)
+            if item is not None:
+                flow, sent_at, _ = item
+                size = bulk_size if flow == "bulk" else interactive_size
+                link_free_at = clock.now + size / link_rate
+                latencies[flow].append(link_free_at - sent_at)
+                delivered[flow] += size
+        clock.now += step
+
+    result = {"queue": queue.stats()}
+    for flow, values in latencies.items():
+        result[flow] = {
+            "packets": len(values),
+            "goodput_bps": delivered[flow] * 8 / duration,
+            "latency_p50_s": percentile(values, 50),
+            "latency_p95_s": percentile(values, 95),
+            "latency_max_s": max(values) if values else None,
+            "latency_mean_s": statistics.fmean(values) if values else None,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=600.0, help="virtual seconds to simulate")
+    parser.add_argument("--link-rate", type=float, default=150.0, help="uplink rate in bytes/s")
+    parser.add_argument("--queue-limit", type=int, default=64)
+    parser.add_argument("--output", help="write the JSON result here as well as to stdout")
+    args = parser.parse_args()
+
+    params = dict(duration=args.duration, bulk_size=200, interactive_size=64,
+                  link_rate=args.link_rate, interactive_period=2.0)
+    results = {"params": params}
+    clock = VirtualClock()
+    results["drop_tail"] = run(DropTailFifo(args.queue_limit, clock), clock, **params)
+    clock = VirtualClock()
+    results["flow_queue"] = run(FlowQueue(maxPackets=args.queue_limit, clock=clock), clock, **params)
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+
+
+if __name__ == "__main__":
+    main()
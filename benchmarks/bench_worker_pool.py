@@ -0,0 +1,154 @@
+"""How long CPU- and disk-heavy transfer work stalls other threads, inline versus in the WorkerPool
+
+Two stages the app used to run on the thread that happened to reach them:
+
+* delta: make_signature and make_delta over a --size file (pure-Python
+  rolling checksums).  A heartbeat thread standing in for Tk's event loop
+  and the radio's reader ticks every 5 ms; the report is how late its ticks
+  came while the stage ran on another thread of the same process (inline)
+  and in the pool's worker processes.
+* completion: a received --size file of 200-byte chunks is assembled,
+  checked against its SHA-256 and written out.  The report is how long the
+  reader thread is blocked by it: all of it inline, only the hand-off to the
+  pool's I/O threads otherwise, and how long until the file is on disk.
+
+    python benchmarks/bench_worker_pool.py [--size 1000000] [--runs 3]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import metadata, quiet, summarize, write_results
+
+from Class.delta_sync import make_delta, make_signature
+from Class.file_source import payload_digest
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import MeshtasticChatApp
+from Class.metrics import MetricsRegistry
+from Class.worker_pool import WorkerPool
+
+TICK = 0.005  # Seconds between heartbeats
+CHUNK = 200
+
+
+class Heartbeat:
+    """A thread that should wake every TICK seconds, recording how late it was each time"""
+
+    def __init__(self):
+        self.late_ms = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        expected = time.perf_counter() + TICK
+        while not self._stop.is_set():
+            time.sleep(max(expected - time.perf_counter(), 0))
+            self.late_ms.append(max(time.perf_counter() - expected, 0) * 1000)
+            expected = time.perf_counter() + TICK
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def delta_stage(base, data):
+    return make_delta(make_signature(base), data)
+
+
+def bench_delta(base, data, workers, runs):
+    results = {}
+    for mode in ("inline", "pool"):
+        late, elapsed = [], []
+        for _ in range(runs):
+            with Heartbeat() as heartbeat:
+                start = time.perf_counter()
+                if mode == "inline":
+                    # On another thread of this process, as the outbox thread ran it
+                    worker = threading.Thread(target=delta_stage, args=(base, data))
+                    worker.start()
+                    worker.join()
+                else:
+                    workers.run_cpu(delta_stage, base, data)
+                elapsed.append(time.perf_counter() - start)
+            late.extend(heartbeat.late_ms)
+        results[mode] = {"stage_s": statistics.median(elapsed), "heartbeat_late_ms": summarize(late)}
+    return results
+
+
+def received_session(app, data, name):
+    total = (len(data) + CHUNK - 1) // CHUNK
+    session = app.transfers.open("!0a0a0001", {"name": name, "size": len(data), "total_chunks": total,
+                                               "digest": payload_digest(data)})
+    for index in range(total):
+        app.transfers.add_chunk("!0a0a0001", name, index, total, data[index * CHUNK:(index + 1) * CHUNK])
+    return session
+
+
+def bench_completion(data, runs, out_dir):
+    mesh = SimulatedMesh(seed=1)
+    app = MeshtasticChatApp("sim", None, interface=mesh.add_node(0x0B0B0001, long_name="Receiver"),
+                            metrics=MetricsRegistry())
+    app.received_dir = out_dir
+    results = {}
+    with quiet():
+        for mode in ("inline", "pool"):
+            blocked, saved = [], []
+            for run in range(runs):
+                name = f"completion_{mode}_{run}.bin"
+                session = received_session(app, data, name)
+                start = time.perf_counter()
+                if mode == "inline":
+                    app.finish_transfer(session)
+                else:
+                    app.transfers.detach(session)
+                    app.workers.submit_io(app.finish_transfer, session)
+                blocked.append(time.perf_counter() - start)
+                target = os.path.join(out_dir, name)
+                while not os.path.exists(target) or os.path.getsize(target) < len(data):
+                    time.sleep(0.0005)
+                saved.append(time.perf_counter() - start)
+            results[mode] = {"reader_blocked_ms": statistics.median(blocked) * 1000,
+                             "saved_after_ms": statistics.median(saved) * 1000}
+    app.close()
+    mesh.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000000, help="bytes in the file")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    base = os.urandom(args.size)
+    data = base[:args.size // 2] + b"an edit in the middle" + base[args.size // 2:]
+    workers = WorkerPool()
+    workers.run_cpu(len, b"")  # Start the worker processes before timing
+    out_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    try:
+        results = {
+            "meta": metadata(),
+            "size": args.size,
+            "cpu_mode": workers.stats()["cpu_mode"],
+            "delta": bench_delta(base, data, workers, args.runs),
+            "completion": bench_completion(data, args.runs, out_dir),
+        }
+    finally:
+        workers.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Helpers shared by the benchmark scripts"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(REPO_ROOT, "received_files")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def quiet():
+    """Swallow the app's console output while a benchmark runs"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def corpus_files():
+    """The standard corpus: every file in received_files/, smallest first"""
+    paths = [os.path.join(CORPUS_DIR, name) for name in os.listdir(CORPUS_DIR)]
+    return sorted((p for p in paths if os.path.isfile(p)), key=os.path.getsize)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    """Distribution summary used for every latency/cost series"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def metadata():
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def write_results(results, output=None):
+    """Print results and write them as JSON (default: benchmarks/results/<commit>.json)"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{results['meta']['commit']}.json")
+    text = json.dumps(results, indent=2, default=str)
+    with open(output, "w") as file:
+        file.write(text)
+    print(text)
+    print(f"Results written to {output}", file=sys.stderr)
+    return output
+
+
+def tk_root():
+    """Return a withdrawn Tk root, or None when there is no display"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception:
+        return None
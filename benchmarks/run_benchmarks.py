@@ -0,0 +1,297 @@
+"""Benchmark suite for file transfer, ACK latency, the receive path and the node list
+
+Everything runs against the in-process simulated mesh, so no radio is needed.
+Simulated time is scaled by --time-scale; reported times are simulated seconds
+unless the key says "_wall".  Results go to benchmarks/results/<commit>.json.
+
+    python benchmarks/run_benchmarks.py [--quick] [--only transfer,ack,receive,nodes]
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from common import corpus_files, metadata, quiet, summarize, tk_root, write_results
+
+from Class.mesh_simulator import SimulatedMesh
+from Class.meshtastic_chat_app import MeshtasticChatApp
+from Class.node_cache import NodeCache, node_row
+
+SIM_TIMEOUT = 30  # Simulated seconds the app waits for an ACK
+
+
+def make_pair(loss, time_scale, seed, bandwidth=1000.0):
+    """Two directly linked radios, each driven by its own MeshtasticChatApp"""
+    mesh = SimulatedMesh(seed=seed, time_scale=time_scale)
+    sender_iface = mesh.add_node(0x0A0A0001, long_name="Sender")
+    receiver_iface = mesh.add_node(0x0A0A0002, long_name="Receiver")
+    mesh.connect(sender_iface, receiver_iface, loss=loss, bandwidth=bandwidth)
+    sender = MeshtasticChatApp("sim", receiver_iface.user["id"], interface=sender_iface,
+                               timeout=SIM_TIMEOUT * time_scale)
+    sender.retry_delay = 2 * time_scale
+    receiver = MeshtasticChatApp("sim", sender_iface.user["id"], interface=receiver_iface,
+                                 timeout=SIM_TIMEOUT * time_scale)
+    return mesh, sender, receiver
+
+
+def bench_transfer(args):
+    """Goodput and completion time of send_data_in_chunks versus file size and loss"""
+    results = []
+    out_dir = tempfile.mkdtemp(prefix="bench_rx_")
+    try:
+        for path in corpus_files():
+            with open(path, "rb") as file:
+                data = file.read()
+            for loss in args.loss_rates:
+                mesh, sender, receiver = make_pair(loss, args.time_scale, args.seed)
+                receiver.received_dir = out_dir
+                name = os.path.basename(path)
+                target = os.path.join(out_dir, name)
+                if os.path.exists(target):
+                    os.remove(target)
+                start = time.perf_counter()
+                with quiet():
+                    sender.send_data_in_chunks(data, name)
+                    deadline = time.perf_counter() + SIM_TIMEOUT * args.time_scale
+                    while not os.path.exists(target) and time.perf_counter() < deadline:
+                        time.sleep(0.001)
+                wall = time.perf_counter() - start
+                ok = os.path.exists(target) and open(target, "rb").read() == data
+                sim_time = wall / args.time_scale
+                results.append({
+                    "file": name,
+                    "size": len(data),
+                    "loss": loss,
+                    "completed": ok,
+                    "completion_s": sim_time,
+                    "goodput_bps": len(data) * 8 / sim_time if ok else 0.0,
+                    "packets_on_air": mesh.stats["transmissions"],
+                    "firmware_retries": mesh.stats["firmware_retries"],
+                    "elapsed_wall": wall,
+                })
+                mesh.close()
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return results
+
+
+def bench_ack_latency(args):
+    """Distribution of the time send_text_message blocks waiting for its ACK"""
+    lines = []
+    for path in corpus_files():
+        if path.endswith(".txt"):
+            with open(path, encoding="utf-8", errors="ignore") as file:
+                lines.extend(line.strip()[:200] for line in file if line.strip())
+    rng = random.Random(args.seed)
+    results = []
+    for loss in args.loss_rates:
+        mesh, sender, receiver = make_pair(loss, args.time_scale, args.seed)
+        latencies = []
+        failures = 0
+        with quiet():
+            for _ in range(args.messages):
+                start = time.perf_counter()
+                acked = sender.send_text_message(rng.choice(lines), channel_index=0)
+                if acked:
+                    latencies.append((time.perf_counter() - start) / args.time_scale)
+                else:
+                    failures += 1
+        results.append({"loss": loss, "messages": args.messages, "failures": failures,
+                        "latency_s": summarize(latencies)})
+        mesh.close()
+    return results
+
+
+def receive_packets(iface, sender_num, count):
+    """Realistic inbound packets: plain text, a file announcement and its chunks"""
+    def packet(payload, portnum="PRIVATE_APP", packet_id=0):
+        return {
+            "from": sender_num, "to": iface.node_num, "fromId": f"!{sender_num:08x}",
+            "toId": iface.user["id"], "id": packet_id, "channel": 0, "hopLimit": 3, "hopStart": 3,
+            "rxSnr": 6.25, "rxRssi": -90, "rxTime": int(time.time()),
+            "decoded": {"portnum": portnum, "payload": payload},
+        }
+
+    text = [packet(f"message number {i} from the benchmark".encode(), "TEXT_MESSAGE_APP", i)
+            for i in range(count)]
+    chunks = []
+    for i in range(count):
+        name = f"bench_{i // 100}.bin"
+        if i % 100 == 0:
+            chunks.append(packet(b'FILEINFO:' + json.dumps(
+                {"name": name, "size": 100 * 100, "total_chunks": 100}).encode(), packet_id=10**6 + i))
+        chunks.append(packet(f"FILEDATA:{name}:{i % 100}:100:".encode() + bytes(100), packet_id=2 * 10**6 + i))
+    return {"text": text, "file": chunks}
+
+
+def bench_on_receive(args):
+    """Cost of on_receive per packet, bare, with a trivial callback and with the Tk callback"""
+    mesh = SimulatedMesh(seed=args.seed, time_scale=0)
+    iface = mesh.add_node(0x0A0A0002)
+    peer = mesh.add_node(0x0A0A0001)
+    mesh.connect(iface, peer)
+    packets = receive_packets(iface, peer.node_num, args.packets)
+
+    callbacks = {"none": None, "list": lambda message, message_type="INFO": sink.append(message)}
+    root = tk_root()
+    gui = None
+    if root is not None:
+        import meshtastic_chat_desktop
+        gui = meshtastic_chat_desktop.MeshtasticTkinterApp(root)
+        callbacks["tk"] = gui.update_output
+
+    results = {"tk_available": gui is not None}
+    out_dir = tempfile.mkdtemp(prefix="bench_rx_")
+    try:
+        for label, callback in callbacks.items():
+            sink = []
+            app = MeshtasticChatApp("sim", peer.user["id"], interface=iface, on_receive_callback=callback)
+            app.received_dir = out_dir
+            results[label] = {}
+            for kind, batch in packets.items():
+                costs = []
+                with quiet():
+                    for packet in batch:
+                        start = time.perf_counter()
+                        app.on_receive(packet, iface)
+                        costs.append(time.perf_counter() - start)
+                    if root is not None:
+                        root.update()
+                results[label][kind] = {"packets_per_s_wall": len(costs) / sum(costs),
+                                        "cost_us": summarize([c * 1e6 for c in costs])}
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        mesh.close()
+        if root is not None:
+            root.destroy()
+    return results
+
+
+def synthetic_nodes(count, rng):
+    now = int(time.time())
+    nodes = {}
+    for i in range(count):
+        num = 0x20000000 + i
+        nodes[num] = {
+            "num": num,
+            "user": {"id": f"!{num:08x}", "longName": f"Node {i}", "shortName": f"N{i % 1000}",
+                     "hwModel": "TBEAM"},
+            "position": {"latitude": 45 + rng.random(), "longitude": -122 + rng.random(), "altitude": rng.randint(0, 900)},
+            "deviceMetrics": {"batteryLevel": rng.randint(0, 100), "channelUtilization": rng.random() * 30,
+                              "airUtilTx": rng.random() * 5},
+            "snr": rng.uniform(-20, 12),
+            "lastHeard": now - rng.randint(0, 86400),
+            "hopsAway": rng.randint(0, 3),
+        }
+    return nodes
+
+
+def bench_nodes(args):
+    """show_nodes, rendering the on-disk node cache, and the GUI scan_mesh (with a display) versus node count"""
+    rng = random.Random(args.seed)
+    mesh = SimulatedMesh(seed=args.seed, time_scale=0)
+    iface = mesh.add_node(0x0A0A0001)
+    app = MeshtasticChatApp("sim", "^all", interface=iface)
+    root = tk_root()
+    gui = None
+    if root is not None:
+        import meshtastic_chat_desktop
+        gui = meshtastic_chat_desktop.MeshtasticTkinterApp(root)
+        gui.chat_app = app
+
+    results = []
+    for count in args.node_counts:
+        iface.nodesByNum = synthetic_nodes(count, rng)
+        iface.nodes = {n["user"]["id"]: n for n in iface.nodesByNum.values()}
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            rows = app.show_nodes()
+        entry = {"nodes": count, "rows": len(rows), "show_nodes_wall": (time.perf_counter() - start) / args.repeat}
+        cache_path = os.path.join(tempfile.gettempdir(), f"bench_node_cache_{os.getpid()}.json")
+        cache = NodeCache(cache_path)
+        cache.update_all(iface.nodesByNum)
+        start = time.perf_counter()
+        cache.save()
+        entry["cache_save_wall"] = time.perf_counter() - start
+        start = time.perf_counter()
+        cached_rows = [node_row(node) for node in NodeCache(cache_path).load().values()]
+        entry["cache_load_render_wall"] = time.perf_counter() - start
+        entry["cache_bytes"] = os.path.getsize(cache_path)
+        os.remove(cache_path)
+        assert len(cached_rows) == count
+        if gui is not None:
+            start = time.perf_counter()
+            gui.scan_mesh()
+            root.update()
+            entry["scan_mesh_wall"] = time.perf_counter() - start
+        results.append(entry)
+    mesh.close()
+    if root is not None:
+        root.destroy()
+    return results
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            label = index
+            if isinstance(item, dict):
+                label = ",".join(f"{k}={item[k]}" for k in ("file", "loss", "nodes") if k in item) or index
+            yield from flatten(item, f"{prefix}[{label}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = dict(flatten({k: v for k, v in json.load(file).items() if k != "meta"}))
+    with open(new_path) as file:
+        new = dict(flatten({k: v for k, v in json.load(file).items() if k != "meta"}))
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        change = (after - before) / before * 100 if before else float("inf") if after else 0.0
+        print(f"{key:90s} {before:14.6g} {after:14.6g} {change:+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="transfer,ack,receive,nodes")
+    parser.add_argument("--quick", action="store_true", help="smaller sweeps for a fast sanity run")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.loss_rates = [0.0, 0.1] if args.quick else [0.0, 0.05, 0.15]
+    args.messages = 20 if args.quick else 100
+    args.packets = 500 if args.quick else 5000
+    args.node_counts = [10, 100] if args.quick else [10, 100, 300, 1000, 3000]
+    args.repeat = 3 if args.quick else 10
+
+    sections = {"transfer": bench_transfer, "ack": bench_ack_latency,
+                "receive": bench_on_receive, "nodes": bench_nodes}
+    results = {"meta": metadata()}
+    results["meta"]["params"] = {k: v for k, v in vars(args).items() if k not in ("compare", "output")}
+    for name in args.only.split(","):
+        start = time.perf_counter()
+        results[name] = sections[name](args)
+        results["meta"][f"{name}_elapsed_wall"] = time.perf_counter() - start
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
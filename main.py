@@ -1,8 +1,11 @@
 #main.py
+import multiprocessing
 from Class.meshtastic_chat_app import MeshtasticChatApp
+from Class.async_core import run_cli
 
 if __name__ == "__main__":
+	multiprocessing.freeze_support()  # Worker processes in a frozen (PyInstaller) build
 	dev_path = '/dev/ttyUSB0'
 	destination_id = "!fa6a40a8"
 	app = MeshtasticChatApp(dev_path, destination_id)
-	app.run()
+	run_cli(app)  # A thin console client of the asyncio core
@@ -0,0 +1,7 @@
+#mesh_daemon.py
+import multiprocessing
+from Class.mesh_daemon import main
+
+if __name__ == "__main__":
+	multiprocessing.freeze_support()  # Worker processes in a frozen (PyInstaller) build
+	main()
@@ -2,15 +2,25 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import threading
-import json
+import multiprocessing
 import os
 import base64
-import webview
-from Class.meshtastic_chat_app import MeshtasticChatApp  # Import your existing class
+import queue
+import time
+from Class.metrics import REGISTRY
+from Class.node_cache import NodeCache, compact_node, node_row
+from Class.contacts import ContactStore, contact_label, node_names
+from Class.mesh_daemon import RemoteChatApp, parse_daemon_address
+from Class.async_core import AsyncMeshCore
 import platform
 
 CHUNK_SIZE = 100  # Define CHUNK_SIZE here
+METRICS_PORT = int(os.environ.get("MESHTASTIC_METRICS_PORT", "9464"))  # 0 disables the metrics endpoint
+NODE_CACHE_PATH = "node_cache.json"
+CONTACTS_PATH = "contacts.jsonl"
+FRIENDS_PATH = "friends.json"  # The old flat list, imported into CONTACTS_PATH once
+MAX_FRIEND_ROWS = 200  # Rows the friend picker shows for a filter; type more to narrow it down
+OUTBOX_PATH = "outbox.json"
 
 class ScrollableFrame(ttk.Frame):
     def __init__(self, container, *args, **kwargs):
@@ -45,16 +55,22 @@ class MeshtasticTkinterApp:
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
         if platform.system() == "Linux":
-            from meshtastic.tunnel import Tunnel  # Import the Tunnel class
             # Linux Only Menu
             self.file_menu.add_command(label="Tunnel Client", command=self.open_tunnel_client)
             self.file_menu.add_command(label="Tunnel Gateway", command=self.open_tunnel_gateway)
             self.file_menu.add_command(label="Browser", command=self.open_browser)
         # Normal Windows Menu    
+        self.file_menu.add_command(label="Start Packet Capture...", command=self.start_capture)
+        self.file_menu.add_command(label="Stop Packet Capture", command=self.stop_capture)
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Exit", command=master.quit)
+
+        # Create a View menu
+        self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
+        self.view_menu.add_command(label="Statistics", command=self.open_stats)
         
-        self.right_click_menu = tk.Menu(root, tearoff = 0) 
+        self.right_click_menu = tk.Menu(master, tearoff = 0) 
         self.right_click_menu.add_command(label ="Add to Friends", command=self.add_friend_right_click) 
 
         # Variables
@@ -65,8 +81,22 @@ class MeshtasticTkinterApp:
         self.timeout = tk.IntVar(value=30)
         self.retransmission_limit = tk.IntVar(value=3)
         self.destination_id.set("!fa6a4660")  # Default destination ID
-        self.friends = []
-
+        self.friends = ContactStore(CONTACTS_PATH, FRIENDS_PATH)
+        self.friend_rows = []  # (contact id, True if a NodeDB node that isn't a friend yet) per list row
+        self.channel_edits = []  # Channel edits staged for Apply All, see ChannelTransaction.stage
+
+        # Slow work (connecting, sends, traces) runs as coroutines on the core's event loop
+        self.core = AsyncMeshCore().start()
+        # Worker threads hand UI work to the Tk thread through this queue
+        self.ui_queue = queue.Queue()
+        self.metrics = REGISTRY
+        self.m_ui_latency = self.metrics.histogram("ui_queue_latency_seconds", "Time UI updates wait for the Tk thread")
+        self.metrics.gauge("ui_queue_depth", "UI updates waiting for the Tk thread").set_function(self.ui_queue.qsize)
+        if METRICS_PORT:
+            try:
+                self.metrics.serve(port=METRICS_PORT)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
 
         # Set up the scrollable frame
         self.scrollable_frame = ScrollableFrame(self.master)
@@ -77,22 +107,28 @@ class MeshtasticTkinterApp:
         self.setup_ui()
 
         self.chat_app = None  # Initialize later after setting the device path
+        self.preview_windows = {}  # file name -> widgets of its progressive preview window
+
+        # Show the nodes known from the last run until the device reports them again
+        self.node_cache = NodeCache(NODE_CACHE_PATH)
+        self.show_cached_nodes()
 
-        # Load friends/addresses from JSON file
-        self.load_friends()        
+        # Load friends/addresses from the contact log; the cached nodes feed its auto-complete
+        self.load_friends()
+        self.node_cache.start_autosave(source=lambda: self.chat_app.interface.nodesByNum if self.chat_app else None)
+        self.master.after(50, self.drain_ui_queue)
         
-        # auto connect if device path is set
+        # auto connect if device path is set (the mesh is scanned once connected)
         if self.device_path.get():
             self.connect_device()      
-            # auto scan 
-            self.scan_mesh()
         
     
     def setup_ui(self):
         # Device Path
         ttk.Label(self.frame, text="Device Path:").grid(row=0, column=0, padx=10, pady=5)
         ttk.Entry(self.frame, textvariable=self.device_path).grid(row=0, column=1, padx=10, pady=5)
-        ttk.Button(self.frame, text="Connect", command=self.connect_device).grid(row=0, column=2, padx=10, pady=5)
+        self.connect_button = ttk.Button(self.frame, text="Connect", command=self.connect_device)
+        self.connect_button.grid(row=0, column=2, padx=10, pady=5)
 
         # Timeout
         ttk.Label(self.frame, text="Timeout (s):").grid(row=1, column=0, padx=10, pady=5)
@@ -105,18 +141,26 @@ class MeshtasticTkinterApp:
         # Friends/Address List
         self.friends_frame = ttk.LabelFrame(self.frame, text="Friends/Addresses")
         self.friends_frame.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
-        self.friends_frame.grid_rowconfigure(0, weight=1)
+        self.friends_frame.grid_rowconfigure(1, weight=1)
         self.friends_frame.grid_columnconfigure(0, weight=1)
 
+        # Filters the list as you type; nodes from the NodeDB that match are offered below the friends
+        self.friend_filter = tk.StringVar()
+        self.friend_filter.trace_add("write", lambda *args: self.update_friends_list())
+        ttk.Entry(self.friends_frame, textvariable=self.friend_filter).grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+
         self.friends_listbox = tk.Listbox(self.friends_frame)
-        self.friends_listbox.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+        self.friends_listbox.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
         self.friends_listbox.bind('<<ListboxSelect>>', self.on_friend_select)
 
         self.add_friend_button = ttk.Button(self.friends_frame, text="Add Friend", command=self.add_friend)
-        self.add_friend_button.grid(row=1, column=0, padx=5, pady=5)
+        self.add_friend_button.grid(row=2, column=0, padx=5, pady=5)
 
         self.remove_friend_button = ttk.Button(self.friends_frame, text="Remove Friend", command=self.remove_friend)
-        self.remove_friend_button.grid(row=2, column=0, padx=5, pady=5)
+        self.remove_friend_button.grid(row=3, column=0, padx=5, pady=5)
+
+        self.edit_friend_button = ttk.Button(self.friends_frame, text="Edit Friend", command=self.edit_friend)
+        self.edit_friend_button.grid(row=4, column=0, padx=5, pady=5)
         
         # Add Trace Route Button
         self.trace_route_button = ttk.Button(self.frame, text="Trace Route", command=self.trace_route)
@@ -169,6 +213,7 @@ class MeshtasticTkinterApp:
         self.mesh_tree = ttk.Treeview(self.mesh_canvas, columns=columns, show='headings')
         self.mesh_tree.grid(row=0, column=0, sticky="nsew")
         self.mesh_tree.bind("<Button-3>", self.right_click_popup) 
+        self.mesh_tree.tag_configure("stale", foreground="gray")  # Cached nodes not yet confirmed by the device
 
         # Define column headings and set default widths
         column_widths = {
@@ -205,6 +250,9 @@ class MeshtasticTkinterApp:
         self.file_button = ttk.Button(self.entry_frame, text="Send File", command=self.send_file)
         self.file_button.grid(row=0, column=3, padx=5, pady=5)
 
+        self.folder_button = ttk.Button(self.entry_frame, text="Send Folder", command=self.send_folder)
+        self.folder_button.grid(row=0, column=4, padx=5, pady=5)
+
         # Progress Bar
         self.progress_frame = ttk.Frame(self.frame)
         self.progress_frame.grid(row=6, column=0, padx=10, pady=10, sticky="nsew", columnspan=3)
@@ -241,6 +289,13 @@ class MeshtasticTkinterApp:
         self.psk_button = ttk.Button(self.channel_frame, text="Set PSK", command=self.set_psk)
         self.psk_button.grid(row=4, column=1, padx=5, pady=5)
 
+        # Set PSK, Add Channel and Rename only stage their edits; Apply All writes them in one transaction
+        self.apply_channels_button = ttk.Button(self.channel_frame, text="Apply All", command=self.apply_channel_edits)
+        self.apply_channels_button.grid(row=1, column=1, padx=5, pady=5)
+        self.discard_channels_button = ttk.Button(self.channel_frame, text="Discard Edits",
+                                                  command=self.discard_channel_edits)
+        self.discard_channels_button.grid(row=1, column=2, padx=5, pady=5)
+
         # Add a new entry in the setup_ui method for Channel selection
         self.message_channel_label = ttk.Label(self.entry_frame, text="Message Channel Index:")
         self.message_channel_label.grid(row=1, column=0, padx=5, pady=5)
@@ -252,6 +307,16 @@ class MeshtasticTkinterApp:
         self.file_channel_entry = ttk.Entry(self.entry_frame)
         self.file_channel_entry.grid(row=2, column=1, padx=5, pady=5)
 
+        # Send only the changes against the receiver's copy of the file with the same name
+        self.delta_var = tk.BooleanVar(value=False)
+        self.delta_check = ttk.Checkbutton(self.entry_frame, text="Send as delta", variable=self.delta_var)
+        self.delta_check.grid(row=2, column=2, padx=5, pady=5)
+
+        # Send images so the receiver can see a preview early and stop the transfer
+        self.progressive_var = tk.BooleanVar(value=False)
+        self.progressive_check = ttk.Checkbutton(self.entry_frame, text="Progressive", variable=self.progressive_var)
+        self.progressive_check.grid(row=2, column=3, padx=5, pady=5)
+
         # Add Channel Name Entry and Button
         self.new_channel_label = ttk.Label(self.channel_frame, text="New Channel Name:")
         self.new_channel_label.grid(row=5, column=0, padx=5, pady=5)
@@ -260,30 +325,96 @@ class MeshtasticTkinterApp:
 
         self.add_channel_button = ttk.Button(self.channel_frame, text="Add Channel", command=self.add_channel)
         self.add_channel_button.grid(row=6, column=1, padx=5, pady=5)
+        self.rename_channel_button = ttk.Button(self.channel_frame, text="Rename Channel", command=self.rename_channel)
+        self.rename_channel_button.grid(row=6, column=2, padx=5, pady=5)
         
     def connect_device(self):
         device_path = self.device_path.get()
         if device_path:
-            self.chat_app = MeshtasticChatApp(
-                dev_path=device_path, 
+            # Opening the radio waits for its whole config download, so do it off
+            # the Tk thread and fill in the UI when the device is ready
+            self.connect_button.configure(state='disabled')
+            self.update_output(f"Connecting to {device_path}...")
+            settings = dict(
+                dev_path=device_path,
                 destination_id=self.destination_id.get(),
-                on_receive_callback=self.update_output,
+                on_receive_callback=self.post_output,
+                on_node_updated_callback=lambda node: self.post_ui(self.update_node, compact_node(node)),
+                on_outbox_callback=lambda entry: self.post_ui(self.update_outbox_entry, entry),
+                on_preview_callback=lambda preview: self.post_ui(self.show_preview, preview),
+                outbox_path=OUTBOX_PATH,
                 timeout=self.timeout.get(),
                 retransmission_limit=self.retransmission_limit.get()
             )
-            self.update_output("Connected to the Meshtastic device successfully.")
+            self.run_async(self.core.run_blocking(self.connect_device_worker, settings))
+
+    def connect_device_worker(self, settings):
+        try:
+            daemon_address = parse_daemon_address(settings['dev_path'])
+            if daemon_address:
+                # Attach to a running mesh_daemon.py that already owns the radio
+                settings.pop('dev_path')
+                settings.pop('retransmission_limit')
+                settings.pop('outbox_path')  # The daemon keeps the outbox
+                chat_app = RemoteChatApp(*daemon_address, **settings)
+            else:
+                from Class.meshtastic_chat_app import MeshtasticChatApp  # Deferred: loads the whole meshtastic library
+                chat_app = MeshtasticChatApp(**settings)
+        except (Exception, SystemExit) as e:  # MeshtasticChatApp exits when the device can't be opened
+            self.post_ui(self.on_device_failed, settings['dev_path'], e)
+            return
+        self.post_ui(self.on_device_connected, chat_app)
+
+    def on_device_connected(self, chat_app):
+        self.chat_app = chat_app
+        self.core.attach(chat_app)
+        self.connect_button.configure(state='normal')
+        self.update_output("Connected to the Meshtastic device successfully.")
+        self.scan_mesh()
+
+    def on_device_failed(self, device_path, error):
+        self.connect_button.configure(state='normal')
+        self.update_output(f"Failed to connect to {device_path}: {error or 'device not available'}", "ERROR")
+
+    def start_capture(self):
+        if not self.chat_app:
+            messagebox.showerror("Error", "Device not connected")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".mtcap", filetypes=[("Packet capture", "*.mtcap")])
+        if path:
+            self.chat_app.start_capture(path)
+            self.update_output(f"Capturing packets to {path}")
+
+    def stop_capture(self):
+        if self.chat_app and self.chat_app.capture:
+            self.chat_app.stop_capture()
+            self.update_output("Packet capture stopped.")
+
+    def selected_friend_row(self):
+        """(contact id, is a NodeDB suggestion) of the selected list row, or None"""
+        selection = self.friends_listbox.curselection()
+        if not selection or selection[0] >= len(self.friend_rows):
+            return None
+        return self.friend_rows[selection[0]]
 
     def on_friend_select(self, event):
-        if not self.friends_listbox.curselection():
+        row = self.selected_friend_row()
+        if not row:
             return
-        selected_friend = self.friends_listbox.get(self.friends_listbox.curselection())
+        selected_friend = row[0]
         self.destination_id.set(selected_friend)
         if self.chat_app:
             self.chat_app.set_destination_id(selected_friend)
+        contact = self.friends.get(selected_friend)
+        if contact and contact["channel"] is not None:
+            self.message_channel_entry.delete(0, tk.END)
+            self.message_channel_entry.insert(0, str(contact["channel"]))
         self.update_output(f"Destination ID set to {selected_friend}")
 
     def add_friend(self):
-        new_friend = simpledialog.askstring("Add Friend", "Enter friend address:")
+        row = self.selected_friend_row()
+        suggested = row[0] if row and row[1] else None  # A NodeDB node picked from the list
+        new_friend = simpledialog.askstring("Add Friend", "Enter friend address:", initialvalue=suggested)
         self.add_friend_backend(new_friend)
     
     def add_friend_backend(self, new_friend):
@@ -293,36 +424,75 @@ class MeshtasticTkinterApp:
         if new_friend in self.friends:
             return
         
-        self.friends.append(new_friend)
+        node = self.known_node(new_friend)
+        self.friends.add(new_friend, last_seen=node.get("lastHeard") if node else None,
+                         **(node_names(node) if node else {}))
         self.update_friends_list()
-        self.save_friends()
+
+    def known_node(self, node_id):
+        """The cached NodeDB entry of node_id, if the radio has reported it"""
+        node_id = str(node_id).lower()
+        for node in list(self.node_cache.nodes.values()):
+            if str(node.get("user", {}).get("id", "")).lower() == node_id or f"!{node['num']:08x}" == node_id:
+                return node
+        return None
 
     def remove_friend(self):
         selected_friend = self.friends_listbox.curselection()
         self.remove_friend_backend(selected_friend)
             
     def remove_friend_backend(self, selected_friend):
-        if not selected_friend:
+        if not selected_friend or selected_friend[0] >= len(self.friend_rows):
             return
         
-        self.friends.pop(selected_friend[0])
+        contact_id, suggested = self.friend_rows[selected_friend[0]]
+        if suggested:
+            return  # Not a friend yet
+        self.friends.remove(contact_id)
+        self.update_friends_list()
+
+    def edit_friend(self):
+        row = self.selected_friend_row()
+        contact = self.friends.get(row[0]) if row else None
+        if not contact:
+            messagebox.showerror("Error", "Select a friend to edit")
+            return
+        name = simpledialog.askstring("Edit Friend", "Name:", initialvalue=contact["long_name"])
+        if name is None:
+            return
+        notes = simpledialog.askstring("Edit Friend", "Notes:", initialvalue=contact["notes"])
+        if notes is None:
+            return
+        channel = simpledialog.askstring("Edit Friend", "Preferred channel (blank for none):",
+                                         initialvalue="" if contact["channel"] is None else str(contact["channel"]))
+        if channel is None:
+            return
+        try:
+            channel = int(channel) if channel.strip() else None
+        except ValueError:
+            messagebox.showerror("Error", "Invalid channel index")
+            return
+        self.friends.add(contact["id"], long_name=name, notes=notes, channel=channel)
         self.update_friends_list()
-        self.save_friends()
 
     def update_friends_list(self):
+        """Show the friends matching the filter (at most MAX_FRIEND_ROWS), then NodeDB nodes that match"""
+        query = self.friend_filter.get()
+        contacts = self.friends.search(query, limit=MAX_FRIEND_ROWS)
+        suggestions = self.friends.suggest(query, self.node_cache.nodes)
+        self.friend_rows = [(contact["id"], False) for contact in contacts] + \
+                           [(contact["id"], True) for contact in suggestions]
         self.friends_listbox.delete(0, tk.END)
-        for friend in self.friends:
-            self.friends_listbox.insert(tk.END, friend)
-
-    def save_friends(self):
-        with open("friends.json", "w") as file:
-            json.dump(self.friends, file)
+        labels = [contact_label(contact) for contact in contacts] + \
+                 [f"+ {contact_label(contact)}" for contact in suggestions]
+        if labels:
+            self.friends_listbox.insert(tk.END, *labels)
+        for index in range(len(contacts), len(labels)):
+            self.friends_listbox.itemconfigure(index, foreground="gray")
 
     def load_friends(self):
-        if os.path.exists("friends.json"):
-            with open("friends.json", "r") as file:
-                self.friends = json.load(file)
-            self.update_friends_list()
+        self.friends.load()
+        self.update_friends_list()
 
     def send_message(self):
         if not self.chat_app:
@@ -337,8 +507,9 @@ class MeshtasticTkinterApp:
             except ValueError:
                 messagebox.showerror("Error", "Invalid channel index")
                 return
-            self.chat_app.send_text_message(message, channel_index)
-            self.update_history(f"Me: {message}")
+            # Queued rather than sent, so an out-of-range destination gets it when it is heard again
+            entry = self.chat_app.queue_text_message(message, channel_index)
+            self.update_history(f"Me: {message}", entry)
             self.message_entry.delete(0, tk.END)
 
     def send_group_message(self):
@@ -370,42 +541,153 @@ class MeshtasticTkinterApp:
             except ValueError:
                 messagebox.showerror("Error", "Invalid channel index")
                 return
-            threading.Thread(target=self.send_file_in_chunks, args=(file_path, channel_index)).start()
+            self.run_async(self.core.run_blocking(self.send_file_in_chunks, file_path, channel_index,
+                                                  self.delta_var.get(), self.progressive_var.get()))
 
-    def send_file_in_chunks(self, file_path, channel_index):
+    def send_file_in_chunks(self, file_path, channel_index, delta=False, progressive=False):
         self.chat_app.set_timeout(self.timeout.get())  # Update timeout before sending
-        
-        def progress_callback(current_chunk, total_chunks):
-            self.progress_bar['maximum'] = total_chunks
-            self.progress_bar['value'] = current_chunk
-            self.master.update_idletasks()
 
         try:
-            with open(file_path, 'rb') as file:
-                file_data = file.read()
-                file_name = os.path.basename(file_path)
-                self.chat_app.send_data_in_chunks(file_data, file_name, progress_callback, channel_index)
-                self.update_history(f"Me: Sent file {file_name}")
+            file_name = os.path.basename(file_path)
+            # Queued by path: the file is mapped and streamed when sent, not read into memory here.
+            # Progress and delivery come back through update_outbox_entry
+            entry = self.chat_app.queue_path(file_path, channel_index, delta=delta, progressive=progressive)
+            self.post_ui(self.update_history, f"Me: Sent file {file_name}{' (delta)' if delta else ''}", entry)
 
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to send file: {str(e)}")
+            self.post_ui(messagebox.showerror, "Error", f"Failed to send file: {str(e)}")
 
-    def scan_mesh(self):
+    def send_folder(self):
         if not self.chat_app:
             messagebox.showerror("Error", "Device not connected")
             return
 
-        nodes = self.chat_app.show_nodes()
-        self.mesh_tree.delete(*self.mesh_tree.get_children())  # Clear existing nodes in the tree
+        directory = filedialog.askdirectory()
+        if directory:
+            try:
+                channel_index = int(self.file_channel_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "Invalid channel index")
+                return
+            self.run_async(self.core.run_blocking(self.send_folder_bundle, directory, channel_index))
+
+    def send_folder_bundle(self, directory, channel_index):
+        self.chat_app.set_timeout(self.timeout.get())  # Update timeout before sending
+
+        try:
+            # The whole folder goes as one compressed transfer and is unpacked at once on the other side
+            entry = self.chat_app.queue_folder(directory, channel_index)
+            self.post_ui(self.update_history,
+                         f"Me: Sent folder {os.path.basename(os.path.normpath(directory))} ({entry['files']} files)", entry)
+        except Exception as e:
+            self.post_ui(messagebox.showerror, "Error", f"Failed to send folder: {str(e)}")
+
+    def show_preview(self, preview):
+        """Show (or refresh) the partial image of a progressive transfer, with a button to stop it."""
+        name = preview['name']
+        widgets = self.preview_windows.get(name)
+        if widgets is None or not widgets['window'].winfo_exists():
+            window = tk.Toplevel(self.master)
+            window.title(f"Preview: {name}")
+            image_label = ttk.Label(window)
+            image_label.grid(row=0, column=0, padx=5, pady=5)
+            status_label = ttk.Label(window)
+            status_label.grid(row=1, column=0, padx=5, pady=5)
+            stop_button = ttk.Button(window, text="Good enough, stop transfer",
+                                     command=lambda: self.stop_progressive_transfer(name, preview.get('from')))
+            stop_button.grid(row=2, column=0, padx=5, pady=5)
+            widgets = {'window': window, 'image': image_label, 'status': status_label, 'stop': stop_button}
+            self.preview_windows[name] = widgets
+
+        if preview['done']:
+            widgets['status'].configure(text=f"Complete: {preview['path']}")
+            widgets['stop'].configure(state='disabled')
+        else:
+            widgets['status'].configure(text=f"{preview['received']}/{preview['total']} chunks")
+        try:
+            from PIL import Image, ImageFile, ImageTk  # Optional: without Pillow only the status is shown
+            ImageFile.LOAD_TRUNCATED_IMAGES = True  # A preview is a truncated image by design
+            with Image.open(preview['path']) as image:
+                image.thumbnail((320, 320))
+                photo = ImageTk.PhotoImage(image)
+            widgets['image'].configure(image=photo)
+            widgets['image'].image = photo  # Keep a reference, Tk doesn't
+        except ImportError:
+            widgets['image'].configure(text=f"Preview saved to {preview['path']}")
+        except Exception:
+            pass  # Too little of the image yet; the next preview will do
+
+    def stop_progressive_transfer(self, name, sender_id):
+        widgets = self.preview_windows.get(name)
+        if widgets:
+            widgets['stop'].configure(state='disabled')
+        self.run_async(self.core.cancel_transfer(name, sender_id))
+
+    def show_cached_nodes(self):
+        cached = self.node_cache.load()
+        if not cached:
+            return
+        rows = sorted((node_row(node) for node in cached.values()),
+                      key=lambda r: r.get("LastHeard") or "0000", reverse=True)
+        for i, row in enumerate(rows):
+            row["N"] = i + 1
+            self.render_node_row(row, stale=True)
+        self.resize_mesh_tree()
+        saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.node_cache.saved_at or 0))
+        self.update_output(f"Showing {len(rows)} cached nodes from {saved} until the device reports them.")
+
+    def scan_mesh(self):
+        if not self.chat_app:
+            messagebox.showerror("Error", "Device not connected")
+            return
 
-        for node in nodes:
-            values = [node.get(col) for col in self.mesh_tree["columns"]]
-            self.mesh_tree.insert("", tk.END, values=values)
+        self.node_cache.update_all(self.chat_app.interface.nodesByNum)
+        nodes = [(node, False) for node in self.chat_app.show_nodes()]
+        # Keep cached nodes the device hasn't mentioned yet, still marked stale
+        live_ids = {node["ID"] for node, _ in nodes}
+        nodes += [(row, True) for row in map(node_row, self.node_cache.stale_nodes()) if row["ID"] not in live_ids]
+        nodes.sort(key=lambda item: item[0].get("LastHeard") or "0000", reverse=True)
+
+        wanted = set()
+        for i, (node, stale) in enumerate(nodes):
+            node["N"] = i + 1
+            wanted.add(self.render_node_row(node, stale, index=i))
+        self.mesh_tree.delete(*[iid for iid in self.mesh_tree.get_children() if iid not in wanted])
         
         self.highlight_snr_column()  # Optional: Add highlighting for SNR column
+        self.resize_mesh_tree()
+
+    def render_node_row(self, row, stale=False, index=None):
+        """Insert or update the tree row of one node (keyed by its ID); returns the row id."""
+        iid = row["ID"]
+        values = [row.get(col) for col in self.mesh_tree["columns"]]
+        tags = ("stale",) if stale else ()
+        if self.mesh_tree.exists(iid):
+            # Keep the SNR highlight until the next full scan recomputes it
+            tags += tuple(tag for tag in self.mesh_tree.item(iid, "tags") if tag.startswith("snr_"))
+            self.mesh_tree.item(iid, values=values, tags=tags)
+            if index is not None:
+                self.mesh_tree.move(iid, "", index)
+        else:
+            self.mesh_tree.insert("", tk.END if index is None else index, iid=iid, values=values, tags=tags)
+        return iid
+
+    def update_node(self, node):
+        """Reconcile one node the device just reported, without rebuilding the whole list."""
+        node = self.node_cache.update(node)
+        if self.friends.observe(node) is not None:
+            self.update_friends_list()  # A friend's name changed, or it was seen again
+        row = node_row(node)
+        if self.mesh_tree.exists(row["ID"]):
+            row["N"] = self.mesh_tree.set(row["ID"], "N")
+        else:
+            row["N"] = len(self.mesh_tree.get_children()) + 1
+        self.render_node_row(row)
+        self.resize_mesh_tree()
 
+    def resize_mesh_tree(self):
         # Adjust the Treeview height if necessary to accommodate all nodes
-        total_nodes = len(nodes)
+        total_nodes = len(self.mesh_tree.get_children())
         if total_nodes > 10:
             treeview_height = total_nodes
         else:
@@ -438,7 +720,8 @@ class MeshtasticTkinterApp:
                     color_intensity = int(255 * (snr - min_snr) / snr_range) if snr_range != 0 else 0
                     color = f'#{color_intensity:02x}ff{255 - color_intensity:02x}'  # Gradient from red to green
                     self.mesh_tree.tag_configure(f'snr_{row_id}', background=color)
-                    self.mesh_tree.item(row_id, tags=(f'snr_{row_id}',))
+                    stale = ('stale',) if self.mesh_tree.tag_has('stale', row_id) else ()
+                    self.mesh_tree.item(row_id, tags=(f'snr_{row_id}',) + stale)
                 except ValueError:
                     continue
 
@@ -454,6 +737,8 @@ class MeshtasticTkinterApp:
             for channel in channels_info:
                 self.channel_text.insert(tk.END, f"Index: {channel['Index']}, Role: {channel['Role']}, Name: {channel['Name']}, PSK: {channel['PSK']}\n")
             self.channel_text.configure(state='disabled')
+        if self.channel_edits:
+            self.show_channel_edits()
 
     def set_psk(self):
         if not self.chat_app:
@@ -469,23 +754,98 @@ class MeshtasticTkinterApp:
         
         try:
             psk_bytes = base64.b64decode(psk_base64)
-            self.chat_app.set_psk(index, psk_bytes)
-            self.update_output(f"PSK for channel {index} set successfully.")
-            messagebox.showinfo("Success", f"Successfully set PSK for channel index: {index}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to set PSK: {str(e)}")
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid PSK: {str(e)}")
+            return
+        self.stage_channel_edit({"index": index, "psk": psk_bytes})
 
     def add_channel(self):
         name = self.new_channel_entry.get()
         if not name:
             messagebox.showerror("Error", "Channel name cannot be empty")
             return
+        if self.chat_app:
+            self.stage_channel_edit({"name": name})
+        else:
+            messagebox.showerror("Error", "Device not connected")
+
+    def rename_channel(self):
+        if not self.chat_app:
+            messagebox.showerror("Error", "Device not connected")
+            return
+        name = self.new_channel_entry.get()
+        try:
+            index = int(self.channel_index_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Invalid channel index")
+            return
+        self.stage_channel_edit({"index": index, "name": name})
+
+    def stage_channel_edit(self, edit):
+        """Add an edit to those Apply All will write, if it applies to the radio's channels."""
         try:
-            self.chat_app.add_channel(name)
-            self.update_output(f"Channel '{name}' added successfully.")
-            messagebox.showinfo("Success", f"Channel '{name}' added successfully.")
+            self.chat_app.preview_channel_edits(self.channel_edits + [edit])
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to add channel: {str(e)}")
+            messagebox.showerror("Error", f"Failed to stage channel edit: {str(e)}")
+            return
+        self.channel_edits.append(edit)
+        self.show_channel_edits()
+
+    def show_channel_edits(self):
+        """List the channels the staged edits change under the channel settings."""
+        try:
+            changes = self.chat_app.preview_channel_edits(self.channel_edits)
+        except Exception as e:
+            self.update_output(f"Failed to diff channel edits: {str(e)}", "ERROR")
+            return
+        self.channel_text.configure(state='normal')
+        if self.channel_text.tag_ranges("pending"):
+            self.channel_text.delete("pending.first", "pending.last")
+        if changes:
+            lines = [f"Pending ({len(changes)} channel(s), Apply All to write):\n"]
+            for change in changes:
+                before, after = change["before"], change["after"]
+                fields = [f"{key}: {before[key]} -> {after[key]}" for key in ("Role", "Name", "PSK")
+                          if before[key] != after[key]]
+                lines.append(f"  Index: {change['index']}, " + ", ".join(fields) + "\n")
+            self.channel_text.insert(tk.END, "".join(lines), "pending")
+        self.channel_text.configure(state='disabled')
+        self.apply_channels_button.configure(text=f"Apply All ({len(changes)})" if changes else "Apply All")
+
+    def discard_channel_edits(self):
+        self.channel_edits = []
+        if self.chat_app:
+            self.show_channel_edits()
+
+    def apply_channel_edits(self):
+        if not self.chat_app:
+            messagebox.showerror("Error", "Device not connected")
+            return
+        if not self.channel_edits:
+            messagebox.showinfo("Apply All", "No channel edits staged")
+            return
+        self.apply_channels_button.configure(state='disabled')
+        self.update_output(f"Writing {len(self.channel_edits)} channel edit(s) in one transaction...")
+        # The read-back waits on the radio, so off the Tk thread
+        self.run_async(self.core.run_blocking(self.chat_app.apply_channel_edits, list(self.channel_edits)),
+                       on_done=self.on_channels_applied, on_error=self.on_channels_failed)
+
+    def on_channels_applied(self, result):
+        self.apply_channels_button.configure(state='normal')
+        self.channel_edits = []
+        self.get_channels()
+        self.show_channel_edits()
+        if result["verified"] is False:
+            messagebox.showerror("Error", f"Channels {result['mismatches']} didn't read back as written")
+        elif result["written"]:
+            self.update_output(f"Channels {result['written']} written and verified.")
+            messagebox.showinfo("Success", f"Channels {result['written']} written in one transaction")
+        else:
+            self.update_output("Channel edits changed nothing.")
+
+    def on_channels_failed(self, error):
+        self.apply_channels_button.configure(state='normal')
+        messagebox.showerror("Error", f"Failed to apply channel edits: {str(error)}")
     
     def trace_route(self):
         if not self.chat_app:
@@ -499,7 +859,17 @@ class MeshtasticTkinterApp:
             messagebox.showerror("Error", "Invalid hop limit")
             return
 
-        self.chat_app.sendTraceRoute(dest=dest_id, hopLimit=hop_limit)
+        # The trace takes seconds to minutes; it is awaited on the core's loop, not the Tk thread
+        self.update_output(f"Tracing route to {dest_id}...")
+        self.run_async(self.core.traceroute(dest_id, hop_limit),
+                       on_done=lambda route: self.update_output(f"Route traced: {route['text']}"),
+                       on_error=lambda e: self.on_trace_route_failed(dest_id, e))
+
+    def on_trace_route_failed(self, dest_id, error):
+        if isinstance(error, TimeoutError):
+            self.update_output(f"No trace route response from {dest_id}")
+        else:
+            messagebox.showerror("Error", f"Failed to trace route: {str(error)}")
             
     def open_tunnel_client(self):
         if not self.chat_app:
@@ -535,6 +905,9 @@ class MeshtasticTkinterApp:
         send_button = tk.Button(tunnel_client_window, text="Send Packet", command=send_packet)
         send_button.pack(padx=10, pady=10)
 
+        queue_label = tk.Label(tunnel_client_window, justify="left")
+        queue_label.pack(padx=10, pady=10)
+
         def on_close_tunnel_client():
             self.chat_app.close_tunnel()
             tunnel_client_window.destroy()
@@ -542,6 +915,7 @@ class MeshtasticTkinterApp:
         tunnel_client_window.protocol("WM_DELETE_WINDOW", on_close_tunnel_client)
 
         self.chat_app.start_tunnel_client()
+        self.refresh_tunnel_queue_stats(tunnel_client_window, queue_label)
 
     def open_tunnel_gateway(self):
         if not self.chat_app:
@@ -557,12 +931,29 @@ class MeshtasticTkinterApp:
             message = "Tunnel Gateway Setup\nDevice IP Address: Not available"
 
         tk.Label(tunnel_gateway_window, text=message).pack(padx=10, pady=10)
+        queue_label = tk.Label(tunnel_gateway_window, justify="left")
+        queue_label.pack(padx=10, pady=10)
         self.chat_app.start_tunnel_gateway()
+        self.refresh_tunnel_queue_stats(tunnel_gateway_window, queue_label)
+
+    def refresh_tunnel_queue_stats(self, window, label):
+        if not window.winfo_exists():
+            return
+        stats = self.chat_app.tunnel_queue_stats() if self.chat_app else None
+        if stats:
+            label.configure(text=(
+                f"Uplink queue: {stats['depth']} packets ({stats['backlog_bytes']} bytes) in {stats['flows']} flows\n"
+                f"Sojourn: last {stats['last_sojourn']:.2f}s, avg {stats['avg_sojourn']:.2f}s, max {stats['max_sojourn']:.2f}s\n"
+                f"Dropped: {stats['overflow_drops']} overflow, {stats['codel_drops']} delay, {stats['no_route_drops']} no route"
+            ))
+        window.after(1000, self.refresh_tunnel_queue_stats, window, label)
 
     def open_browser(self):
         if not self.chat_app:
             messagebox.showerror("Error", "Device not connected")
             return
+        import webview  # pywebview loads its GUI backends on import, so only pay for it here
+
         # Open a new window with a browser
         browser_window = tk.Toplevel(self.master)
         browser_window.title("Browser")
@@ -573,6 +964,73 @@ class MeshtasticTkinterApp:
         # Start the webview window
         webview.start()
         
+    def run_async(self, coroutine, on_done=None, on_error=None):
+        """Run coroutine on the core's event loop; on_done(result) or on_error(exception) then runs on the Tk thread."""
+        def done(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if on_done:
+                    self.post_ui(on_done, future.result())
+            elif on_error:
+                self.post_ui(on_error, error)
+            else:
+                self.post_output(f"Failed: {error}", "ERROR")
+
+        future = self.core.submit(coroutine)
+        future.add_done_callback(done)
+        return future
+
+    def post_ui(self, function, *args):
+        """Run function(*args) on the Tk thread; safe to call from any thread."""
+        self.ui_queue.put((time.perf_counter(), function, args))
+
+    def post_output(self, message, message_type="INFO"):
+        self.post_ui(self.update_output, message, message_type)
+
+    def drain_ui_queue(self):
+        deadline = time.perf_counter() + 0.05  # Keep the GUI responsive under a flood of updates
+        while time.perf_counter() < deadline:
+            try:
+                queued_at, function, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.m_ui_latency.observe(time.perf_counter() - queued_at)
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"UI update failed: {e}")
+        self.master.after(50, self.drain_ui_queue)
+
+    def open_stats(self):
+        stats_window = tk.Toplevel(self.master)
+        stats_window.title("Statistics")
+        stats_text = tk.Text(stats_window, height=30, width=100, state='disabled')
+        stats_text.pack(fill="both", expand=True, padx=10, pady=10)
+        if METRICS_PORT:
+            tk.Label(stats_window, text=f"Prometheus: http://127.0.0.1:{METRICS_PORT}/metrics  JSON: /metrics.json").pack(padx=10, pady=5)
+        self.refresh_stats(stats_window, stats_text)
+
+    def refresh_stats(self, window, text):
+        if not window.winfo_exists():
+            return
+        lines = []
+        for name, metric in self.metrics.to_dict().items():
+            for labels, value in metric["values"].items():
+                if isinstance(value, dict):
+                    if not value.get("count"):
+                        continue
+                    value = ", ".join(f"{k} {v:.3f}" if isinstance(v, float) else f"{k} {v}" for k, v in value.items())
+                elif isinstance(value, float):
+                    value = f"{value:.3f}"
+                lines.append(f"{name}{'' if labels == 'all' else ' [' + labels + ']'}: {value}")
+        text.configure(state='normal')
+        text.delete(1.0, tk.END)
+        text.insert(tk.END, "\n".join(lines))
+        text.configure(state='disabled')
+        window.after(1000, self.refresh_stats, window, text)
+
     def update_output(self, message, message_type="INFO"):
         self.output_text.configure(state='normal')
         self.output_text.insert(tk.END, message + "\n", message_type)
@@ -585,14 +1043,55 @@ class MeshtasticTkinterApp:
         # Print to the terminal as well
         #print(message)
         
-    def update_history(self, message):
+    def update_history(self, message, outbox_entry=None):
         self.history_text.configure(state='normal')
-        self.history_text.insert(tk.END, message + "\n")
+        self.history_text.insert(tk.END, message)
+        if outbox_entry:
+            # The delivery state is tagged so update_outbox_entry can rewrite it in place
+            self.history_text.insert(tk.END, " " + self.outbox_state_text(outbox_entry), f"outbox_{outbox_entry['id']}")
+        self.history_text.insert(tk.END, "\n")
         self.history_text.configure(state='disabled')
         self.history_text.yview(tk.END)
+
+    def outbox_state_text(self, entry):
+        if entry['state'] == 'queued' and entry['attempts']:
+            return f"[waiting for {entry['destination']}]"
+        if entry['state'] == 'sending' and entry.get('progress'):
+            return f"[sending {entry['progress'][0]}/{entry['progress'][1]}]"
+        if entry['state'] == 'failed':
+            return f"[failed: {entry.get('error', 'not delivered')}]"
+        if entry['state'] == 'delivered' and entry.get('verified'):
+            return "[delivered, verified]"  # The receiver's SHA-256 of the whole file matched
+        return f"[{entry['state']}]"
+
+    def update_outbox_entry(self, entry):
+        tag = f"outbox_{entry['id']}"
+        ranges = self.history_text.tag_ranges(tag)
+        if ranges:
+            self.history_text.configure(state='normal')
+            self.history_text.delete(ranges[0], ranges[1])
+            self.history_text.insert(ranges[0], self.outbox_state_text(entry), tag)
+            self.history_text.configure(state='disabled')
+        if entry['kind'] in ('file', 'bundle') and entry.get('progress'):
+            current, total = entry['progress']
+            self.progress_bar.configure(maximum=total, value=current)
+        if entry['state'] in ('delivered', 'failed'):
+            self.update_output(f"Outbox: {entry['kind']} {entry['id']} to {entry['destination']} "
+                               f"{self.outbox_state_text(entry)[1:-1]}",
+                               "SUCCESS" if entry['state'] == 'delivered' else "WARNING")
     
     def run(self):
         self.master.mainloop()
+        self.save_node_cache()
+        self.core.close()
+        if self.chat_app:
+            self.chat_app.close()
+
+    def save_node_cache(self):
+        self.node_cache.stop()
+        if self.chat_app:
+            self.node_cache.update_all(self.chat_app.interface.nodesByNum)
+        self.node_cache.save()
         
     def right_click_popup(self, event):
         try: 
@@ -611,6 +1110,10 @@ class MeshtasticTkinterApp:
         print(selected_item)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Worker processes in the PyInstaller build
     root = tk.Tk()
     app = MeshtasticTkinterApp(root)
+    if os.environ.get("MESHTASTIC_STARTUP_PROBE"):
+        # Used by benchmarks/bench_startup.py: report once the window is up, then quit
+        root.after_idle(lambda: (print("STARTUP_PROBE window_ready", flush=True), root.destroy()))
     app.run()
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('Class\\\\meshtastic_chat_app.py', 'Class'), ('datafile.txt', '.')],
-    hiddenimports=['webview', 'timeago', 'timeago.locales.en'],
+    hiddenimports=['webview', 'timeago', 'timeago.locales.en', 'Class.meshtastic_chat_app'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],